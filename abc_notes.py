@@ -0,0 +1,244 @@
+import hashlib
+import re
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from abc_parser import normalize_key, normalize_meter
+
+# Melodic fingerprints for "find tunes like this one". A tune's incipit
+# (its first INCIPIT_NOTES notes) becomes a sequence of semitone
+# intervals, which does not change when the tune is transposed. Runs of
+# SHINGLE_SIZE intervals are the shingles; a MinHash signature of the
+# shingle set estimates how similar two incipits are, and its LSH bands
+# put similar tunes in the same buckets so only those need comparing.
+#
+# The same tokenizer turns a whole body into note events (pitch,
+# duration, bar number) packed as EVENT_DTYPE arrays, which music_stats
+# analyses across the corpus with numpy.
+
+INCIPIT_NOTES = 32
+SHINGLE_SIZE = 4
+LSH_BANDS = 8
+LSH_ROWS = 4
+SIGNATURE_SIZE = LSH_BANDS * LSH_ROWS
+
+# semitones above C for each note letter
+LETTER_SEMITONES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+SHARP_ORDER = "FCGDAEB"
+FLAT_ORDER = "BEADGCF"
+
+# fifths to add to the major key with the same tonic for each mode
+MODE_FIFTHS = {"maj": 0, "lyd": 1, "mix": -1, "dor": -2, "min": -3, "phr": -4, "loc": -5}
+
+INFO_LINE = re.compile(r"^[A-Za-z+]:")
+# chord symbols/annotations, decorations, grace notes and inline fields
+NOT_NOTES = re.compile(r'"[^"]*"|![^!]*!|\+[^+\s]*\+|\{[^}]*\}|\[[A-Za-z]:[^\]]*\]')
+NOTE = re.compile(r"(\^\^|\^|__|_|=)?([A-Ga-g])([',]*)(\d*)(/*)(\d*)|(\|+)")
+UNIT_LENGTH = re.compile(r"^L:\s*(\d+)\s*/\s*(\d+)", re.M)
+ACCIDENTALS = {"^^": 2, "^": 1, "__": -2, "_": -1, "=": 0}
+
+# MinHash: h(x) = (a * x + b) mod p with p the Mersenne prime 2^31 - 1
+MINHASH_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240601)
+MINHASH_A = _rng.integers(1, MINHASH_PRIME, SIGNATURE_SIZE, dtype=np.uint64)
+MINHASH_B = _rng.integers(0, MINHASH_PRIME, SIGNATURE_SIZE, dtype=np.uint64)
+
+# note events: MIDI pitch, duration in ticks and bar number, 5 bytes a note
+TICKS_PER_WHOLE = 384
+EVENT_DTYPE = np.dtype([("pitch", "u1"), ("duration", "<u2"), ("bar", "<u2")])
+
+
+def key_signature(key: str) -> dict:
+    """Return {letter: semitone shift} for the sharps or flats of a K: field."""
+    tonic, mode = normalize_key(key or "")
+    if not tonic:
+        return {}
+    pitch_class = LETTER_SEMITONES[tonic[0]] + {"#": 1, "b": -1}.get(tonic[1:], 0)
+    fifths = (pitch_class * 7) % 12
+    if fifths > 6:
+        fifths -= 12
+    fifths += MODE_FIFTHS.get(mode, 0)
+    if fifths >= 0:
+        return {letter: 1 for letter in SHARP_ORDER[:fifths]}
+    return {letter: -1 for letter in FLAT_ORDER[:-fifths]}
+
+
+@lru_cache(maxsize=None)
+def natural_pitch(letter: str, octave: str) -> int:
+    """Pitch of a note letter with its octave marks, before any accidental."""
+    pitch = 60 + LETTER_SEMITONES[letter.upper()] + (12 if letter.islower() else 0)
+    return pitch + 12 * octave.count("'") - 12 * octave.count(",")
+
+
+@lru_cache(maxsize=None)
+def note_length(number: str, slashes: str, divisor: str) -> float:
+    """Length of a note as a multiple of the unit note length: 3, /, //, 3/2, /4..."""
+    length = int(number) if number else 1
+    if slashes:
+        length /= int(divisor) if divisor else 2 ** len(slashes)
+    return length
+
+
+def iter_notes(body: str, key: str = "") -> Iterator[Tuple[int, float, int]]:
+    """
+    Yield (pitch, length, bar) for the notes of an ABC body, in order:
+    MIDI-style pitch, length as a multiple of the unit note length, and
+    the number of bar lines seen before the note. Info fields, comments,
+    chord symbols, decorations and grace notes are skipped; the key
+    signature applies unless a note carries its own accidental, which
+    then lasts until the next bar line. When the body has bar lines,
+    lines without any are skipped too: they are text wrapped over from
+    an info field (e.g. the end of a long F: URL). Broken rhythms (>, <)
+    and tuplets are not applied to the lengths.
+    """
+    # the key signature by the pitch class of the natural note it alters
+    signature = {LETTER_SEMITONES[letter]: shift for letter, shift in key_signature(key).items()}
+    lines = [line.split("%", 1)[0].strip() for line in (body or "").split("\n")]
+    lines = [line for line in lines if line and not INFO_LINE.match(line)]
+    if any("|" in line for line in lines):
+        lines = [line for line in lines if "|" in line]
+    bar = 0
+    for line in lines:
+        bar_accidentals = {}
+        for accidental, letter, octave, number, slashes, divisor, bar_line in NOTE.findall(NOT_NOTES.sub(" ", line)):
+            if bar_line:
+                bar += 1
+                bar_accidentals = {}
+                continue
+            pitch = natural_pitch(letter, octave)
+            if accidental:
+                bar_accidentals[pitch] = ACCIDENTALS[accidental]
+            yield pitch + bar_accidentals.get(pitch, signature.get(pitch % 12, 0)), \
+                note_length(number, slashes, divisor), bar
+
+
+def body_pitches(body: str, key: str = "", limit: Optional[int] = None) -> List[int]:
+    """MIDI-style pitch numbers of the notes in an ABC body, in order (see iter_notes)."""
+    pitches: List[int] = []
+    for pitch, _length, _bar in iter_notes(body, key):
+        pitches.append(pitch)
+        if limit is not None and len(pitches) >= limit:
+            break
+    return pitches
+
+
+def unit_length(body: str, meter: str = "") -> float:
+    """
+    The unit note length as a fraction of a whole note: the body's L:
+    field, else 1/16 for meters below 3/4 and 1/8 otherwise.
+    """
+    match = UNIT_LENGTH.search(body or "")
+    if match and int(match.group(2)):
+        return int(match.group(1)) / int(match.group(2))
+    meter_num, meter_den = normalize_meter(meter or "")
+    if meter_num and meter_den and meter_num / meter_den < 0.75:
+        return 1 / 16
+    return 1 / 8
+
+
+def note_events(body: str, key: str = "", meter: str = "") -> np.ndarray:
+    """Every note of a body as an EVENT_DTYPE array (duration in TICKS_PER_WHOLE ticks)."""
+    notes = list(iter_notes(body, key))
+    events = np.empty(len(notes), dtype=EVENT_DTYPE)
+    if notes:
+        pitches, lengths, bars = zip(*notes)
+        ticks = unit_length(body, meter) * TICKS_PER_WHOLE
+        events["pitch"] = np.clip(pitches, 0, 127)
+        events["duration"] = np.clip(np.rint(np.asarray(lengths) * ticks), 0, 65535)
+        events["bar"] = np.minimum(bars, 65535)
+    return events
+
+
+def events_to_bytes(events: np.ndarray) -> bytes:
+    return np.ascontiguousarray(events, dtype=EVENT_DTYPE).tobytes()
+
+
+def events_from_bytes(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=EVENT_DTYPE)
+
+
+def incipit_intervals(body: str, key: str = "") -> List[int]:
+    """Semitone steps between the first INCIPIT_NOTES notes (transposition invariant)."""
+    return pitch_intervals(body_pitches(body, key, INCIPIT_NOTES))
+
+
+def pitch_intervals(pitches: Sequence[int]) -> List[int]:
+    return [b - a for a, b in zip(pitches, pitches[1:])]
+
+
+def interval_shingles(intervals: Sequence[int]) -> List[int]:
+    """
+    Every run of SHINGLE_SIZE consecutive intervals packed into one int
+    (7 bits per interval, clamped to +-63 semitones).
+    """
+    packed = [min(max(step, -63), 63) + 64 for step in intervals]
+    shingles = set()
+    for start in range(len(packed) - SHINGLE_SIZE + 1):
+        value = 0
+        for step in packed[start:start + SHINGLE_SIZE]:
+            value = (value << 7) | step
+        shingles.add(value)
+    return sorted(shingles)
+
+
+def minhash_signatures(shingle_sets: Iterable[Sequence[int]]) -> np.ndarray:
+    """
+    MinHash signatures (one row of SIGNATURE_SIZE uint32 values per
+    non-empty shingle set), computed for all sets in one numpy pass.
+    """
+    shingle_sets = list(shingle_sets)
+    if not shingle_sets:
+        return np.empty((0, SIGNATURE_SIZE), dtype=np.uint32)
+    lengths = np.array([len(shingles) for shingles in shingle_sets])
+    values = np.fromiter((value for shingles in shingle_sets for value in shingles),
+                         dtype=np.uint64, count=int(lengths.sum()))
+    hashed = (values[:, None] * MINHASH_A + MINHASH_B) % MINHASH_PRIME
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return np.minimum.reduceat(hashed, starts, axis=0).astype(np.uint32)
+
+
+def add_melodies(tunes):
+    """
+    Set the events and signature of each tune: its note events as bytes
+    (None without notes) and its incipit's MinHash signature as bytes
+    (None when the incipit is too short to shingle). The parser workers
+    call this (abc_parser.parse_abc_file), so both are computed during
+    the parallel parse rather than in a pass over the stored bodies.
+    """
+    indexed, shingle_sets = [], []
+    for tune in tunes:
+        events = note_events(tune.body, tune.K, tune.M)
+        tune.events = events_to_bytes(events) if len(events) else None
+        tune.signature = None
+        shingles = interval_shingles(pitch_intervals(events["pitch"][:INCIPIT_NOTES].tolist()))
+        if shingles:
+            indexed.append(tune)
+            shingle_sets.append(shingles)
+    for tune, signature in zip(indexed, minhash_signatures(shingle_sets)):
+        tune.signature = signature_to_bytes(signature)
+
+
+def lsh_buckets(signature: Sequence[int]) -> List[int]:
+    """One signed 64-bit bucket id per LSH band of a signature."""
+    values = np.asarray(signature, dtype="<u4")
+    buckets = []
+    for band in range(LSH_BANDS):
+        chunk = values[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()
+        digest = hashlib.blake2b(bytes([band]) + chunk, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "little", signed=True))
+    return buckets
+
+
+def signature_to_bytes(signature) -> bytes:
+    return np.asarray(signature, dtype="<u4").tobytes()
+
+
+def signature_from_bytes(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype="<u4")
+
+
+def estimated_similarity(first, second) -> float:
+    """Estimated Jaccard similarity of two incipits from their signatures."""
+    return float(np.mean(np.asarray(first) == np.asarray(second)))
@@ -1,90 +1,532 @@
+import hashlib
+import mmap
 import os
-from typing import List, Dict
-from configurations import BOOKS_DIR
+import re
+import sys
+import time
+from collections import deque
+from functools import lru_cache
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import configurations
+import perf
 
-def parse_abc_file(file_path: str) -> List[Dict]:
+# tonic, accidental and an optional mode word; a word directly followed by
+# '=' is a modifier (clef=bass, transpose=-2, octave=1), not a key or mode
+KEY_PATTERN = re.compile(r"^\s*([A-Ga-g])([#b]?)(?![A-Za-z]*=)(?:\s*([A-Za-z]+)(?![A-Za-z=]))?")
+
+# first three letters of a K: mode word -> canonical mode
+MODE_NAMES = {
+    "": "maj", "maj": "maj", "ion": "maj",
+    "m": "min", "min": "min", "aeo": "min",
+    "mix": "mix", "dor": "dor", "phr": "phr", "lyd": "lyd", "loc": "loc",
+}
+
+# clef names that may follow the key without "clef=", as in K:C bass
+CLEF_NAMES = {"treble", "bass", "alto", "tenor", "baritone", "perc", "none"}
+
+# ABC text mnemonics for accented letters that show up in R: fields
+ABC_ACCENTS = {
+    '\\"a': "ä", '\\"o': "ö", '\\"u': "ü", "\\'e": "é", "\\'a": "á",
+    "\\`e": "è", "\\`a": "à", "{\\aa}": "å", "\\aa": "å", "\\ae": "æ",
+    "\\oe": "œ", "\\ss": "ß", "\\~n": "ñ", "\\cc": "ç",
+}
+
+
+@lru_cache(maxsize=4096)
+def normalize_key(key: str) -> Tuple[str, str]:
     """
-    Read one .abc file and extract all tunes inside it.
+    Split a K: field into (tonic, mode), e.g. 'Ador' -> ('A', 'dor'),
+    'F#m' -> ('F#', 'min'), 'Dm =b' -> ('D', 'min'), 'G' -> ('G', 'maj').
+    Trailing clefs, modifiers and comments are ignored: 'G clef=bass',
+    'C treble' and 'Am %comment' -> ('G', 'maj'), ('C', 'maj'), ('A', 'min').
+    Returns ('', '') for keys that name no tonic (e.g. 'none', 'HP').
+    """
+    match = KEY_PATTERN.match(key or "")
+    if not match:
+        return "", ""
+    letter, accidental, mode_word = match.groups()
+    mode_word = mode_word or ""
+    if mode_word.lower() in CLEF_NAMES:
+        mode_word = ""
+    mode = MODE_NAMES.get(mode_word[:3].lower(), "")
+    if not mode and mode_word:
+        return "", ""
+    return letter.upper() + accidental, mode
+
+
+@lru_cache(maxsize=4096)
+def normalize_meter(meter: str) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Turn an M: field into (numerator, denominator).
+    'C' is 4/4, 'C|' is 2/2 and additive meters such as '2+2+3/16'
+    are summed (7/16). Returns (None, None) when there is no meter.
+    """
+    text = (meter or "").replace(" ", "")
+    if text == "C":
+        return 4, 4
+    if text == "C|":
+        return 2, 2
+    top, sep, bottom = text.partition("/")
+    if not sep:
+        return None, None
+    try:
+        numerator = sum(int(part) for part in top.strip("()").split("+"))
+        return numerator, int(bottom)
+    except ValueError:
+        return None, None
+
+
+@lru_cache(maxsize=4096)
+def normalize_rhythm(rhythm: str) -> str:
+    """Lower-case an R: field, decode ABC accents and collapse spaces."""
+    text = rhythm or ""
+    for mnemonic, letter in ABC_ACCENTS.items():
+        text = text.replace(mnemonic, letter)
+    return " ".join(text.lower().split())
+
+
+# fields of a parsed tune, in the column order used by the tunes table
+TUNE_FIELDS = (
+    "book", "filename", "X", "T", "R", "M", "K", "body",
+    "tonic", "mode", "meter_num", "meter_den", "rhythm", "body_hash",
+)
+
+# header values that repeat across many tunes and are worth sharing
+INTERNED_FIELDS = ("book", "filename", "X", "R", "M", "K", "tonic", "mode", "rhythm")
+
+# melodic index data the parser workers add to a tune (see
+# abc_notes.add_melodies); carried with the tune but not tunes columns
+MELODY_FIELDS = ("signature", "events")
+
+
+class Tune:
+    """
+    One parsed tune. Uses __slots__ instead of a per-tune dict, and the
+    repeated header values (book, filename, K, M, R, ...) are interned so
+    every tune in a corpus shares one copy of each.
+
+    Existing code that treats tunes as dicts keeps working: tune["T"],
+    tune.get("K", ""), tune["rhythm"] = ..., "body" in tune and
+    dict(tune.items()) all behave as before.
+    """
+
+    __slots__ = TUNE_FIELDS + MELODY_FIELDS
+
+    def __init__(self, book: str, filename: str, X: str = "", T: str = "", R: str = "",
+                 M: str = "", K: str = "", body: str = "", tonic: str = "", mode: str = "",
+                 meter_num: Optional[int] = None, meter_den: Optional[int] = None, rhythm: str = "",
+                 body_hash: str = "", signature: Optional[bytes] = None, events: Optional[bytes] = None):
+        intern = sys.intern
+        self.book = intern(book)
+        self.filename = intern(filename)
+        self.X = intern(X)
+        self.T = T
+        self.R = intern(R)
+        self.M = intern(M)
+        self.K = intern(K)
+        self.body = body
+        self.tonic = intern(tonic)
+        self.mode = intern(mode)
+        self.meter_num = meter_num
+        self.meter_den = meter_den
+        self.rhythm = intern(rhythm)
+        self.body_hash = body_hash
+        self.signature = signature
+        self.events = events
+
+    def __reduce__(self):
+        # rebuilding through __init__ re-interns the headers in the
+        # receiving process when tunes come back from the parser pool
+        return Tune, self.as_row() + tuple(getattr(self, name) for name in MELODY_FIELDS)
+
+    def as_row(self) -> tuple:
+        """All fields in TUNE_FIELDS order (the tunes table column order)."""
+        return tuple(getattr(self, name) for name in TUNE_FIELDS)
+
+    def __repr__(self):
+        return f"Tune(book={self.book!r}, filename={self.filename!r}, X={self.X!r}, T={self.T!r})"
+
+    def __eq__(self, other):
+        if isinstance(other, Tune):
+            return self.as_row() == other.as_row()
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+        return NotImplemented
+
+    # dict compatibility for callers written against the old dict tunes
+
+    def __getitem__(self, name: str):
+        if name not in TUNE_FIELDS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __setitem__(self, name: str, value):
+        if name not in TUNE_FIELDS:
+            raise KeyError(name)
+        if name in INTERNED_FIELDS and isinstance(value, str):
+            value = sys.intern(value)
+        setattr(self, name, value)
+
+    def __contains__(self, name) -> bool:
+        return name in TUNE_FIELDS
+
+    def get(self, name: str, default=None):
+        if name not in TUNE_FIELDS:
+            return default
+        return getattr(self, name)
+
+    def keys(self):
+        return TUNE_FIELDS
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in TUNE_FIELDS]
+
+
+def canonical_body(body: str) -> str:
+    """
+    The music of a body with % comments, blank lines and all spacing
+    removed, so copies that differ only in layout compare equal.
+    """
+    lines = (line.split("%", 1)[0] for line in (body or "").split("\n"))
+    return "\n".join(filter(None, ("".join(line.split()) for line in lines)))
+
+
+def tune_hash(body: str, key: str) -> str:
+    """
+    SHA-1 identifying a tune by its canonical body and normalized key.
+    The same tune copied into several books or files gets the same hash.
+    """
+    tonic, mode = normalize_key(key)
+    key_part = f"{tonic} {mode}" if tonic else " ".join((key or "").split())
+    return hashlib.sha1(f"{key_part}\n{canonical_body(body)}".encode("utf-8")).hexdigest()
+
+
+def new_tune(book: str, filename: str, X: str, T: str, R: str, M: str, K: str, body: str) -> Tune:
+    """Build a Tune from its header fields and body, filling in the facet fields and hash."""
+    tonic, mode = normalize_key(K)
+    meter_num, meter_den = normalize_meter(M)
+    return Tune(book, filename, X, T, R, M, K, body,
+                tonic, mode, meter_num, meter_den, normalize_rhythm(R), tune_hash(body, K))
+
+
+def add_normalized_fields(tune: Dict) -> Dict:
+    """Add the tonic/mode/meter_num/meter_den/rhythm facet fields and body_hash to a tune."""
+    tune["tonic"], tune["mode"] = normalize_key(tune["K"])
+    tune["meter_num"], tune["meter_den"] = normalize_meter(tune["M"])
+    tune["rhythm"] = normalize_rhythm(tune["R"])
+    tune["body_hash"] = tune_hash(tune["body"], tune["K"])
+    return tune
+
+
+def iter_abc_file(file_path: str) -> Iterator[Tune]:
+    """
+    Read one .abc file and yield its tunes one at a time as Tune records.
 
     Each tune:
       - starts with 'X:'
       - optionally has T:, R:, M:, K:
       - then has a body (music notation)
-    Returns a list of dictionaries, one per tune.
+    Only the tune currently being read is held in memory, and its body
+    lines are joined into one string once the tune is complete.
     """
-    tunes = []
-    current_tune = None
-    body_lines: List[str] = []
-
     book_name = os.path.basename(os.path.dirname(file_path))
     filename = os.path.basename(file_path)
 
+    x = None
+    title = rhythm = meter = key = ""
+    body_lines: List[str] = []
+
     with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
         for raw_line in f:
             line = raw_line.strip()
 
             if line.startswith("X:"):
                 # save previous tune if exists
-                if current_tune is not None:
-                    current_tune["body"] = "\n".join(body_lines).strip()
-                    tunes.append(current_tune)
-
-                current_tune = {
-                    "book": book_name,
-                    "filename": filename,
-                    "X": line[2:].strip(),
-                    "T": "",
-                    "R": "",
-                    "M": "",
-                    "K": "",
-                    "body": ""
-                }
+                if x is not None:
+                    body = "\n".join(body_lines).strip()
+                    yield new_tune(book_name, filename, x, title, rhythm, meter, key, body)
+
+                x = line[2:].strip()
+                title = rhythm = meter = key = ""
                 body_lines = []
-            elif current_tune is not None:
+            elif x is not None:
                 if line.startswith("T:"):
-                    title = line[2:].strip()
-                    if current_tune["T"]:
-                        current_tune["T"] += " / " + title
+                    if title:
+                        title += " / " + line[2:].strip()
                     else:
-                        current_tune["T"] = title
+                        title = line[2:].strip()
                 elif line.startswith("R:"):
-                    current_tune["R"] = line[2:].strip()
+                    rhythm = line[2:].strip()
                 elif line.startswith("M:"):
-                    current_tune["M"] = line[2:].strip()
+                    meter = line[2:].strip()
                 elif line.startswith("K:"):
-                    current_tune["K"] = line[2:].strip()
+                    key = line[2:].strip()
                 else:
                     body_lines.append(line)
 
-    if current_tune is not None:
-        current_tune["body"] = "\n".join(body_lines).strip()
-        tunes.append(current_tune)
+    if x is not None:
+        body = "\n".join(body_lines).strip()
+        yield new_tune(book_name, filename, x, title, rhythm, meter, key, body)
+
+
+# a header line: optional ASCII blanks, then X:/T:/R:/M:/K:. Lines end in \n
+# or \r\n; a value's trailing \r is stripped with the rest of its blanks and
+# decode_body() strips it from body lines. The patterns start with a literal
+# \n rather than ^ with re.M so the regex engine can skip straight to line
+# breaks; the first line is checked apart.
+HEADER_START = rb"[ \t\x0b\x0c]*([XTRMK]):([^\n]*)"
+HEADER_LINE = re.compile(rb"\n" + HEADER_START)
+FIRST_HEADER_LINE = re.compile(HEADER_START)
+
+# line starts that the byte scanner cannot classify the way the text parser
+# does: non-ASCII bytes or \x1c-\x1f (which str.strip() may remove or
+# errors="ignore" may drop) before or right after a header letter
+UNSAFE_START = rb"[ \t\x0b\x0c]*(?:[\x1c-\x1f\x80-\xff]|[XTRMK][\x80-\xff])"
+UNSAFE_LINE = re.compile(rb"\n" + UNSAFE_START)
+FIRST_UNSAFE_LINE = re.compile(UNSAFE_START)
+
+# a \r that is a line break on its own (old Mac files), which only the
+# universal-newline copy of the file handles
+LONE_CR = re.compile(rb"\r(?!\n)")
+
+def decode_body(chunks: List[memoryview]) -> str:
+    """Decode the body line chunks of one tune exactly as iter_abc_file joins them."""
+    text = b"".join(chunks).decode("utf-8", errors="ignore")
+    return "\n".join([line.strip() for line in text.split("\n")]).strip()
+
+
+def scan_abc_file(file_path: str) -> Iterator[Tune]:
+    """
+    Byte-level version of iter_abc_file() for large files. The file is
+    memory-mapped, X:/T:/R:/M:/K: lines are found with one regex over the
+    bytes and the body of each tune is kept as memoryview slices, which
+    are decoded only when the tune is emitted. Yields the same Tune
+    records as iter_abc_file(); files with lines it cannot classify at
+    the byte level are handed to iter_abc_file() instead.
+    """
+    book_name = os.path.basename(os.path.dirname(file_path))
+    filename = os.path.basename(file_path)
+
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = mapped
+            if LONE_CR.search(mapped):
+                # universal newlines, as text mode reads them; \r\n needs
+                # no copy since the scanner strips the \r from each line
+                data = mapped[:].replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+            if FIRST_UNSAFE_LINE.match(data) or UNSAFE_LINE.search(data):
+                yield from iter_abc_file(file_path)
+                return
+
+            # each body chunk runs from the end of one header line up to the
+            # \n before the next, so the chunks join back into whole lines
+            first = FIRST_HEADER_LINE.match(data)
+            matches = HEADER_LINE.finditer(data)
+            if first:
+                matches = chain((first,), matches)
+            view = memoryview(data)
+            chunks: List[memoryview] = []
+            try:
+                x = None
+                title = rhythm = meter = key = ""
+                position = 0
+                for match in matches:
+                    letter, value = match.groups()
+                    if x is not None:
+                        chunks.append(view[position:match.start()])
+                    position = match.end()
+                    value = value.decode("utf-8", errors="ignore").strip()
+                    if letter == b"X":
+                        if x is not None:
+                            yield new_tune(book_name, filename, x, title, rhythm, meter, key,
+                                           decode_body(chunks))
+                        x = value
+                        title = rhythm = meter = key = ""
+                        chunks = []
+                    elif x is None:
+                        continue
+                    elif letter == b"T":
+                        title = title + " / " + value if title else value
+                    elif letter == b"R":
+                        rhythm = value
+                    elif letter == b"M":
+                        meter = value
+                    else:
+                        key = value
+                if x is not None:
+                    chunks.append(view[position:])
+                    yield new_tune(book_name, filename, x, title, rhythm, meter, key,
+                                   decode_body(chunks))
+            finally:
+                # drop the slices before the mapping is closed
+                chunks = []
+                view.release()
+
 
+def iter_file_tunes(file_path: str) -> Iterator[Tune]:
+    """Yield the tunes of one file with the configured reader (mmap scanner or text)."""
+    if configurations.ABC_MMAP_SCANNER:
+        return scan_abc_file(file_path)
+    return iter_abc_file(file_path)
+
+
+@perf.timed("parse.parse_abc_file")
+def parse_abc_file(file_path: str, with_melody: bool = False) -> List[Tune]:
+    """
+    Read one .abc file and extract all tunes inside it.
+    Returns a list of Tune records, one per tune. with_melody=True also
+    fills in their melodic index data (abc_notes.add_melodies).
+    """
+    tunes = list(iter_file_tunes(file_path))
+    if with_melody:
+        import abc_notes  # numpy is only loaded when tunes are indexed
+        abc_notes.add_melodies(tunes)
     return tunes
+
   
-  
-def load_all_tunes() -> List[Dict]:
+def find_abc_files(books_dir: Optional[str] = None) -> List[Tuple[str, str, str]]:
+    """
+    Return (book, filename, path) for every .abc file under the books
+    directory, sorted by book and filename so runs are repeatable.
+    """
+    books_dir = books_dir or configurations.BOOKS_DIR
+    found: List[Tuple[str, str, str]] = []
+    if not os.path.isdir(books_dir):
+        return found
+
+    for item in sorted(os.listdir(books_dir)):
+        item_path = os.path.join(books_dir, item)
+        if os.path.isdir(item_path) and item.isdigit():
+            for fname in sorted(os.listdir(item_path)):
+                if fname.lower().endswith(".abc"):
+                    found.append((item, fname, os.path.join(item_path, fname)))
+    return found
+
+
+@perf.timed("parse.load_all_tunes")
+def load_all_tunes() -> List[Tune]:
     """
     Walk through BOOKS_DIR, find all .abc files in each book folder,
     parse them, and return one big list of tunes.
     """
-    all_tunes: List[Dict] = []
+    all_tunes: List[Tune] = []
 
-    if not os.path.isdir(BOOKS_DIR):
-        print(f"Books directory not found: {BOOKS_DIR}")
+    if not os.path.isdir(configurations.BOOKS_DIR):
+        print(f"Books directory not found: {configurations.BOOKS_DIR}")
         return all_tunes
 
-    for item in os.listdir(BOOKS_DIR):
-        item_path = os.path.join(BOOKS_DIR, item)
-        if os.path.isdir(item_path) and item.isdigit():
-            print(f"Found book directory: {item}")
-            for fname in os.listdir(item_path):
-                if fname.lower().endswith(".abc"):
-                    file_path = os.path.join(item_path, fname)
-                    print(f"  Found ABC file: {fname}")
-                    tunes = parse_abc_file(file_path)
-                    print(f"    Parsed {len(tunes)} tunes from this file")
-                    all_tunes.extend(tunes)
+    current_book = None
+    for book, fname, file_path in find_abc_files():
+        if book != current_book:
+            print(f"Found book directory: {book}")
+            current_book = book
+        print(f"  Found ABC file: {fname}")
+        tunes = parse_abc_file(file_path)
+        print(f"    Parsed {len(tunes)} tunes from this file")
+        all_tunes.extend(tunes)
 
     print(f"\nTotal tunes parsed from all books: {len(all_tunes)}")
-    return all_tunes
\ No newline at end of file
+    return all_tunes
+
+
+def iter_all_tunes(files: Optional[Sequence[Tuple[str, str, str]]] = None) -> Iterator[Tune]:
+    """
+    Streaming version of load_all_tunes(): yield every tune under
+    BOOKS_DIR (or from files) without building a list of the corpus.
+    """
+    if files is None:
+        files = find_abc_files()
+    for _book, _fname, path in files:
+        yield from iter_file_tunes(path)
+
+
+def resolve_workers(workers: Optional[int] = None) -> int:
+    """Turn a worker setting (None/0 = automatic) into a process count."""
+    if workers is None:
+        workers = configurations.INGEST_WORKERS
+    if not workers or workers < 1:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def iter_parsed_files(files: Sequence[Tuple[str, str, str]], workers: Optional[int] = None,
+                      with_melody: bool = False) -> Iterator[Tuple[str, str, List[Tune]]]:
+    """
+    Parse (book, filename, path) entries and yield (book, filename, tunes)
+    in the same order as files. With more than one worker the files are
+    spread over a process pool; results still come back in order.
+    At most a few files per worker are in flight at once, so memory
+    does not grow with the number of files.
+    """
+    workers = min(resolve_workers(workers), max(len(files), 1))
+    if workers == 1:
+        for book, fname, path in files:
+            yield book, fname, parse_abc_file(path, with_melody)
+        return
+
+    max_pending = workers * 4
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for book, fname, path in files:
+            pending.append((book, fname, pool.submit(parse_abc_file, path, with_melody)))
+            if len(pending) >= max_pending:
+                done_book, done_fname, future = pending.popleft()
+                yield done_book, done_fname, future.result()
+        while pending:
+            done_book, done_fname, future = pending.popleft()
+            yield done_book, done_fname, future.result()
+
+
+def iter_tune_batches(files: Optional[Sequence[Tuple[str, str, str]]] = None,
+                      workers: Optional[int] = None,
+                      batch_size: Optional[int] = None,
+                      progress: Optional[Callable[[str, int, Optional[int]], None]] = None,
+                      with_melody: bool = False) -> Iterator[List[Tune]]:
+    """
+    Parse files (default: everything under BOOKS_DIR) and yield the tunes
+    in (book, filename) order as lists of at most batch_size tunes.
+    Prints a one-line summary when done instead of a line per file.
+    progress, if given, is called as progress("parse", files_done, total_files).
+    with_melody=True has the workers compute each tune's melodic index
+    data as well (see parse_abc_file).
+    """
+    if files is None:
+        files = find_abc_files()
+    batch_size = batch_size or configurations.INSERT_BATCH_SIZE
+    workers = resolve_workers(workers)
+
+    started = time.perf_counter()
+    total = 0
+    books = set()
+    batch: List[Tune] = []
+    for files_done, (book, _fname, tunes) in enumerate(iter_parsed_files(files, workers, with_melody), 1):
+        if progress is not None:
+            progress("parse", files_done, len(files))
+        books.add(book)
+        total += len(tunes)
+        batch.extend(tunes)
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+    if batch:
+        yield batch
+
+    elapsed = time.perf_counter() - started
+    perf.record("parse.all_files", elapsed)
+    perf.count("parse.tunes", total)
+    print(
+        f"Parsed {total} tunes from {len(files)} files in {len(books)} book(s) "
+        f"using {min(workers, max(len(files), 1))} worker(s) in {elapsed:.2f}s."
+    )
+
+
+def load_all_tunes_parallel(workers: Optional[int] = None) -> List[Tune]:
+    """Parallel, quiet version of load_all_tunes()."""
+    all_tunes: List[Tune] = []
+    for batch in iter_tune_batches(workers=workers):
+        all_tunes.extend(batch)
+    return all_tunes
@@ -0,0 +1 @@
+"""Performance benchmarks. Run from the project root, e.g. python -m benchmarks.bench_sqlite_bulk_load"""
@@ -0,0 +1,82 @@
+"""
+Compare parsing throughput (MB/s) of the line-by-line text parser with the
+memory-mapped byte scanner, on the bundled abc_books and on one big
+synthetic .abc file.
+
+    python -m benchmarks.bench_abc_scanner --big-mb 1024
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import abc_parser
+import configurations
+
+
+def throughput(reader, paths, total_bytes, repeat):
+    """Best MB/s of reading every path with reader, and the tune count."""
+    best = None
+    count = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = 0
+        for path in paths:
+            for _tune in reader(path):
+                count += 1
+        seconds = time.perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    return total_bytes / 2**20 / best, count
+
+
+def make_big_file(dest_dir, size_mb):
+    """Concatenate the bundled books into one file of about size_mb MiB."""
+    sources = b"".join(
+        open(path, "rb").read().rstrip(b"\r\n") + b"\n\n"
+        for _book, _fname, path in abc_parser.find_abc_files(configurations.BOOKS_DIR)
+    )
+    book_dir = os.path.join(dest_dir, "0")
+    os.makedirs(book_dir, exist_ok=True)
+    path = os.path.join(book_dir, "big.abc")
+    target = size_mb * 2**20
+    written = 0
+    with open(path, "wb") as out:
+        while written < target:
+            out.write(sources)
+            written += len(sources)
+    return path
+
+
+def report(label, paths, repeat):
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    text_rate, text_count = throughput(abc_parser.iter_abc_file, paths, total_bytes, repeat)
+    mmap_rate, mmap_count = throughput(abc_parser.scan_abc_file, paths, total_bytes, repeat)
+    if text_count != mmap_count:
+        raise SystemExit(f"{label}: tune counts differ ({text_count} vs {mmap_count})")
+    print(f"{label}: {total_bytes / 2**20:.1f} MiB, {text_count} tunes")
+    print(f"  text parser : {text_rate:7.1f} MB/s")
+    print(f"  mmap scanner: {mmap_rate:7.1f} MB/s  ({mmap_rate / text_rate:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--big-mb", type=int, default=1024,
+                        help="size of the synthetic single file in MiB (default 1024, 0 to skip)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs over abc_books, best is reported")
+    parser.add_argument("--dir", default=None, help="where to write the big file (default: system temp)")
+    args = parser.parse_args()
+
+    files = abc_parser.find_abc_files(configurations.BOOKS_DIR)
+    paths = [path for _book, _fname, path in files]
+    if not all(list(abc_parser.scan_abc_file(path)) == list(abc_parser.iter_abc_file(path)) for path in paths):
+        raise SystemExit("mmap scanner output differs from the text parser on abc_books")
+    report("abc_books", paths, args.repeat)
+
+    if args.big_mb > 0:
+        with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+            print(f"\nWriting a {args.big_mb} MiB synthetic file...")
+            report("big file", [make_big_file(tmp, args.big_mb)], 1)
+
+
+if __name__ == "__main__":
+    main()
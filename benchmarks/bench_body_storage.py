@@ -0,0 +1,87 @@
+"""
+Compare plain and zlib-compressed body storage: database size and the
+speed of queries that scan the tunes table without needing bodies.
+
+    python -m benchmarks.bench_body_storage --scale 20
+"""
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import time
+
+import configurations
+import db_connection
+import db_generations
+from benchmarks.synthetic import make_corpus
+
+# queries that have to visit every tunes row but never read the body
+SCAN_QUERIES = {
+    "rhythm substring": "SELECT COUNT(*) FROM tunes WHERE r LIKE '%reel%';",
+    "unindexed group": "SELECT r, COUNT(*) FROM tunes WHERE x <> '' GROUP BY r;",
+}
+
+
+def time_query(db_path, sql, repeat):
+    best = None
+    for _ in range(repeat):
+        conn = sqlite3.connect(db_path)
+        started = time.perf_counter()
+        conn.execute(sql).fetchall()
+        seconds = time.perf_counter() - started
+        conn.close()
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def largest_tables(db_path, count=4):
+    """[(name, bytes)] of the biggest tables and indexes, or [] without the dbstat table."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(
+            "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY 2 DESC LIMIT ?;", (count,)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=int, default=20, help="copies of abc_books (default 20)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per query, best is reported")
+    parser.add_argument("--dir", default=configurations.BASE_DIR,
+                        help="where to build the corpus and databases (default: project dir)")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        print(f"Generating synthetic corpus ({args.scale}x abc_books)...")
+        configurations.BOOKS_DIR = make_corpus(tmp, args.scale, vary=True)
+        for storage in ("plain", "zlib"):
+            configurations.SQLITE_DB_PATH = os.path.join(tmp, f"tunes-{storage}.db")
+            configurations.BODY_STORAGE = storage
+            with contextlib.redirect_stdout(io.StringIO()):
+                db_connection.rebuild_database("sqlite", bulk=True)
+            db_path = db_generations.current_path()
+            results[storage] = (
+                os.path.getsize(db_path),
+                largest_tables(db_path),
+                {label: time_query(db_path, sql, args.repeat)
+                 for label, sql in SCAN_QUERIES.items()},
+            )
+
+    plain_size, _tables, plain_times = results["plain"]
+    for storage, (size, tables, times) in results.items():
+        print(f"{storage:5} database: {size / 2**20:7.1f} MiB  ({size / plain_size * 100:.0f}% of plain)")
+        for name, table_size in tables:
+            print(f"      {name:22} {table_size / 2**20:6.1f} MiB")
+        for label, seconds in times.items():
+            print(f"      {label:16} {seconds * 1000:8.1f} ms  ({plain_times[label] / seconds:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
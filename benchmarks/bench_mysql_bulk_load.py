@@ -0,0 +1,71 @@
+"""
+Compare the row-batched MySQL rebuild with the bulk rebuild (staging
+table, packet-sized multi-row INSERTs, deferred indexes, RENAME swap).
+
+Needs a MySQL or MariaDB server with the MYSQL_* settings from .env; the
+benchmark is skipped when none answers. It rebuilds the tunes table of a
+separate schema (the configured database name plus "_bench" unless
+--schema says otherwise), never the configured database. A throwaway
+container will do:
+
+    docker run --rm -d -p 3306:3306 -e MARIADB_ROOT_PASSWORD=abc -e MARIADB_DATABASE=tunes mariadb
+    MYSQL_HOST=127.0.0.1 MYSQL_USER=root MYSQL_PASSWORD=abc MYSQL_DATABASE=tunes \\
+        python -m benchmarks.bench_mysql_bulk_load --scale 10
+"""
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+
+import configurations
+import db_connection
+from benchmarks.run import benchmark_schema, use_benchmark_schema
+from benchmarks.synthetic import make_corpus
+
+
+def time_rebuild(bulk: bool, workers: int) -> float:
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        db_connection.rebuild_database("mysql", workers=workers, bulk=bulk)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=int, default=10, help="copies of abc_books (default 10)")
+    parser.add_argument("--workers", type=int, default=1, help="parser processes (default 1)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per mode, best is reported")
+    parser.add_argument("--schema", help="schema to rebuild in (default: configured database + '_bench')")
+    args = parser.parse_args()
+
+    try:
+        schema = benchmark_schema(args.schema)
+    except ValueError as e:
+        parser.error(str(e))
+    if not use_benchmark_schema(schema):
+        print("No MySQL server answers with the configured MYSQL_* settings; skipping.")
+        return
+    print(f"Rebuilding in schema '{schema}'.")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Generating synthetic corpus ({args.scale}x abc_books)...")
+        configurations.BOOKS_DIR = make_corpus(tmp, args.scale, vary=True)
+
+        results = {}
+        for label, bulk in (("batched", False), ("bulk", True)):
+            results[label] = min(time_rebuild(bulk, args.workers) for _ in range(args.repeat))
+
+        conn = db_connection.get_mysql_connection()
+        rows = db_connection.fetch_one(conn, "SELECT COUNT(*) FROM tunes;", use_cache=False)[0]
+        budget = db_connection.mysql_insert_budget(conn)
+        conn.close()
+
+    print(f"Rows loaded: {rows}  (INSERT budget {budget / 2**20:.1f} MiB)")
+    for label, seconds in results.items():
+        print(f"{label:8} rebuild: {seconds:7.2f}s  {rows / seconds:9.0f} rows/s")
+    print(f"speed-up: {results['batched'] / results['bulk']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
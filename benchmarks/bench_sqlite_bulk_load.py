@@ -0,0 +1,67 @@
+"""
+Compare the plain SQLite rebuild with the bulk-load rebuild
+(temporary file, relaxed pragmas, deferred indexes, atomic swap).
+
+    python -m benchmarks.bench_sqlite_bulk_load --scale 20
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import abc_parser
+import configurations
+import db_connection
+from benchmarks.synthetic import make_corpus
+
+
+def time_rebuild(bulk: bool, workers: int) -> float:
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        db_connection.rebuild_database("sqlite", workers=workers, bulk=bulk)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=int, default=20, help="copies of abc_books (default 20)")
+    parser.add_argument("--workers", type=int, default=1, help="parser processes (default 1)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per mode, best is reported")
+    parser.add_argument("--dir", default=configurations.BASE_DIR,
+                        help="where to build the corpus and database (default: project dir, same disk as tunes.db)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        print(f"Generating synthetic corpus ({args.scale}x abc_books)...")
+        configurations.BOOKS_DIR = make_corpus(tmp, args.scale)
+        configurations.SQLITE_DB_PATH = os.path.join(tmp, "tunes.db")
+
+        # both modes rebuild over an already populated database, which
+        # is what the GUI's rebuild button does
+        time_rebuild(True, args.workers)
+        results = {}
+        for label, bulk in (("plain", False), ("bulk", True)):
+            results[label] = min(time_rebuild(bulk, args.workers) for _ in range(args.repeat))
+
+        started = time.perf_counter()
+        for _tune in abc_parser.iter_all_tunes():
+            pass
+        parse_seconds = time.perf_counter() - started
+
+        conn = db_connection.get_sqlite_connection()
+        rows = conn.execute("SELECT COUNT(*) FROM tunes;").fetchone()[0]
+        conn.close()
+
+    print(f"Rows loaded: {rows}  (parsing alone: {parse_seconds:.2f}s single process)")
+    for label, seconds in results.items():
+        db_seconds = max(seconds - parse_seconds, 1e-9)
+        print(f"{label:6} rebuild: {seconds:7.2f}s total, ~{db_seconds:6.2f}s database work")
+    plain_db = max(results["plain"] - parse_seconds, 1e-9)
+    bulk_db = max(results["bulk"] - parse_seconds, 1e-9)
+    print(f"speed-up: {results['plain'] / results['bulk']:.2f}x total, ~{plain_db / bulk_db:.2f}x database work")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Measure start-up cost of the entry points with python -X importtime and
+check that pandas, numpy and mysql.connector are not loaded until a
+feature needs them. Exits with status 1 if an entry point loads one.
+
+    python -m benchmarks.bench_startup --repeat 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import configurations
+
+# module -> what has to be imported to start it
+ENTRY_POINTS = {
+    "main": "import main",
+    "db_query": "import db_query",
+}
+
+# packages that only analysis, similarity search or MySQL may load
+HEAVY_MODULES = ("pandas", "numpy", "mysql.connector")
+
+# run the GUI until its first window has been drawn, then exit
+FIRST_WINDOW = (
+    "import tkinter\n"
+    "def first_frame(root, n=0):\n"
+    "    root.update()\n"
+    "    root.destroy()\n"
+    "tkinter.Tk.mainloop = first_frame\n"
+    "import db_gui\n"
+    "db_gui.start_gui()\n"
+)
+
+
+def import_profile(code: str):
+    """
+    Run code in a fresh interpreter with -X importtime. Returns the total
+    import time in seconds and the set of modules it imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=configurations.BASE_DIR, capture_output=True, text=True, check=True,
+    )
+    total_us = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _self, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        modules.add(name.strip())
+        if not name.startswith("  "):
+            total_us += int(cumulative)
+    return total_us / 1e6, modules
+
+
+def wall_time(code: str, repeat: int) -> float:
+    """Best wall time of running code in a fresh interpreter."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=configurations.BASE_DIR, check=True,
+                       stdout=subprocess.DEVNULL)
+        seconds = time.perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def measure(repeat: int = 3) -> dict:
+    """Import and wall times of every entry point (and the first GUI window if there is a display)."""
+    results = {}
+    for name, code in ENTRY_POINTS.items():
+        imports = min(import_profile(code)[0] for _ in range(repeat))
+        results[f"import_{name}"] = {"seconds": imports}
+        results[f"launch_{name}"] = {"seconds": wall_time(code, repeat)}
+    if os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin"):
+        results["first_window"] = {"seconds": wall_time(FIRST_WINDOW, repeat)}
+    return results
+
+
+def heavy_imports() -> dict:
+    """Entry point -> heavy modules it loads at start-up (should be empty)."""
+    found = {}
+    for name, code in ENTRY_POINTS.items():
+        _seconds, modules = import_profile(code)
+        loaded = [heavy for heavy in HEAVY_MODULES if heavy in modules]
+        if loaded:
+            found[name] = loaded
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, best is reported")
+    args = parser.parse_args()
+
+    baseline = wall_time("pass", args.repeat)
+    print(f"bare interpreter: {baseline * 1000:7.1f} ms")
+    for name, value in measure(args.repeat).items():
+        print(f"{name:16}  {value['seconds'] * 1000:7.1f} ms")
+
+    found = heavy_imports()
+    for name, loaded in found.items():
+        print(f"{name} loads {', '.join(loaded)} at start-up")
+    if found:
+        sys.exit(1)
+    print(f"No entry point loads {', '.join(HEAVY_MODULES)} at start-up.")
+
+
+if __name__ == "__main__":
+    main()
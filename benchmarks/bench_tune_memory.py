@@ -0,0 +1,95 @@
+"""
+Measure the memory held per parsed tune: the old one-dict-per-tune
+representation against the slotted, interned abc_parser.Tune records.
+
+    python -m benchmarks.bench_tune_memory --scale 20
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+import abc_parser
+import configurations
+from benchmarks.synthetic import make_corpus
+
+
+def legacy_parse_abc_file(file_path):
+    """The dict-per-tune parser as it was before Tune records, for comparison."""
+    tunes = []
+    current_tune = None
+    body_lines = []
+    book_name = os.path.basename(os.path.dirname(file_path))
+    filename = os.path.basename(file_path)
+
+    def finish(tune):
+        tune["body"] = "\n".join(body_lines).strip()
+        tunes.append(abc_parser.add_normalized_fields(tune))
+
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        for raw_line in f:
+            line = raw_line.strip()
+            if line.startswith("X:"):
+                if current_tune is not None:
+                    finish(current_tune)
+                current_tune = {"book": book_name, "filename": filename, "X": line[2:].strip(),
+                                "T": "", "R": "", "M": "", "K": "", "body": ""}
+                body_lines = []
+            elif current_tune is not None:
+                if line.startswith("T:"):
+                    title = line[2:].strip()
+                    current_tune["T"] = current_tune["T"] + " / " + title if current_tune["T"] else title
+                elif line.startswith("R:"):
+                    current_tune["R"] = line[2:].strip()
+                elif line.startswith("M:"):
+                    current_tune["M"] = line[2:].strip()
+                elif line.startswith("K:"):
+                    current_tune["K"] = line[2:].strip()
+                else:
+                    body_lines.append(line)
+    if current_tune is not None:
+        finish(current_tune)
+    return tunes
+
+
+def measure(parse_file, files):
+    """Parse every file, keep all tunes alive and return (tunes, bytes held, seconds)."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    tunes = []
+    for _book, _fname, path in files:
+        tunes.extend(parse_file(path))
+    seconds = time.perf_counter() - started
+    held, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(tunes)
+    del tunes
+    return count, held, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=int, default=20, help="copies of abc_books (default 20)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Generating synthetic corpus ({args.scale}x abc_books)...")
+        files = abc_parser.find_abc_files(make_corpus(tmp, args.scale, configurations.BOOKS_DIR))
+
+        results = {}
+        for label, parse_file in (("dict", legacy_parse_abc_file), ("Tune", abc_parser.parse_abc_file)):
+            results[label] = measure(parse_file, files)
+
+    for label, (count, held, seconds) in results.items():
+        print(f"{label:5} {count} tunes: {held / 2**20:7.1f} MiB held, "
+              f"{held / count:6.0f} bytes/tune, parsed in {seconds:.2f}s (traced)")
+    saved = results["dict"][1] - results["Tune"][1]
+    print(f"saved {saved / results['Tune'][0]:.0f} bytes/tune "
+          f"({saved / results['dict'][1] * 100:.0f}% of the dict representation)")
+
+
+if __name__ == "__main__":
+    main()
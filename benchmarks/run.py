@@ -0,0 +1,284 @@
+"""
+Run the whole benchmark suite: start-up time, parsing, database rebuilds,
+every db_query search and the pandas stats path, on a synthetic corpus of
+one or more sizes. Results are written as JSON; --compare flags regressions against a
+saved baseline.
+
+    python -m benchmarks.run --scale 10 --output baseline.json
+    python -m benchmarks.run --scale 10 --compare baseline.json
+
+MySQL is only benchmarked with --mysql on, and then in its own schema
+(the configured database name plus "_bench" unless --mysql-schema says
+otherwise): a rebuild replaces the tunes table, so the configured
+database itself is never used.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+
+import abc_parser
+import configurations
+import data_analysis
+import db_connection
+import db_query
+import db_stats
+import music_stats
+import query_cache
+from benchmarks import bench_startup
+from benchmarks.synthetic import make_corpus
+
+# timings below this many seconds are too noisy to call a regression
+MIN_SECONDS = 0.002
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def best_time(func, repeat, before=None):
+    """Best wall time of func() over repeat runs, with its output swallowed."""
+    best = None
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        seconds = time.perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def bench_parse(repeat):
+    files = abc_parser.find_abc_files(configurations.BOOKS_DIR)
+    total_bytes = sum(os.path.getsize(path) for _book, _fname, path in files)
+    counts = []
+
+    def parse():
+        counts.append(sum(len(abc_parser.parse_abc_file(path)) for _book, _fname, path in files))
+
+    seconds = best_time(parse, repeat)
+    return {"seconds": seconds, "mb_per_s": total_bytes / 2**20 / seconds, "tunes": counts[-1]}
+
+
+def query_cases(conn):
+    """(name, callable) for each db_query search and db_stats report, run against conn."""
+    middle_id = db_connection.fetch_one(conn, "SELECT MAX(id) / 2 FROM tunes;", use_cache=False)[0] or 1
+    middle_id = int(middle_id)
+    return [
+        ("list_tunes", lambda: db_query.list_tunes(conn, 20)),
+        ("search_by_title", lambda: db_query.search_by_title(conn, "reel")),
+        ("title_search_page", lambda: db_query.title_search_page(conn, "the")),
+        ("search_title_ranked", lambda: db_query.search_title_ranked(conn, "the reel")),
+        ("search_body_ranked", lambda: db_query.search_body_ranked(conn, "d2")),
+        ("search_by_key", lambda: db_query.search_by_key(conn, "D")),
+        ("search_by_meter", lambda: db_query.search_by_meter(conn, "6/8")),
+        ("find_by_facets", lambda: db_query.find_by_facets(conn, key="G", meter="6/8", rhythm="jig")),
+        ("show_tune_details", lambda: db_query.show_tune_details(conn, middle_id)),
+        ("find_occurrences", lambda: db_query.find_occurrences(conn, middle_id)),
+        ("find_similar", lambda: db_query.find_similar(conn, middle_id)),
+        ("basic_stats_sql", lambda: db_stats.show_basic_stats_sql(conn)),
+        ("crosstabs", lambda: db_stats.show_crosstabs(conn)),
+    ]
+
+
+def bench_queries(conn, repeat):
+    """Time every query case with the query cache emptied before each run."""
+    return {
+        name: {"seconds": best_time(func, repeat, before=query_cache.clear_query_cache)}
+        for name, func in query_cases(conn)
+    }
+
+
+def bench_pandas(conn, repeat):
+    def forget_frames():
+        data_analysis.clear_dataframe_cache()
+
+    def forget_frames_and_sidecars():
+        forget_frames()
+        for path in glob.glob(os.path.join(configurations.CACHE_DIR, "*.parquet")):
+            os.remove(path)
+
+    results = {
+        "load_from_database": {"seconds": best_time(lambda: data_analysis.load_stats_dataframe(conn), repeat,
+                                                    before=forget_frames_and_sidecars)},
+    }
+    if data_analysis.HAVE_PARQUET:
+        data_analysis.load_stats_dataframe(conn)
+        results["load_from_sidecar"] = {
+            "seconds": best_time(lambda: data_analysis.load_stats_dataframe(conn), repeat, before=forget_frames)
+        }
+    df = data_analysis.load_stats_dataframe(conn)
+    results["basic_stats"] = {"seconds": best_time(lambda: data_analysis.display_basic_stats(df), repeat)}
+    results["search_tunes"] = {"seconds": best_time(lambda: data_analysis.search_tunes(df, "reel"), repeat)}
+    results["music_stats"] = {"seconds": best_time(lambda: music_stats.show_music_stats(conn, "rhythm"), repeat,
+                                                   before=music_stats.clear_corpus_cache)}
+    return results
+
+
+def benchmark_schema(schema=None) -> str:
+    """The schema MySQL benchmarks run in; never the configured database."""
+    configured = configurations.MYSQL_CONFIG.get("database") or "tunes"
+    schema = schema or f"{configured}_bench"
+    if schema == configured:
+        raise ValueError(f"Refusing to benchmark in the configured database '{configured}'.")
+    if "`" in schema:
+        raise ValueError(f"Invalid schema name '{schema}'.")
+    return schema
+
+
+def use_benchmark_schema(schema=None) -> bool:
+    """
+    Create the benchmark schema if needed and point MYSQL_CONFIG at it.
+    Returns False (and changes nothing) when no MySQL server answers.
+    """
+    schema = benchmark_schema(schema)
+    server = {name: value for name, value in configurations.MYSQL_CONFIG.items() if name != "database"}
+    try:
+        import mysql.connector
+        conn = mysql.connector.connect(connection_timeout=2, **server)
+    except Exception:
+        return False
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{schema}`;")
+        cursor.close()
+    finally:
+        conn.close()
+    configurations.MYSQL_CONFIG["database"] = schema
+    configurations.notify_database_changed("benchmark")
+    return True
+
+
+def bench_backend(backend, workers, repeat):
+    """Rebuild the backend from the corpus, then time its queries and the pandas path."""
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        db_connection.rebuild_database(backend, workers=workers)
+    results = {"rebuild": {"seconds": time.perf_counter() - started}}
+
+    if backend == "sqlite":
+        conn = db_connection.get_sqlite_connection()
+    else:
+        conn = db_connection.get_mysql_connection()
+    try:
+        results.update({f"query/{name}": value for name, value in bench_queries(conn, repeat).items()})
+        results.update({f"pandas/{name}": value for name, value in bench_pandas(conn, repeat).items()})
+    finally:
+        conn.close()
+    return results
+
+
+def run_suite(scales, workers, repeat, work_dir, with_mysql):
+    results = {}
+    for scale in scales:
+        with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+            log(f"Generating synthetic corpus ({scale}x abc_books)...")
+            configurations.BOOKS_DIR = make_corpus(tmp, scale, vary=True)
+            configurations.SQLITE_DB_PATH = os.path.join(tmp, "tunes.db")
+            configurations.CACHE_DIR = os.path.join(tmp, "cache")
+            configurations.notify_database_changed("benchmark")
+
+            log(f"[{scale}x] parsing")
+            results[f"x{scale}/parse"] = bench_parse(repeat)
+            backends = ["sqlite"] + (["mysql"] if with_mysql else [])
+            for backend in backends:
+                log(f"[{scale}x] {backend}: rebuild, queries, pandas")
+                configurations.notify_database_changed("benchmark")
+                for name, value in bench_backend(backend, workers, repeat).items():
+                    results[f"x{scale}/{backend}/{name}"] = value
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print each timing against the baseline; return the names that got slower."""
+    regressions = []
+    print(f"{'benchmark':55} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for name in sorted(set(results) | set(baseline)):
+        if name not in baseline or name not in results:
+            print(f"{name:55} {'only in ' + ('results' if name in results else 'baseline'):>29}")
+            continue
+        old, new = baseline[name]["seconds"], results[name]["seconds"]
+        ratio = new / old if old else float("inf")
+        status = ""
+        if max(old, new) >= MIN_SECONDS:
+            if ratio > 1 + threshold:
+                status = "REGRESSION"
+                regressions.append(name)
+            elif ratio < 1 / (1 + threshold):
+                status = "faster"
+        print(f"{name:55} {old * 1000:8.1f}ms {new * 1000:8.1f}ms {ratio:6.2f}x {status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=int, nargs="+", default=[10],
+                        help="corpus sizes as multiples of abc_books, eg 10 100 1000 (default 10)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per parse/query timing, best is kept")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes for rebuilds")
+    parser.add_argument("--dir", default=configurations.BASE_DIR,
+                        help="where to build the corpus and databases (default: project dir)")
+    parser.add_argument("--mysql", choices=("on", "off"), default="off",
+                        help="also benchmark MySQL, in a separate schema (default off)")
+    parser.add_argument("--mysql-schema", metavar="NAME",
+                        help="schema for the MySQL benchmarks (default: configured database + '_bench')")
+    parser.add_argument("--output", help="write the JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON file from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slow-down that counts as a regression (default 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    with_mysql = args.mysql == "on"
+    if with_mysql:
+        try:
+            schema = benchmark_schema(args.mysql_schema)
+        except ValueError as e:
+            parser.error(str(e))
+        if not use_benchmark_schema(schema):
+            parser.error("--mysql on, but no MySQL server answers with the configured MYSQL_* settings.")
+        log(f"MySQL benchmarks use schema '{schema}'.")
+
+    log("Measuring start-up time")
+    results = {f"startup/{name}": value for name, value in bench_startup.measure(args.repeat).items()}
+    results.update(run_suite(args.scale, args.workers, args.repeat, args.dir, with_mysql))
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "scales": args.scale,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        log(f"Results written to {args.output}")
+    elif not args.compare:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import os
+import random
+import re
+import shutil
+from typing import Optional
+
+import configurations
+
+INFO_LINE = re.compile(r"^\s*(?:[A-Za-z+]:|%)")
+NOTE_LETTERS = "CDEFGAB"
+# NOTE_SHIFTS[n] moves every note letter n steps up the scale, keeping its case
+NOTE_SHIFTS = [
+    str.maketrans(NOTE_LETTERS + NOTE_LETTERS.lower(),
+                  NOTE_LETTERS[n:] + NOTE_LETTERS[:n] + (NOTE_LETTERS[n:] + NOTE_LETTERS[:n]).lower())
+    for n in range(len(NOTE_LETTERS))
+]
+
+
+def vary_body(lines, seed: str):
+    """
+    Shift the notes of each music line by a pseudo-random step chosen from
+    seed, so copies get distinct bodies (and body_hash) but the same shape
+    and size. The same seed always gives the same result.
+    """
+    rng = random.Random(seed)
+    return [line if INFO_LINE.match(line) else line.translate(NOTE_SHIFTS[rng.randrange(len(NOTE_SHIFTS))])
+            for line in lines]
+
+
+def make_corpus(dest_dir: str, scale: int = 10, books_dir: Optional[str] = None, vary: bool = False) -> str:
+    """
+    Build a synthetic corpus in dest_dir/abc_books that is `scale` times
+    the size of the bundled abc_books. Each copy of a file gets its own
+    name and a numbered title suffix so rows are not identical; with
+    vary=True the music of every copy after the first is altered too
+    (see vary_body). The output only depends on abc_books and the
+    arguments. Returns the path of the new books directory.
+    """
+    books_dir = books_dir or configurations.BOOKS_DIR
+    out_books = os.path.join(dest_dir, "abc_books")
+    if os.path.isdir(out_books):
+        shutil.rmtree(out_books)
+
+    for book in sorted(os.listdir(books_dir)):
+        src_book = os.path.join(books_dir, book)
+        if not (os.path.isdir(src_book) and book.isdigit()):
+            continue
+        out_book = os.path.join(out_books, book)
+        os.makedirs(out_book)
+        for fname in sorted(os.listdir(src_book)):
+            if not fname.lower().endswith(".abc"):
+                continue
+            with open(os.path.join(src_book, fname), "r", encoding="utf-8", errors="ignore") as f:
+                lines = f.read().splitlines()
+            stem = os.path.splitext(fname)[0]
+            for copy in range(scale):
+                suffix = f" #{copy}" if copy else ""
+                copy_lines = vary_body(lines, f"{book}/{fname}/{copy}") if vary and copy else lines
+                with open(os.path.join(out_book, f"{stem}_{copy:04d}.abc"), "w", encoding="utf-8") as out:
+                    for line in copy_lines:
+                        if suffix and line.lstrip().startswith("T:"):
+                            line = line.rstrip() + suffix
+                        out.write(line + "\n")
+    return out_books
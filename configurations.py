@@ -2,15 +2,15 @@
 
 # os is a module that lets us access the file systemr
 import os 
-import sqlite3
-import pandas as pd
-import mysql.connector
-# sqlite for connecting to sqlite databases
+# heavy packages (pandas, numpy, mysql.connector) are imported by the
+# modules that use them, only when that feature is first used
 from dotenv import load_dotenv
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 BOOKS_DIR = os.path.join(BASE_DIR, "abc_books")
 SQLITE_DB_PATH = os.path.join(BASE_DIR, "tunes.db")
+# derived files that can be deleted at any time (e.g. DataFrame sidecars)
+CACHE_DIR = os.path.join(BASE_DIR, ".cache")
 
 # load .env but used later
 load_dotenv(os.path.join(BASE_DIR, ".env"))
@@ -28,6 +28,65 @@ if ACTIVE_DATABASE not in SUPPORTED_DATABASES:
     print(f"Unsupported backend '{ACTIVE_DATABASE}', falling back to SQLite.")
     ACTIVE_DATABASE = "sqlite"
 
+# number of processes used to parse ABC files during a rebuild (0 = one per CPU)
+try:
+    INGEST_WORKERS = int(os.getenv("ABC_INGEST_WORKERS") or 0)
+except ValueError:
+    INGEST_WORKERS = 0
+
+# number of tunes handed to the database inserter at a time
+INSERT_BATCH_SIZE = 1000
+
+# build the new SQLite generation (see db_generations) with journaling off
+# and the indexes created after the rows are in; 0 loads an indexed table
+SQLITE_BULK_LOAD = (os.getenv("ABC_SQLITE_BULK_LOAD") or "1").strip().lower() not in {"0", "false", "no", "off"}
+
+# rebuild MySQL in a staging table with packet-sized multi-row INSERTs and
+# swap it in with RENAME TABLE; one INSERT never exceeds half of the
+# server's max_allowed_packet nor MYSQL_MAX_INSERT_BYTES
+MYSQL_BULK_LOAD = (os.getenv("ABC_MYSQL_BULK_LOAD") or "1").strip().lower() not in {"0", "false", "no", "off"}
+MYSQL_MAX_INSERT_BYTES = 16 * 2**20
+
+# read .abc files with the memory-mapped byte scanner instead of line by line
+ABC_MMAP_SCANNER = (os.getenv("ABC_MMAP_SCANNER") or "1").strip().lower() not in {"0", "false", "no", "off"}
+
+# how SQLite stores tune bodies: "plain" in tunes.body, or "zlib" compressed
+# in a separate tune_bodies table (takes effect on the next full rebuild)
+BODY_STORAGES = {"plain", "zlib"}
+BODY_STORAGE = (os.getenv("ABC_BODY_STORAGE") or "plain").strip().lower()
+if BODY_STORAGE not in BODY_STORAGES:
+    BODY_STORAGE = "plain"
+BODY_COMPRESSION_LEVEL = 6
+
+# rows read per cursor.fetchmany() call when results are streamed (query_cli.py)
+STREAM_FETCH_SIZE = 500
+
+# connection pool: connections kept per backend and seconds to wait for one
+try:
+    POOL_SIZE = max(1, int(os.getenv("ABC_POOL_SIZE") or 5))
+except ValueError:
+    POOL_SIZE = 5
+POOL_TIMEOUT = 10
+
+# query result cache: entries kept and seconds before an entry expires
+try:
+    QUERY_CACHE_SIZE = max(0, int(os.getenv("ABC_QUERY_CACHE_SIZE") or 256))
+except ValueError:
+    QUERY_CACHE_SIZE = 256
+try:
+    QUERY_CACHE_TTL = float(os.getenv("ABC_QUERY_CACHE_TTL") or 300)
+except ValueError:
+    QUERY_CACHE_TTL = 300.0
+
+# timing instrumentation (perf.py): off unless ABC_PERF is set, and the
+# duration above which a SQL statement goes into the slow query log
+PERF_ENABLED = (os.getenv("ABC_PERF") or "0").strip().lower() not in {"0", "false", "no", "off"}
+try:
+    SLOW_QUERY_SECONDS = float(os.getenv("ABC_SLOW_QUERY_MS") or 100) / 1000
+except ValueError:
+    SLOW_QUERY_SECONDS = 0.1
+SLOW_QUERY_LOG_SIZE = 200
+
 # mySQL connection settings read from environment variables file
 MYSQL_CONFIG = {
     "host": os.getenv("MYSQL_HOST"),
@@ -37,12 +96,29 @@ MYSQL_CONFIG = {
 }
 
 
+# callbacks run when the active backend changes or the data is rebuilt
+DATABASE_LISTENERS = []
+
+
+def add_database_listener(callback):
+    """Register callback(reason) to run after a backend switch or rebuild."""
+    if callback not in DATABASE_LISTENERS:
+        DATABASE_LISTENERS.append(callback)
+
+
+def notify_database_changed(reason: str):
+    """Tell listeners (pools, caches) that the database they point at changed."""
+    for callback in list(DATABASE_LISTENERS):
+        callback(reason)
+
+
 def set_active_database(choice: str):
     """Change the globally active database backend."""
     global ACTIVE_DATABASE
     normalized = (choice or "").strip().lower()
     if normalized in SUPPORTED_DATABASES:
         ACTIVE_DATABASE = normalized
+        notify_database_changed("switch")
         print(f"Active database switched to: {ACTIVE_DATABASE.upper()}")
     else:
         supported = ", ".join(sorted(SUPPORTED_DATABASES))
@@ -1,11 +1,153 @@
+import glob
+import os
+import threading
+
 import pandas as pd
 
+import configurations
+import db_generations
+from db_connection import fetch_tune_bodies, get_data_version, is_sqlite_connection
+
+# columns the analysis functions use; body is left out on purpose
+STATS_COLUMNS = ["id", "book", "filename", "x", "t", "r", "m", "k"]
+CATEGORY_COLUMNS = ["book", "r", "m", "k"]
+
+try:
+    import pyarrow  # noqa: F401  (only needed for the Parquet sidecar)
+    HAVE_PARQUET = True
+except ImportError:
+    HAVE_PARQUET = False
+
+_frame_cache = {}
+_frame_lock = threading.Lock()
+
+# database_identity -> (db_generations.live_stamp(), data version) for SQLite
+_version_cache = {}
+
 
 def load_tunes_dataframe(conn) -> pd.DataFrame:
     """Load the entire tunes table into a pandas DataFrame."""
     return pd.read_sql("SELECT * FROM tunes;", conn)
 
 
+def database_identity(conn):
+    """Which database conn points at: ('sqlite', path) or ('mysql', host, database)."""
+    if is_sqlite_connection(conn):
+        return "sqlite", os.path.abspath(configurations.SQLITE_DB_PATH)
+    return "mysql", configurations.MYSQL_CONFIG.get("host"), configurations.MYSQL_CONFIG.get("database")
+
+
+def data_version(conn, identity):
+    """
+    conn's data version. For SQLite it is only read from db_meta when the
+    live database file or its -wal changed since the last read, so a
+    lookup costs a few stat() calls; MySQL has no file to watch and costs
+    one db_meta read per lookup.
+    """
+    if identity[0] != "sqlite":
+        return get_data_version(conn)
+    stamp = db_generations.live_stamp()
+    with _frame_lock:
+        cached = _version_cache.get(identity)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    version = get_data_version(conn)
+    with _frame_lock:
+        _version_cache[identity] = (stamp, version)
+    return version
+
+
+def cache_key(conn):
+    """
+    Key for in-memory caches of conn's data: its database_identity plus
+    the data version, so a rebuild or sync made by another process (the
+    query CLI, a second GUI) is noticed even though no listener fires here.
+    """
+    identity = database_identity(conn)
+    return identity, data_version(conn, identity)
+
+
+def sidecar_path(identity, version) -> str:
+    """Parquet file that holds the stats frame for one database version."""
+    name = "-".join(str(part) for part in identity).replace(os.sep, "_").replace(":", "_")
+    return os.path.join(configurations.CACHE_DIR, f"{name}.{version}.parquet")
+
+
+def read_stats_frame(conn) -> pd.DataFrame:
+    """Query just STATS_COLUMNS and make the repeated-value columns categorical."""
+    df = pd.read_sql(f"SELECT {', '.join(STATS_COLUMNS)} FROM tunes;", conn)
+    for column in CATEGORY_COLUMNS:
+        df[column] = df[column].fillna("").astype(str).astype("category")
+    return df
+
+
+def load_stats_dataframe(conn) -> pd.DataFrame:
+    """
+    Return the tunes table without bodies, cached in memory.
+
+    The first call per database version reads it (from a Parquet sidecar
+    when pyarrow is installed, otherwise from the database); later calls
+    return the cached frame until a rebuild or sync, in this process or
+    another, changes the data version (see data_version for what checking
+    it costs). Use
+    load_tune_bodies() for the body text of particular tunes.
+    """
+    key = cache_key(conn)
+    with _frame_lock:
+        df = _frame_cache.get(key)
+    if df is not None:
+        return df
+
+    identity, version = key
+    path = sidecar_path(identity, version) if version and HAVE_PARQUET else None
+    if path and os.path.exists(path):
+        df = pd.read_parquet(path)
+    else:
+        df = read_stats_frame(conn)
+        if path:
+            write_sidecar(df, identity, path)
+
+    with _frame_lock:
+        for old in [old for old in _frame_cache if old[0] == identity]:
+            del _frame_cache[old]
+        _frame_cache[key] = df
+    return df
+
+
+def write_sidecar(df: pd.DataFrame, identity, path: str):
+    """Save the frame for fast warm starts and drop sidecars of older versions."""
+    os.makedirs(configurations.CACHE_DIR, exist_ok=True)
+    for old in glob.glob(sidecar_path(identity, "*")):
+        if old != path:
+            os.remove(old)
+    tmp_path = path + ".tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def clear_dataframe_cache(reason: str = ""):
+    """Forget cached frames (called on rebuild and backend switch)."""
+    with _frame_lock:
+        _frame_cache.clear()
+        _version_cache.clear()
+
+
+configurations.add_database_listener(clear_dataframe_cache)
+
+
+def load_tune_bodies(conn, tune_ids) -> pd.Series:
+    """Fetch body text only for the given tune ids, as a Series indexed by id."""
+    bodies = fetch_tune_bodies(conn, tune_ids)
+    series = pd.Series(bodies, dtype=object, name="body")
+    series.index.name = "id"
+    return series
+
+
+def load_tune_body(conn, tune_id) -> str:
+    """Body text of a single tune ('' if it does not exist)."""
+    return fetch_tune_bodies(conn, [tune_id]).get(int(tune_id), "")
+
+
 def display_basic_stats(df: pd.DataFrame):
     """Print simple descriptive stats for the tunes dataset."""
     print("\n========== DATA ANALYSIS (pandas) ==========")
@@ -26,7 +168,7 @@ def display_basic_stats(df: pd.DataFrame):
 
 def show_basic_stats_with_pandas(conn):
     """Load data into pandas and show summary statistics."""
-    df = load_tunes_dataframe(conn)
+    df = load_stats_dataframe(conn)
     if df.empty:
         print("No tunes found in the database. Rebuild it first.")
         return
@@ -39,11 +181,11 @@ def get_tunes_by_book(df: pd.DataFrame, book_number: str) -> pd.DataFrame:
 
 
 def get_tunes_by_type(df: pd.DataFrame, tune_type: str) -> pd.DataFrame:
-    """Return tunes that match the provided rhythm/type (column R)."""
+    """Return tunes that match the provided rhythm/type (column r)."""
     pattern = tune_type.strip()
     if not pattern:
         return df.iloc[0:0]
-    return df[df["R"].fillna("").str.contains(pattern, case=False, na=False)]
+    return df[df["r"].astype(str).str.contains(pattern, case=False, na=False)]
 
 
 def search_tunes(df: pd.DataFrame, search_term: str) -> pd.DataFrame:
@@ -51,7 +193,7 @@ def search_tunes(df: pd.DataFrame, search_term: str) -> pd.DataFrame:
     term = search_term.strip()
     if not term:
         return df.iloc[0:0]
-    return df[df["T"].fillna("").str.contains(term, case=False, na=False)]
+    return df[df["t"].fillna("").astype(str).str.contains(term, case=False, na=False)]
 
 
 def print_tune_rows(df: pd.DataFrame, max_rows: int = 10):
@@ -59,7 +201,7 @@ def print_tune_rows(df: pd.DataFrame, max_rows: int = 10):
     if df.empty:
         print("No matching tunes found.")
         return
-    preview = df[["book", "filename", "X", "T", "R", "K", "M"]].head(max_rows)
+    preview = df[["book", "filename", "x", "t", "r", "k", "m"]].head(max_rows)
     print(preview.to_string(index=False))
     if len(df) > max_rows:
         print(f"... and {len(df) - max_rows} more")
\ No newline at end of file
@@ -1,21 +1,42 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+import zlib
+from collections import Counter
+from itertools import islice
 import sqlite3
-import mysql.connector
 import configurations
-from typing import Optional
-from abc_parser import load_all_tunes
+import db_generations
+import db_pool
+import perf
+import query_cache
+from typing import List, Optional
+from abc_parser import (Tune, find_abc_files, iter_tune_batches, normalize_key, normalize_meter,
+                        normalize_rhythm, tune_hash)
 
 def get_mysql_connection():
     """Open MySQL connection using config.MYSQL_CONFIG."""
     try:
-        return mysql.connector.connect(**configurations.MYSQL_CONFIG)
-    except mysql.connector.Error as err:
+        connector = db_pool.mysql_connector()
+    except ImportError:
+        print("Error connecting to MySQL: mysql-connector-python is not installed.")
+        return None
+    try:
+        conn = connector.connect(**configurations.MYSQL_CONFIG)
+        upgrade_on_open(conn)
+        return conn
+    except connector.Error as err:
         print("Error connecting to MySQL:", err)
         return None
 
 def get_sqlite_connection():
-    """Open SQLite connection using config.SQLITE_DB_PATH."""
+    """Open SQLite connection to the live generation of config.SQLITE_DB_PATH."""
     try:
-        return sqlite3.connect(configurations.SQLITE_DB_PATH)
+        conn = db_generations.connect()
+        upgrade_on_open(conn)
+        return conn
     except sqlite3.Error as err:
         print("Error connecting to SQLite:", err)
         return None
@@ -41,17 +62,26 @@ def open_active_connection():
     return None
 
 def run_with_connection(callback, *args, **kwargs):
-    """Open connection, run callback(conn,...), then close."""
-    conn = open_active_connection()
+    """
+    Borrow a pooled connection for the active backend, run
+    callback(conn,...), then hand the connection back to the pool.
+    Returns whatever the callback returns.
+    """
+    conn = db_pool.acquire_connection()
     if not conn:
-        return
+        return None
     try:
-        callback(conn, *args, **kwargs)
+        upgrade_on_open(conn)
+        return callback(conn, *args, **kwargs)
     finally:
-        conn.close()      
+        db_pool.release_connection(conn)
         
-def create_tunes_table_sqlite(conn):
-    """Create tunes table in SQLite if needed."""
+def create_tunes_table_sqlite(conn, with_indexes: bool = True):
+    """
+    Create tunes table in SQLite if needed.
+    Bulk loads pass with_indexes=False and call
+    create_tunes_indexes_sqlite() once the rows are in.
+    """
     sql = """
     CREATE TABLE IF NOT EXISTS tunes (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -62,13 +92,201 @@ def create_tunes_table_sqlite(conn):
         r TEXT,
         m TEXT,
         k TEXT,
-        body TEXT
+        body TEXT,
+        tonic TEXT,
+        mode TEXT,
+        meter_num INTEGER,
+        meter_den INTEGER,
+        rhythm TEXT,
+        body_hash TEXT
     );
     """
     cursor = conn.cursor()
     cursor.execute(sql)
     conn.commit()
     cursor.close()
+    upgrade_tunes_table(conn)
+    if with_indexes:
+        create_tunes_indexes_sqlite(conn)
+        create_search_index_sqlite(conn)
+
+
+def create_tunes_indexes_sqlite(conn):
+    """Create the secondary indexes on the SQLite tunes table."""
+    cursor = conn.cursor()
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tunes_book_file ON tunes (book, filename);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tunes_key ON tunes (tonic, mode);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tunes_meter ON tunes (meter_num, meter_den);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tunes_rhythm ON tunes (rhythm);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tunes_title ON tunes (t, id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tunes_body_hash ON tunes (body_hash);")
+    # covering indexes for the GROUP BY queries in db_stats
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tunes_k ON tunes (k);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tunes_m ON tunes (m);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tunes_book_m ON tunes (book, m);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tunes_rhythm_k ON tunes (rhythm, k);")
+    conn.commit()
+    cursor.close()
+
+
+def has_search_index(conn) -> bool:
+    """True if the full-text index exists (tunes_fts in SQLite, FULLTEXT in MySQL)."""
+    if is_sqlite_connection(conn):
+        row = fetch_one(conn, "SELECT 1 FROM sqlite_master WHERE name = 'tunes_fts';", use_cache=False)
+    else:
+        row = fetch_one(
+            conn,
+            "SELECT 1 FROM information_schema.STATISTICS "
+            "WHERE table_schema = DATABASE() AND table_name = 'tunes' AND index_name = 'ft_tunes_t';",
+            use_cache=False
+        )
+    return row is not None
+
+
+def create_search_index_sqlite(conn):
+    """
+    Create the tunes_fts FTS5 index over title and body if needed.
+    It is an external-content table (the text lives only in tunes) kept
+    in sync by triggers; when it is first created it is filled from
+    the rows already in tunes. With compressed bodies SQLite cannot read
+    the body text itself, so there are no triggers and the index is
+    filled and maintained from Python instead. Compressed databases also
+    keep only the columns each word occurs in, not its positions
+    (detail=column), which roughly halves the index; searches never use
+    phrases of several words.
+    """
+    if has_search_index(conn):
+        return
+    compressed = get_body_storage(conn) == "zlib"
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+        CREATE VIRTUAL TABLE tunes_fts USING fts5(
+            t, body,
+            content='tunes', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'{", detail=column" if compressed else ""}
+        );
+        """)
+    except sqlite3.OperationalError as err:
+        # SQLite built without FTS5: searches fall back to LIKE
+        print("Full-text index not available:", err)
+        cursor.close()
+        return
+    if compressed:
+        cursor.close()
+        fill_search_index_compressed(conn)
+        conn.commit()
+        return
+    cursor.execute("""
+    CREATE TRIGGER tunes_fts_ai AFTER INSERT ON tunes BEGIN
+        INSERT INTO tunes_fts (rowid, t, body) VALUES (new.id, new.t, new.body);
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER tunes_fts_ad AFTER DELETE ON tunes BEGIN
+        INSERT INTO tunes_fts (tunes_fts, rowid, t, body) VALUES ('delete', old.id, old.t, old.body);
+    END;
+    """)
+    cursor.execute("""
+    CREATE TRIGGER tunes_fts_au AFTER UPDATE OF t, body ON tunes BEGIN
+        INSERT INTO tunes_fts (tunes_fts, rowid, t, body) VALUES ('delete', old.id, old.t, old.body);
+        INSERT INTO tunes_fts (rowid, t, body) VALUES (new.id, new.t, new.body);
+    END;
+    """)
+    cursor.execute("INSERT INTO tunes_fts (tunes_fts) VALUES ('rebuild');")
+    conn.commit()
+    cursor.close()
+
+
+def drop_search_index_sqlite(conn):
+    """Drop tunes_fts and its triggers. No commit."""
+    cursor = conn.cursor()
+    for trigger in ("tunes_fts_ai", "tunes_fts_ad", "tunes_fts_au"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+    cursor.execute("DROP TABLE IF EXISTS tunes_fts;")
+    cursor.close()
+
+
+def get_body_storage(conn) -> str:
+    """
+    How this database stores tune bodies: 'plain' (tunes.body) or 'zlib'
+    (compressed in tune_bodies). Only SQLite databases can be 'zlib'.
+    """
+    if not is_sqlite_connection(conn):
+        return "plain"
+    try:
+        row = fetch_one(conn, "SELECT value FROM db_meta WHERE name = 'body_storage';", use_cache=False)
+    except sqlite3.Error:
+        return "plain"
+    return row[0] if row else "plain"
+
+
+def compress_body(body: str) -> bytes:
+    return zlib.compress((body or "").encode("utf-8"), configurations.BODY_COMPRESSION_LEVEL)
+
+
+def decompress_body(blob) -> str:
+    return zlib.decompress(blob).decode("utf-8") if blob else ""
+
+
+def prepare_body_storage_sqlite(conn, storage: str):
+    """
+    Set up an emptied SQLite tunes table for the given body storage:
+    record it in db_meta, create or empty tune_bodies and recreate the
+    full-text index to match. Commits.
+    """
+    drop_search_index_sqlite(conn)
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS tune_bodies;")
+    if storage == "zlib":
+        cursor.execute("CREATE TABLE tune_bodies (hash TEXT PRIMARY KEY, body BLOB NOT NULL);")
+    cursor.execute("REPLACE INTO db_meta (name, value) VALUES ('body_storage', ?);", (storage,))
+    conn.commit()
+    cursor.close()
+
+
+def fill_search_index_compressed(conn):
+    """Index every tune in tunes_fts, reading bodies from tune_bodies. No commit."""
+    cursor = conn.cursor()
+    rows = conn.execute(
+        "SELECT tn.id, tn.t, b.body FROM tunes tn JOIN tune_bodies b ON b.hash = tn.body_hash;"
+    )
+    while True:
+        batch = rows.fetchmany(configurations.INSERT_BATCH_SIZE)
+        if not batch:
+            break
+        cursor.executemany(
+            "INSERT INTO tunes_fts (rowid, t, body) VALUES (?, ?, ?);",
+            [(tune_id, title, decompress_body(blob)) for tune_id, title, blob in batch],
+        )
+    rows.close()
+    cursor.close()
+
+
+def fetch_tune_bodies(conn, tune_ids, use_cache: bool = True) -> dict:
+    """Return {id: body text} for the given tune ids, decompressing if needed."""
+    ids = [int(tune_id) for tune_id in tune_ids]
+    if not ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(ids))
+    if get_body_storage(conn) == "zlib":
+        rows = fetch_all(
+            conn,
+            f"SELECT tn.id, b.body FROM tunes tn JOIN tune_bodies b ON b.hash = tn.body_hash "
+            f"WHERE tn.id IN ({placeholders});",
+            tuple(ids),
+            use_cache=use_cache
+        )
+        return {tune_id: decompress_body(blob) for tune_id, blob in rows}
+    rows = fetch_all(conn, f"SELECT id, body FROM tunes WHERE id IN ({placeholders});", tuple(ids),
+                     use_cache=use_cache)
+    return dict(rows)
+
+
+def fetch_tune_body(conn, tune_id) -> Optional[str]:
+    """Body text of one tune, or None if there is no such tune."""
+    return fetch_tune_bodies(conn, [tune_id]).get(int(tune_id))
 
 
 def clear_tunes_table_sqlite(conn):
@@ -79,30 +297,135 @@ def clear_tunes_table_sqlite(conn):
     cursor.close()
 
 
-def insert_tunes_sqlite(conn, tunes):
-    """Insert parsed tunes into the SQLite tunes table."""
+def tune_to_row(t):
+    """Turn a parsed tune (Tune or dict) into the value tuple used by the insert SQL."""
+    if isinstance(t, Tune):
+        return t.as_row()
+    return (
+        t.get("book", ""),
+        t.get("filename", ""),
+        t.get("X", ""),
+        t.get("T", ""),
+        t.get("R", ""),
+        t.get("M", ""),
+        t.get("K", ""),
+        t.get("body", ""),
+        t.get("tonic", ""),
+        t.get("mode", ""),
+        t.get("meter_num"),
+        t.get("meter_den"),
+        t.get("rhythm", ""),
+        t.get("body_hash") or tune_hash(t.get("body", ""), t.get("K", ""))
+    )
+
+
+def insert_rows_in_batches(conn, sql, tunes, commit: bool = True, batch_size: Optional[int] = None) -> int:
+    """
+    Consume tunes lazily and insert them batch_size rows at a time,
+    committing after each batch when commit is True.
+    Returns the number of rows inserted.
+    """
+    batch_size = batch_size or configurations.INSERT_BATCH_SIZE
+    rows = map(tune_to_row, tunes)
+    cursor = conn.cursor()
+    total = 0
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            cursor.executemany(sql, batch)
+            total += len(batch)
+            if commit:
+                conn.commit()
+    finally:
+        cursor.close()
+    return total
+
+
+@perf.timed("db.insert_tunes_sqlite")
+def insert_tunes_sqlite(conn, tunes, commit: bool = True, batch_size: Optional[int] = None):
+    """
+    Insert parsed tunes into the SQLite tunes table.
+    tunes can be any iterable (e.g. abc_parser.iter_all_tunes()).
+    """
+    if get_body_storage(conn) == "zlib":
+        return insert_tunes_compressed_sqlite(conn, tunes, commit, batch_size)
     sql = """
-    INSERT INTO tunes (book, filename, x, t, r, m, k, body)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?);
-    """
-    rows = [
-        (
-            t.get("book", ""),
-            t.get("filename", ""),
-            t.get("X", ""),
-            t.get("T", ""),
-            t.get("R", ""),
-            t.get("M", ""),
-            t.get("K", ""),
-            t.get("body", "")
-        )
-        for t in tunes
-    ]
+    INSERT INTO tunes (book, filename, x, t, r, m, k, body, tonic, mode, meter_num, meter_den, rhythm, body_hash)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+    """
+    return insert_rows_in_batches(conn, sql, tunes, commit, batch_size)
+
+
+@perf.timed("db.insert_tunes_compressed_sqlite")
+def insert_tunes_compressed_sqlite(conn, tunes, commit: bool = True, batch_size: Optional[int] = None) -> int:
+    """
+    Insert tunes into a SQLite database with zlib body storage: the tunes
+    row gets an empty body and tune_bodies the compressed text, stored
+    once per body_hash however many copies of the tune there are.
+    tunes_fts (if present) indexes the stored text of each tune's hash.
+    Ids are assigned here so the tunes and tunes_fts rows can share them.
+    """
+    batch_size = batch_size or configurations.INSERT_BATCH_SIZE
+    with_fts = has_search_index(conn)
+    next_id = 1 + fetch_one(
+        conn,
+        "SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'tunes'), 0), "
+        "COALESCE((SELECT MAX(id) FROM tunes), 0));",
+        use_cache=False
+    )[0]
+    rows = map(tune_to_row, tunes)
     cursor = conn.cursor()
-    cursor.executemany(sql, rows)
-    conn.commit()
-    cursor.close()
-    
+    total = 0
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            ids = range(next_id, next_id + len(batch))
+            next_id += len(batch)
+            cursor.executemany(
+                "INSERT INTO tunes (id, book, filename, x, t, r, m, k, body, tonic, mode, meter_num, meter_den, "
+                "rhythm, body_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, '', ?, ?, ?, ?, ?, ?);",
+                [(tune_id,) + row[:7] + row[8:] for tune_id, row in zip(ids, batch)],
+            )
+            stored = stored_bodies(conn, {row[13] for row in batch}, decode=with_fts)
+            new_bodies = []
+            for row in batch:
+                if row[13] not in stored:
+                    stored[row[13]] = row[7]
+                    new_bodies.append((row[13], compress_body(row[7])))
+            cursor.executemany("INSERT INTO tune_bodies (hash, body) VALUES (?, ?);", new_bodies)
+            if with_fts:
+                cursor.executemany(
+                    "INSERT INTO tunes_fts (rowid, t, body) VALUES (?, ?, ?);",
+                    [(tune_id, row[3], stored[row[13]]) for tune_id, row in zip(ids, batch)],
+                )
+            total += len(batch)
+            if commit:
+                conn.commit()
+    finally:
+        cursor.close()
+    return total
+
+
+def stored_bodies(conn, hashes, decode: bool = True) -> dict:
+    """
+    Return {hash: body text} for the hashes already in tune_bodies
+    (with decode=False the values are None; only membership is needed).
+    """
+    hashes = list(hashes)
+    if not hashes:
+        return {}
+    placeholders = ", ".join(["?"] * len(hashes))
+    column = "body" if decode else "NULL"
+    rows = fetch_all(
+        conn, f"SELECT hash, {column} FROM tune_bodies WHERE hash IN ({placeholders});", tuple(hashes),
+        use_cache=False
+    )
+    return {body_hash: decompress_body(blob) if decode else None for body_hash, blob in rows}
+
 def create_tunes_table_mysql(conn):
     """Create tunes table in MySQL if needed."""
     sql = """
@@ -115,95 +438,1202 @@ def create_tunes_table_mysql(conn):
         r VARCHAR(100),
         m VARCHAR(50),
         k VARCHAR(50),
-        body TEXT
+        body TEXT,
+        tonic VARCHAR(4),
+        mode VARCHAR(8),
+        meter_num SMALLINT,
+        meter_den SMALLINT,
+        rhythm VARCHAR(100),
+        body_hash CHAR(40)
     );
     """
     cursor = conn.cursor()
     cursor.execute(sql)
     conn.commit()
     cursor.close()
+    upgrade_tunes_table(conn)
+    create_tunes_indexes_mysql(conn)
+    create_search_index_mysql(conn)
+
+
+MYSQL_INDEXES = {
+    "idx_tunes_book_file": "(book, filename)",
+    "idx_tunes_key": "(tonic, mode)",
+    "idx_tunes_meter": "(meter_num, meter_den)",
+    "idx_tunes_rhythm": "(rhythm)",
+    "idx_tunes_title": "(t(100), id)",
+    "idx_tunes_body_hash": "(body_hash)",
+    # covering indexes for the GROUP BY queries in db_stats
+    "idx_tunes_k": "(k)",
+    "idx_tunes_m": "(m)",
+    "idx_tunes_book_m": "(book, m)",
+    "idx_tunes_rhythm_k": "(rhythm, k)",
+}
+
+
+MYSQL_FULLTEXT_INDEXES = {
+    "ft_tunes_t": "t",
+    "ft_tunes_body": "body",
+}
+
+
+def create_tunes_indexes_mysql(conn):
+    """Add any secondary index from MYSQL_INDEXES the MySQL tunes table lacks."""
+    existing = {
+        row[0] for row in fetch_all(
+            conn,
+            "SELECT DISTINCT index_name FROM information_schema.STATISTICS "
+            "WHERE table_schema = DATABASE() AND table_name = 'tunes';",
+            use_cache=False
+        )
+    }
+    missing = [f"ADD INDEX {name} {columns}" for name, columns in MYSQL_INDEXES.items() if name not in existing]
+    if not missing:
+        return
+    cursor = conn.cursor()
+    cursor.execute(f"ALTER TABLE tunes {', '.join(missing)};")
+    conn.commit()
+    cursor.close()
+
+
+def create_search_index_mysql(conn):
+    """Add the FULLTEXT indexes to a tunes table created before they existed."""
+    if has_search_index(conn):
+        return
+    cursor = conn.cursor()
+    cursor.execute("ALTER TABLE tunes "
+                   + ", ".join(f"ADD FULLTEXT INDEX {name} ({column})"
+                               for name, column in MYSQL_FULLTEXT_INDEXES.items()) + ";")
+    conn.commit()
+    cursor.close()
 
 
-def clear_tunes_table_mysql(conn):
+def clear_tunes_table_mysql(conn, commit: bool = True):
     """Delete all rows from the MySQL tunes table."""
     cursor = conn.cursor()
     cursor.execute("DELETE FROM tunes;")
-    conn.commit()
+    if commit:
+        conn.commit()
     cursor.close()
 
 
-def insert_tunes_mysql(conn, tunes):
-    """Insert parsed tunes into the MySQL tunes table."""
+@perf.timed("db.insert_tunes_mysql")
+def insert_tunes_mysql(conn, tunes, commit: bool = True, batch_size: Optional[int] = None):
+    """
+    Insert parsed tunes into the MySQL tunes table.
+    tunes can be any iterable (e.g. abc_parser.iter_all_tunes()).
+    """
     sql = """
-    INSERT INTO tunes (book, filename, x, t, r, m, k, body)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
-    """
-    rows = [
-        (
-            t.get("book", ""),
-            t.get("filename", ""),
-            t.get("X", ""),
-            t.get("T", ""),
-            t.get("R", ""),
-            t.get("M", ""),
-            t.get("K", ""),
-            t.get("body", "")
-        )
-        for t in tunes
-    ]
+    INSERT INTO tunes (book, filename, x, t, r, m, k, body, tonic, mode, meter_num, meter_den, rhythm, body_hash)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+    """
+    return insert_rows_in_batches(conn, sql, tunes, commit, batch_size)
+
+
+# tunes columns in tune_to_row order
+TUNE_COLUMNS = ("book", "filename", "x", "t", "r", "m", "k", "body",
+                "tonic", "mode", "meter_num", "meter_den", "rhythm", "body_hash")
+# tables a bulk MySQL rebuild loads as <table>_staging and swaps in
+MYSQL_STAGED_TABLES = ("tunes", "tune_melody", "melody_buckets", "tune_notes")
+MYSQL_STAGING_SUFFIX = "_staging"
+MYSQL_OLD_SUFFIX = "_old"
+
+
+def mysql_insert_budget(conn) -> int:
+    """
+    Bytes one multi-row INSERT may take: half the server's
+    max_allowed_packet (escaping can double a value), capped at
+    configurations.MYSQL_MAX_INSERT_BYTES.
+    """
+    row = fetch_one(conn, "SELECT @@max_allowed_packet;", use_cache=False)
+    packet = int(row[0]) if row and row[0] else 4 * 2**20
+    return max(64 * 1024, min(packet // 2, configurations.MYSQL_MAX_INSERT_BYTES))
+
+
+def row_bytes(row) -> int:
+    """Rough size of a row inside an INSERT statement."""
+    return sum(len(value.encode("utf-8")) if isinstance(value, str) else 8 for value in row) + 4 * len(row)
+
+
+def packet_sized_groups(rows, budget: int):
+    """
+    Group rows so the estimated size of each group stays within budget.
+    A row bigger than budget on its own gets a group to itself.
+    """
+    group, size = [], 0
+    for row in rows:
+        row_size = row_bytes(row)
+        if group and size + row_size > budget:
+            yield group
+            group, size = [], 0
+        group.append(row)
+        size += row_size
+    if group:
+        yield group
+
+
+@perf.timed("db.insert_tunes_mysql_bulk")
+def insert_tunes_mysql_bulk(conn, tunes, table: str, budget: int) -> int:
+    """
+    Insert tunes into table with one multi-row INSERT per group of
+    packet_sized_groups(). No commit. Returns the number of rows.
+    """
+    row_sql = "(" + ", ".join(["%s"] * len(TUNE_COLUMNS)) + ")"
+    cursor = conn.cursor()
+    total = 0
+    try:
+        for group in packet_sized_groups(map(tune_to_row, tunes), budget):
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(TUNE_COLUMNS)}) VALUES {', '.join([row_sql] * len(group))};",
+                [value for row in group for value in row],
+            )
+            total += len(group)
+    finally:
+        cursor.close()
+    return total
+
+
+def mysql_table_indexes(conn, table: str):
+    """Names of the secondary (non-primary) indexes of a MySQL table."""
+    return [row[0] for row in fetch_all(
+        conn,
+        "SELECT DISTINCT index_name FROM information_schema.STATISTICS "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND index_name <> 'PRIMARY';",
+        (table,),
+        use_cache=False
+    )]
+
+
+def rebuild_mysql_bulk(files, workers: Optional[int] = None, report=None):
+    """
+    Build complete MySQL tunes and melodic index tables as
+    MYSQL_STAGED_TABLES copies and swap them in with one atomic RENAME
+    TABLE.
+
+    The staging tunes table is a copy of the tunes definition with its
+    secondary and FULLTEXT indexes dropped (the InnoDB way of disabling
+    keys); rows go in as packet-sized multi-row INSERTs with unique and
+    foreign key checks off, and the indexes are added back in one pass
+    once the rows are in. Each batch's melodic index rows, computed by
+    the parser workers, go into the staging melodic tables alongside.
+    Readers keep using the old tables until the rename; if the load
+    fails or is cancelled the staging tables are dropped and the old
+    ones are left untouched. The manifest and tune_summary are then
+    refreshed in one transaction.
+    """
+    conn = open_target_connection("mysql")
+    if conn is None:
+        return
+    staging = "tunes" + MYSQL_STAGING_SUFFIX
+    staging_tables = ", ".join(table + MYSQL_STAGING_SUFFIX for table in MYSQL_STAGED_TABLES)
+    old_tables = ", ".join(table + MYSQL_OLD_SUFFIX for table in MYSQL_STAGED_TABLES)
+    report = report or progress_reporter()
+    cursor = conn.cursor()
+    swapped = False
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS {staging_tables}, {old_tables};")
+        for table in MYSQL_STAGED_TABLES:
+            cursor.execute(f"CREATE TABLE {table}{MYSQL_STAGING_SUFFIX} LIKE {table};")
+        indexes = mysql_table_indexes(conn, staging)
+        if indexes:
+            cursor.execute(f"ALTER TABLE {staging} {', '.join(f'DROP INDEX {name}' for name in indexes)};")
+
+        cursor.execute("SET SESSION unique_checks = 0, foreign_key_checks = 0;")
+        budget = mysql_insert_budget(conn)
+        file_list = [(book, fname, path) for (book, fname), (path, _m, _s) in files.items()]
+        inserted = last_id = 0
+        for batch in iter_tune_batches(file_list, workers=workers, progress=report, with_melody=True):
+            inserted += insert_tunes_mysql_bulk(conn, batch, staging, budget)
+            ids = inserted_ids(conn, staging, last_id, len(batch))
+            insert_melodies(conn, batch, ids, MYSQL_STAGING_SUFFIX)
+            last_id = ids[-1]
+            conn.commit()
+            perf.count("db.rows_inserted", len(batch))
+            report("insert", inserted)
+        cursor.execute("SET SESSION unique_checks = 1, foreign_key_checks = 1;")
+
+        cursor.execute(f"ALTER TABLE {staging} "
+                       + ", ".join(f"ADD INDEX {name} {columns}" for name, columns in MYSQL_INDEXES.items()) + ";")
+        # InnoDB builds one FULLTEXT index per statement
+        for name, column in MYSQL_FULLTEXT_INDEXES.items():
+            cursor.execute(f"ALTER TABLE {staging} ADD FULLTEXT INDEX {name} ({column});")
+
+        cursor.execute("RENAME TABLE " + ", ".join(
+            f"{table} TO {table}{MYSQL_OLD_SUFFIX}, {table}{MYSQL_STAGING_SUFFIX} TO {table}"
+            for table in MYSQL_STAGED_TABLES
+        ) + ";")
+        swapped = True
+        cursor.execute(f"DROP TABLE {old_tables};")
+        finish_load(conn, files)
+    except BaseException:
+        conn.rollback()
+        if not swapped:
+            cursor.execute("SET SESSION unique_checks = 1, foreign_key_checks = 1;")
+            cursor.execute(f"DROP TABLE IF EXISTS {staging_tables};")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+FACET_COLUMNS = {
+    "tonic": ("TEXT", "VARCHAR(4)"),
+    "mode": ("TEXT", "VARCHAR(8)"),
+    "meter_num": ("INTEGER", "SMALLINT"),
+    "meter_den": ("INTEGER", "SMALLINT"),
+    "rhythm": ("TEXT", "VARCHAR(100)"),
+    "body_hash": ("TEXT", "CHAR(40)"),
+}
+
+
+def upgrade_tunes_table(conn, verbose: bool = True):
+    """
+    Add the normalized facet columns and body_hash to a tunes table
+    created by an older version and fill them from the existing k/m/r
+    values and bodies, so an old database works without a full rebuild.
+    """
+    sqlite = is_sqlite_connection(conn)
+    if sqlite:
+        existing = {row[1] for row in fetch_all(conn, "PRAGMA table_info(tunes);", use_cache=False)}
+    else:
+        existing = {
+            row[0] for row in fetch_all(
+                conn,
+                "SELECT column_name FROM information_schema.COLUMNS "
+                "WHERE table_schema = DATABASE() AND table_name = 'tunes';",
+                use_cache=False
+            )
+        }
+    missing = [name for name in FACET_COLUMNS if name not in existing]
+    if not missing:
+        return
+
+    if verbose:
+        print(f"Upgrading tunes table: adding {', '.join(missing)}...")
+    cursor = conn.cursor()
+    for name in missing:
+        sqlite_type, mysql_type = FACET_COLUMNS[name]
+        cursor.execute(f"ALTER TABLE tunes ADD COLUMN {name} {sqlite_type if sqlite else mysql_type};")
+    # compressed databases from before body_hash kept tune_bodies by tune id
+    rekey_bodies = "body_hash" in missing and get_body_storage(conn) == "zlib"
+    if rekey_bodies:
+        bodies = {tune_id: decompress_body(blob)
+                  for tune_id, blob in fetch_all(conn, "SELECT id, body FROM tune_bodies;", use_cache=False)}
+    rows = fetch_all(conn, "SELECT id, k, m, r, body FROM tunes;", use_cache=False)
+    updates = []
+    for tune_id, k, m, r, body in rows:
+        tonic, mode = normalize_key(k or "")
+        meter_num, meter_den = normalize_meter(m or "")
+        if rekey_bodies:
+            body = bodies.get(tune_id, "")
+        updates.append((tonic, mode, meter_num, meter_den, normalize_rhythm(r or ""),
+                        tune_hash(body or "", k or ""), tune_id))
+    cursor.executemany(
+        prepare_sql("UPDATE tunes SET tonic = %s, mode = %s, meter_num = %s, meter_den = %s, rhythm = %s, "
+                    "body_hash = %s WHERE id = %s;", conn),
+        updates,
+    )
+    if rekey_bodies:
+        unique = {}
+        for update in updates:
+            unique.setdefault(update[5], bodies.get(update[6], ""))
+        drop_search_index_sqlite(conn)
+        cursor.execute("DROP TABLE tune_bodies;")
+        cursor.execute("CREATE TABLE tune_bodies (hash TEXT PRIMARY KEY, body BLOB NOT NULL);")
+        cursor.executemany("INSERT INTO tune_bodies (hash, body) VALUES (?, ?);",
+                           [(body_hash, compress_body(body)) for body_hash, body in unique.items()])
+    conn.commit()
+    cursor.close()
+
+
+_upgraded = set()
+_upgrade_lock = threading.Lock()
+
+
+def upgrade_on_open(conn):
+    """
+    Run upgrade_tunes_table the first time this process opens a
+    connection to a database, so searches that rely on the facet columns
+    and body_hash also work on a database from an older version that was
+    never rebuilt or synced. It runs quietly: stdout may be a query
+    script's result stream.
+    """
+    if is_sqlite_connection(conn):
+        key = ("sqlite", db_generations.current_path())
+    else:
+        key = ("mysql", configurations.MYSQL_CONFIG.get("host"), configurations.MYSQL_CONFIG.get("database"))
+    if key in _upgraded:
+        return
+    with _upgrade_lock:
+        if key in _upgraded:
+            return
+        if table_exists(conn, "tunes"):
+            upgrade_tunes_table(conn, verbose=False)
+        _upgraded.add(key)
+
+
+def create_manifest_table(conn):
+    """
+    Create the abc_files manifest table (and the small db_meta table) if needed.
+    The manifest remembers which version of each .abc file is currently loaded.
+    """
+    if is_sqlite_connection(conn):
+        sql = """
+        CREATE TABLE IF NOT EXISTS abc_files (
+            book TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            mtime_ns INTEGER,
+            size INTEGER,
+            sha1 TEXT,
+            PRIMARY KEY (book, filename)
+        );
+        """
+    else:
+        sql = """
+        CREATE TABLE IF NOT EXISTS abc_files (
+            book VARCHAR(100) NOT NULL,
+            filename VARCHAR(200) NOT NULL,
+            mtime_ns BIGINT,
+            size BIGINT,
+            sha1 CHAR(40),
+            PRIMARY KEY (book, filename)
+        );
+        """
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    if is_sqlite_connection(conn):
+        cursor.execute("CREATE TABLE IF NOT EXISTS db_meta (name TEXT PRIMARY KEY, value TEXT);")
+    else:
+        cursor.execute("CREATE TABLE IF NOT EXISTS db_meta (name VARCHAR(50) PRIMARY KEY, value VARCHAR(100));")
+    conn.commit()
+    cursor.close()
+
+
+# materialized counts kept in tune_summary: dimension name -> tunes columns
+SUMMARY_DIMENSIONS = {
+    "total": (),
+    "book": ("book",),
+    "k": ("k",),
+    "m": ("m",),
+    "rhythm": ("rhythm",),
+    "book|k": ("book", "k"),
+    "book|m": ("book", "m"),
+    "book|rhythm": ("book", "rhythm"),
+    "k|m": ("k", "m"),
+    "rhythm|k": ("rhythm", "k"),
+    "rhythm|m": ("rhythm", "m"),
+}
+
+
+def create_summary_table(conn):
+    """
+    Create the tune_summary table of precomputed counts if needed and
+    fill it when it is new but tunes already has rows.
+    Each row is (dim, v1, v2, tunes), e.g. ('rhythm|k', 'reel', 'D', 381);
+    ('distinct', '', '') holds the number of distinct tunes.
+    """
+    if is_sqlite_connection(conn):
+        sql = """
+        CREATE TABLE IF NOT EXISTS tune_summary (
+            dim TEXT NOT NULL,
+            v1 TEXT NOT NULL,
+            v2 TEXT NOT NULL,
+            tunes INTEGER NOT NULL,
+            PRIMARY KEY (dim, v1, v2)
+        );
+        """
+    else:
+        sql = """
+        CREATE TABLE IF NOT EXISTS tune_summary (
+            dim VARCHAR(20) NOT NULL,
+            v1 VARCHAR(200) NOT NULL,
+            v2 VARCHAR(200) NOT NULL,
+            tunes INT NOT NULL,
+            PRIMARY KEY (dim, v1, v2)
+        );
+        """
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    conn.commit()
+    cursor.close()
+    if fetch_one(conn, "SELECT 1 FROM tunes LIMIT 1;", use_cache=False) is None:
+        return
+    if fetch_one(conn, "SELECT 1 FROM tune_summary WHERE dim = 'total';", use_cache=False) is None:
+        refresh_summary(conn)
+        conn.commit()
+    elif fetch_one(conn, "SELECT 1 FROM tune_summary WHERE dim = 'distinct';", use_cache=False) is None:
+        # filled by a version that did not count distinct tunes yet
+        refresh_distinct_count(conn)
+        conn.commit()
+
+
+def has_summary(conn) -> bool:
+    """True if tune_summary exists and has been filled."""
+    if is_sqlite_connection(conn):
+        row = fetch_one(conn, "SELECT 1 FROM sqlite_master WHERE name = 'tune_summary';", use_cache=False)
+    else:
+        row = fetch_one(
+            conn,
+            "SELECT 1 FROM information_schema.TABLES "
+            "WHERE table_schema = DATABASE() AND table_name = 'tune_summary';",
+            use_cache=False
+        )
+    if row is None:
+        return False
+    return fetch_one(conn, "SELECT 1 FROM tune_summary WHERE dim = 'total';", use_cache=False) is not None
+
+
+def refresh_summary(conn):
+    """Recompute every tune_summary row from tunes with GROUP BY. No commit."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM tune_summary;")
+    for dim, columns in SUMMARY_DIMENSIONS.items():
+        values = [f"COALESCE({column}, '')" for column in columns] + ["''"] * (2 - len(columns))
+        group_by = f" GROUP BY {', '.join(columns)}" if columns else ""
+        cursor.execute(
+            f"INSERT INTO tune_summary (dim, v1, v2, tunes) "
+            f"SELECT '{dim}', {values[0]}, {values[1]}, COUNT(*) FROM tunes{group_by};"
+        )
+    cursor.close()
+    refresh_distinct_count(conn)
+
+
+def refresh_distinct_count(conn):
+    """
+    Store the number of distinct tunes (body_hash values) as the
+    ('distinct', '', '') tune_summary cell. No commit.
+    """
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM tune_summary WHERE dim = 'distinct';")
+    cursor.execute("INSERT INTO tune_summary (dim, v1, v2, tunes) "
+                   "SELECT 'distinct', '', '', COUNT(DISTINCT body_hash) FROM tunes;")
+    cursor.close()
+
+
+def count_file_hashes(conn, keys) -> Counter:
+    """body_hash -> number of tunes with it in the given (book, filename) files."""
+    counts = Counter()
+    for book, filename in keys:
+        counts.update(row[0] for row in fetch_all(
+            conn, "SELECT body_hash FROM tunes WHERE book = %s AND filename = %s;", (book, filename),
+            use_cache=False
+        ) if row[0])
+    return counts
+
+
+def distinct_count_delta(conn, old: Counter, new: Counter) -> int:
+    """
+    How the number of distinct body_hash values changed when the tunes
+    counted in old (read before a sync deleted them) were replaced by
+    those counted in new (read after it inserted them). Only the hashes
+    involved are looked up, so the cost follows the size of the change.
+    """
+    hashes = list(set(old) | set(new))
+    totals = Counter()
+    batch_size = configurations.INSERT_BATCH_SIZE
+    for start in range(0, len(hashes), batch_size):
+        chunk = hashes[start:start + batch_size]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        totals.update(dict(fetch_all(
+            conn, f"SELECT body_hash, COUNT(*) FROM tunes WHERE body_hash IN ({placeholders}) GROUP BY body_hash;",
+            tuple(chunk), use_cache=False
+        )))
+    delta = 0
+    for body_hash in hashes:
+        elsewhere = totals[body_hash] - new[body_hash]  # copies outside the synced files
+        delta += (totals[body_hash] > 0) - (elsewhere + old[body_hash] > 0)
+    return delta
+
+
+def count_summary_rows(conn, keys) -> Counter:
+    """
+    Count the summary cells that the tunes of the given (book, filename)
+    files contribute to. Used to adjust tune_summary incrementally.
+    """
+    counts = Counter()
+    for book, filename in keys:
+        rows = fetch_all(
+            conn,
+            "SELECT book, k, m, rhythm FROM tunes WHERE book = %s AND filename = %s;",
+            (book, filename),
+            use_cache=False
+        )
+        for row in rows:
+            values = dict(zip(("book", "k", "m", "rhythm"), (value or "" for value in row)))
+            for dim, columns in SUMMARY_DIMENSIONS.items():
+                cell = [values[column] for column in columns] + [""] * (2 - len(columns))
+                counts[(dim, cell[0], cell[1])] += 1
+    return counts
+
+
+def apply_summary_delta(conn, delta: Counter):
+    """Add delta[(dim, v1, v2)] to tune_summary and drop cells that reach zero. No commit."""
+    rows = [(dim, v1, v2, change) for (dim, v1, v2), change in delta.items() if change]
+    if not rows:
+        return
+    if is_sqlite_connection(conn):
+        sql = ("INSERT INTO tune_summary (dim, v1, v2, tunes) VALUES (?, ?, ?, ?) "
+               "ON CONFLICT (dim, v1, v2) DO UPDATE SET tunes = tunes + excluded.tunes;")
+    else:
+        sql = ("INSERT INTO tune_summary (dim, v1, v2, tunes) VALUES (%s, %s, %s, %s) "
+               "ON DUPLICATE KEY UPDATE tunes = tunes + VALUES(tunes);")
     cursor = conn.cursor()
     cursor.executemany(sql, rows)
+    cursor.execute("DELETE FROM tune_summary WHERE tunes <= 0;")
+    cursor.close()
+
+
+def create_melody_tables(conn):
+    """
+    Create the melodic tables if needed: tune_melody holds each tune's
+    MinHash signature, melody_buckets its LSH bucket per band and
+    tune_notes its note events packed as abc_notes.EVENT_DTYPE. Filled
+    when they are new but tunes already has rows.
+    """
+    cursor = conn.cursor()
+    if is_sqlite_connection(conn):
+        cursor.execute("CREATE TABLE IF NOT EXISTS tune_melody (id INTEGER PRIMARY KEY, signature BLOB NOT NULL);")
+        cursor.execute("CREATE TABLE IF NOT EXISTS tune_notes (id INTEGER PRIMARY KEY, events BLOB NOT NULL);")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS melody_buckets (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            id INTEGER NOT NULL,
+            PRIMARY KEY (band, bucket, id)
+        ) WITHOUT ROWID;
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_melody_buckets_id ON melody_buckets (id);")
+    else:
+        cursor.execute("CREATE TABLE IF NOT EXISTS tune_melody (id INT PRIMARY KEY, signature VARBINARY(128) NOT NULL);")
+        cursor.execute("CREATE TABLE IF NOT EXISTS tune_notes (id INT PRIMARY KEY, events MEDIUMBLOB NOT NULL);")
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS melody_buckets (
+            band TINYINT NOT NULL,
+            bucket BIGINT NOT NULL,
+            id INT NOT NULL,
+            PRIMARY KEY (band, bucket, id),
+            INDEX idx_melody_buckets_id (id)
+        );
+        """)
     conn.commit()
     cursor.close()
-    
-def rebuild_database(target: Optional[str] = None):
+    empty = any(fetch_one(conn, f"SELECT 1 FROM {table} LIMIT 1;", use_cache=False) is None
+                for table in ("tune_melody", "tune_notes"))
+    if empty and fetch_one(conn, "SELECT 1 FROM tunes LIMIT 1;", use_cache=False) is not None:
+        refresh_melody_index(conn)
+        conn.commit()
+
+
+def table_exists(conn, name: str) -> bool:
+    if is_sqlite_connection(conn):
+        row = fetch_one(conn, "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s;", (name,),
+                        use_cache=False)
+    else:
+        row = fetch_one(
+            conn,
+            "SELECT 1 FROM information_schema.TABLES "
+            "WHERE table_schema = DATABASE() AND table_name = %s;",
+            (name,), use_cache=False
+        )
+    return row is not None
+
+
+def has_melody_index(conn) -> bool:
+    """True if the melodic similarity tables exist."""
+    return table_exists(conn, "tune_melody")
+
+
+def index_melodies(conn, tune_ids):
     """
-    Rebuild SQLite or MySQL database from ABC files.
-    - loads tunes via abc_parser.load_all_tunes()
-    - recreates tunes table
-    - clears old data
-    - inserts fresh data
+    Add the melodic signature, LSH buckets and note events of the given
+    tunes from their stored bodies. No commit. Only used to fill the
+    tables of an older database; loads and syncs get these from the
+    parser workers instead (see insert_melodies).
     """
-    target_db = (target or configurations.ACTIVE_DATABASE).strip().lower()
-    if target_db not in configurations.SUPPORTED_DATABASES:
-        print(f"Unsupported database backend: {target_db}")
+    import abc_notes  # numpy is only loaded when tunes are indexed
+
+    ids = list(tune_ids)
+    batch_size = configurations.INSERT_BATCH_SIZE
+    cursor = conn.cursor()
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        headers = {row[0]: row[1:] for row in fetch_all(
+            conn, f"SELECT id, k, m FROM tunes WHERE id IN ({placeholders});", tuple(chunk), use_cache=False
+        )}
+        bodies = fetch_tune_bodies(conn, chunk, use_cache=False)
+        indexed, shingle_sets, note_rows = [], [], []
+        for tune_id in chunk:
+            key, meter = headers.get(tune_id, ("", ""))
+            events = abc_notes.note_events(bodies.get(tune_id, ""), key or "", meter or "")
+            if len(events):
+                note_rows.append((tune_id, abc_notes.events_to_bytes(events)))
+            pitches = events["pitch"][:abc_notes.INCIPIT_NOTES].tolist()
+            shingles = abc_notes.interval_shingles(abc_notes.pitch_intervals(pitches))
+            if shingles:
+                indexed.append(tune_id)
+                shingle_sets.append(shingles)
+        signatures = abc_notes.minhash_signatures(shingle_sets)
+        cursor.executemany(
+            prepare_sql("INSERT INTO tune_melody (id, signature) VALUES (%s, %s);", conn),
+            [(tune_id, abc_notes.signature_to_bytes(signature)) for tune_id, signature in zip(indexed, signatures)],
+        )
+        cursor.executemany(
+            prepare_sql("INSERT INTO melody_buckets (band, bucket, id) VALUES (%s, %s, %s);", conn),
+            [(band, bucket, tune_id)
+             for tune_id, signature in zip(indexed, signatures)
+             for band, bucket in enumerate(abc_notes.lsh_buckets(signature))],
+        )
+        cursor.executemany(prepare_sql("INSERT INTO tune_notes (id, events) VALUES (%s, %s);", conn), note_rows)
+    cursor.close()
+
+
+def insert_melodies(conn, tunes, ids, suffix: str = ""):
+    """
+    Write the note events, signatures and LSH buckets the parser workers
+    computed for tunes (iter_tune_batches(with_melody=True)); ids are the
+    tunes' row ids in the same order and suffix selects staging tables.
+    No commit.
+    """
+    import abc_notes  # numpy is only loaded when tunes are indexed
+
+    note_rows = [(tune_id, tune.events) for tune_id, tune in zip(ids, tunes) if tune.events]
+    signed = [(tune_id, tune.signature) for tune_id, tune in zip(ids, tunes) if tune.signature]
+    cursor = conn.cursor()
+    if note_rows:
+        cursor.executemany(
+            prepare_sql(f"INSERT INTO tune_notes{suffix} (id, events) VALUES (%s, %s);", conn), note_rows
+        )
+    if signed:
+        cursor.executemany(
+            prepare_sql(f"INSERT INTO tune_melody{suffix} (id, signature) VALUES (%s, %s);", conn), signed
+        )
+        cursor.executemany(
+            prepare_sql(f"INSERT INTO melody_buckets{suffix} (band, bucket, id) VALUES (%s, %s, %s);", conn),
+            [(band, bucket, tune_id)
+             for tune_id, signature in signed
+             for band, bucket in enumerate(abc_notes.lsh_buckets(abc_notes.signature_from_bytes(signature)))],
+        )
+    cursor.close()
+
+
+def max_tune_id(conn) -> int:
+    return fetch_one(conn, "SELECT COALESCE(MAX(id), 0) FROM tunes;", use_cache=False)[0]
+
+
+def inserted_ids(conn, table: str, after_id: int, count: int) -> List[int]:
+    """
+    Ids of the count rows just inserted into table, in insertion order:
+    every id above after_id, since ids only grow and a load is the only
+    writer.
+    """
+    ids = [row[0] for row in fetch_all(
+        conn, f"SELECT id FROM {table} WHERE id > %s ORDER BY id;", (after_id,), use_cache=False
+    )]
+    if len(ids) != count:
+        raise RuntimeError(f"Expected {count} new rows in {table}, found {len(ids)}; "
+                           "was it written to by another process?")
+    return ids
+
+
+def clear_melody_index(conn):
+    """Delete every melodic index and note events row. No commit."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM tune_notes;")
+    cursor.execute("DELETE FROM melody_buckets;")
+    cursor.execute("DELETE FROM tune_melody;")
+    cursor.close()
+
+
+def refresh_melody_index(conn):
+    """Rebuild the melodic similarity index and note events for every tune. No commit."""
+    clear_melody_index(conn)
+    index_melodies(conn, [row[0] for row in fetch_all(conn, "SELECT id FROM tunes ORDER BY id;", use_cache=False)])
+
+
+def get_data_version(conn) -> Optional[str]:
+    """
+    Return the stamp written by the last rebuild or sync, or None for a
+    database built before stamps existed. Caches key on this value.
+    """
+    try:
+        row = fetch_one(conn, "SELECT value FROM db_meta WHERE name = 'data_version';", use_cache=False)
+    except db_pool.database_errors():
+        return None
+    return row[0] if row else None
+
+
+def set_data_version(conn):
+    """Record a new data version stamp. No commit."""
+    cursor = conn.cursor()
+    cursor.execute(
+        prepare_sql("REPLACE INTO db_meta (name, value) VALUES ('data_version', %s);", conn),
+        (str(time.time_ns()),),
+    )
+    cursor.close()
+
+
+def file_content_hash(path: str) -> str:
+    """Return the SHA-1 hex digest of a file's bytes."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_abc_files():
+    """Return {(book, filename): (path, mtime_ns, size)} for the books directory."""
+    files = {}
+    for book, fname, path in find_abc_files():
+        st = os.stat(path)
+        files[(book, fname)] = (path, st.st_mtime_ns, st.st_size)
+    return files
+
+
+def load_manifest(conn):
+    """Return {(book, filename): (mtime_ns, size, sha1)} from the manifest table."""
+    rows = fetch_all(conn, "SELECT book, filename, mtime_ns, size, sha1 FROM abc_files;", use_cache=False)
+    return {(book, fname): (mtime_ns, size, sha1) for book, fname, mtime_ns, size, sha1 in rows}
+
+
+def write_manifest(conn, entries):
+    """Upsert manifest rows given as (book, filename, mtime_ns, size, sha1). No commit."""
+    if not entries:
         return
+    cursor = conn.cursor()
+    cursor.executemany(
+        prepare_sql("REPLACE INTO abc_files (book, filename, mtime_ns, size, sha1) VALUES (%s, %s, %s, %s, %s);", conn),
+        entries,
+    )
+    cursor.close()
 
-    print(f"\nRebuilding {target_db.upper()} database from ABC files...\n")
-    tunes = load_all_tunes()
 
+def delete_file_rows(conn, keys):
+    """Remove tunes and manifest rows for the given (book, filename) keys. No commit."""
+    if not keys:
+        return
+    keys = list(keys)
+    compressed = get_body_storage(conn) == "zlib"
+    if compressed:
+        hashes = unindex_compressed_tunes(conn, keys)
+    cursor = conn.cursor()
+    for table in ("melody_buckets", "tune_melody", "tune_notes"):
+        cursor.executemany(
+            prepare_sql(f"DELETE FROM {table} WHERE id IN "
+                        "(SELECT id FROM tunes WHERE book = %s AND filename = %s);", conn),
+            keys,
+        )
+    cursor.executemany(prepare_sql("DELETE FROM tunes WHERE book = %s AND filename = %s;", conn), keys)
+    cursor.executemany(prepare_sql("DELETE FROM abc_files WHERE book = %s AND filename = %s;", conn), keys)
+    if compressed:
+        # drop bodies no remaining copy of the tune refers to
+        cursor.executemany(
+            "DELETE FROM tune_bodies WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM tunes WHERE body_hash = ?);",
+            [(body_hash, body_hash) for body_hash in hashes],
+        )
+    cursor.close()
+
+
+def unindex_compressed_tunes(conn, keys) -> set:
+    """
+    Remove the tunes_fts entries of the tunes in the given (book, filename)
+    files before their rows are deleted; tunes_fts needs the indexed body
+    text to delete an entry. Returns the body hashes of those tunes. No commit.
+    """
+    with_fts = has_search_index(conn)
+    hashes = set()
+    cursor = conn.cursor()
+    for book, filename in keys:
+        rows = fetch_all(
+            conn,
+            "SELECT tn.id, tn.t, tn.body_hash, b.body FROM tunes tn JOIN tune_bodies b ON b.hash = tn.body_hash "
+            "WHERE tn.book = %s AND tn.filename = %s;",
+            (book, filename),
+            use_cache=False
+        )
+        hashes.update(row[2] for row in rows)
+        if with_fts:
+            cursor.executemany(
+                "INSERT INTO tunes_fts (tunes_fts, rowid, t, body) VALUES ('delete', ?, ?, ?);",
+                [(tune_id, title, decompress_body(blob)) for tune_id, title, _hash, blob in rows],
+            )
+    cursor.close()
+    return hashes
+
+
+def open_target_connection(target_db: str):
+    """Open a connection to target_db and make sure all tables exist."""
     if target_db == "mysql":
         conn = get_mysql_connection()
         if conn is None:
-            return
+            return None
         create_tunes_table_mysql(conn)
-        clear_tunes_table_mysql(conn)
-        insert_tunes_mysql(conn, tunes)
-        conn.close()
     else:
         conn = get_sqlite_connection()
         if conn is None:
-            return
+            return None
+        # WAL lets searches read while a sync writes
+        conn.execute("PRAGMA journal_mode = WAL;")
         create_tunes_table_sqlite(conn)
-        clear_tunes_table_sqlite(conn)
-        insert_tunes_sqlite(conn, tunes)
+    create_manifest_table(conn)
+    create_summary_table(conn)
+    create_melody_tables(conn)
+    return conn
+
+
+def resolve_target(target: Optional[str]) -> Optional[str]:
+    """Normalise a backend name, falling back to the active one."""
+    target_db = (target or configurations.ACTIVE_DATABASE).strip().lower()
+    if target_db not in configurations.SUPPORTED_DATABASES:
+        print(f"Unsupported database backend: {target_db}")
+        return None
+    return target_db
+
+
+def insert_tunes(conn, tunes, commit: bool = True) -> int:
+    """Insert tunes using the insert function for conn's backend."""
+    if is_sqlite_connection(conn):
+        return insert_tunes_sqlite(conn, tunes, commit=commit)
+    return insert_tunes_mysql(conn, tunes, commit=commit)
+
+
+class RebuildCancelled(Exception):
+    """Raised inside a rebuild or sync when its cancel event is set."""
+
+
+def progress_reporter(progress=None, cancel=None):
+    """
+    Build the callback handed to the parse and insert stages.
+    It raises RebuildCancelled once cancel (a threading.Event) is set and
+    otherwise forwards (stage, done, total) to progress.
+    """
+    def report(stage, done, total=None):
+        if cancel is not None and cancel.is_set():
+            raise RebuildCancelled("Rebuild cancelled.")
+        if progress is not None:
+            progress(stage, done, total)
+    return report
+
+
+def insert_batches(conn, batches, report, commit: bool = True) -> int:
+    """
+    Insert every batch of tunes together with the melodic index rows the
+    parser workers computed for it, reporting ('insert', rows_so_far, None).
+    With commit each batch is committed on its own.
+    """
+    inserted = 0
+    last_id = max_tune_id(conn)
+    for batch in batches:
+        inserted += insert_tunes(conn, batch, commit=False)
+        ids = inserted_ids(conn, "tunes", last_id, len(batch))
+        insert_melodies(conn, batch, ids)
+        last_id = ids[-1]
+        if commit:
+            conn.commit()
+        perf.count("db.rows_inserted", len(batch))
+        report("insert", inserted)
+    return inserted
+
+
+def load_files(conn, files, workers: Optional[int] = None, commit: bool = True, report=None):
+    """
+    Parse every file in files ({(book, filename): (path, mtime_ns, size)})
+    into the empty tunes table, with the melodic index, replace the
+    manifest with them and recompute the tune_summary counts.
+    """
+    report = report or progress_reporter()
+    file_list = [(book, fname, path) for (book, fname), (path, _m, _s) in files.items()]
+    clear_melody_index(conn)
+    batches = iter_tune_batches(file_list, workers=workers, progress=report, with_melody=True)
+    insert_batches(conn, batches, report, commit)
+    finish_load(conn, files)
+
+
+def finish_load(conn, files):
+    """
+    After a full load of the tunes table: replace the manifest with files
+    and recompute the tune_summary counts, then commit.
+    """
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM abc_files;")
+    cursor.close()
+    write_manifest(conn, [
+        (book, fname, mtime_ns, size, file_content_hash(path))
+        for (book, fname), (path, mtime_ns, size) in files.items()
+    ])
+    refresh_summary(conn)
+    set_data_version(conn)
+    conn.commit()
+
+
+def rebuild_sqlite_generation(files, workers: Optional[int] = None, report=None,
+                              storage: str = "plain", bulk: bool = True):
+    """
+    Build a complete SQLite database as a new generation file next to
+    SQLITE_DB_PATH and publish it (see db_generations).
+
+    Readers keep using the previous generation while it is built, and
+    connections opened before the publish go on reading it until they
+    are closed; if the build fails or is cancelled the new file is
+    deleted and nothing changes for them. With bulk the file is private
+    until it is published, so journaling and fsyncs are switched off and
+    the page cache is enlarged, and secondary indexes and the full-text
+    index are built in one pass after the rows are loaded; without it
+    the rows go into an indexed table batch by batch. The published
+    generation runs in WAL mode. storage is its body storage ('plain' or
+    'zlib').
+    """
+    db_path = configurations.SQLITE_DB_PATH
+    path = db_generations.new_generation(db_path)
+    live = db_generations.current_path(db_path)
+    if os.path.exists(live):
+        shutil.copymode(live, path)
+    conn = None
+    published = False
+    try:
+        conn = sqlite3.connect(path)
+        if bulk:
+            conn.execute("PRAGMA journal_mode = OFF;")
+            conn.execute("PRAGMA synchronous = OFF;")
+            conn.execute("PRAGMA cache_size = -131072;")  # 128 MB
+            conn.execute("PRAGMA temp_store = MEMORY;")
+            conn.execute("PRAGMA locking_mode = EXCLUSIVE;")
+        create_tunes_table_sqlite(conn, with_indexes=not bulk)
+        create_manifest_table(conn)
+        create_summary_table(conn)
+        create_melody_tables(conn)
+        prepare_body_storage_sqlite(conn, storage)
+        if not bulk:
+            create_search_index_sqlite(conn)
+        load_files(conn, files, workers, commit=not bulk, report=report)
+        if bulk:
+            create_tunes_indexes_sqlite(conn)
+            create_search_index_sqlite(conn)
+        conn.execute("PRAGMA journal_mode = WAL;")
         conn.close()
+        conn = None
+        db_generations.publish(path, db_path)
+        published = True
+    finally:
+        if conn is not None:
+            conn.close()
+        if not published:
+            db_generations.remove_database_file(path)
+
 
+def rebuild_database(target: Optional[str] = None, incremental: bool = False,
+                     workers: Optional[int] = None, bulk: Optional[bool] = None,
+                     progress=None, cancel=None):
+    """
+    Rebuild SQLite or MySQL database from ABC files.
+    - parses the files in a process pool (abc_parser.iter_tune_batches)
+    - recreates tunes table
+    - clears old data
+    - inserts fresh data batch by batch
+    - records every file in the abc_files manifest
+    With incremental=True only new, changed or removed files are
+    touched (see sync_database). workers=None uses
+    configurations.INGEST_WORKERS. bulk=None follows
+    configurations.SQLITE_BULK_LOAD or MYSQL_BULK_LOAD (see
+    rebuild_sqlite_generation and rebuild_mysql_bulk), and SQLite bodies
+    are stored as configurations.BODY_STORAGE says. A SQLite rebuild
+    always writes a new generation, so searches running meanwhile keep
+    seeing the complete previous data; generations nobody reads any
+    more are deleted afterwards. A MySQL rebuild either swaps in a
+    staging table (bulk) or reloads the table in a single transaction,
+    so a cancelled rebuild never leaves a partly loaded table.
+    progress(stage, done, total) is called as files are parsed ("parse")
+    and rows inserted ("insert"); setting the cancel threading.Event
+    stops the rebuild with RebuildCancelled.
+    """
+    target_db = resolve_target(target)
+    if target_db is None:
+        return
+    if incremental:
+        sync_database(target_db, workers=workers, progress=progress, cancel=cancel)
+        return
+
+    print(f"\nRebuilding {target_db.upper()} database from ABC files...\n")
+    files = scan_abc_files()
+    if bulk is None:
+        bulk = configurations.SQLITE_BULK_LOAD if target_db == "sqlite" else configurations.MYSQL_BULK_LOAD
+    report = progress_reporter(progress, cancel)
+    storage = configurations.BODY_STORAGE
+    if target_db == "mysql" and storage != "plain":
+        print("Compressed body storage is only available for SQLite; MySQL keeps plain bodies.")
+        storage = "plain"
+
+    if target_db == "sqlite":
+        rebuild_sqlite_generation(files, workers, report, storage, bulk)
+    elif bulk:
+        rebuild_mysql_bulk(files, workers, report)
+    else:
+        conn = open_target_connection(target_db)
+        if conn is None:
+            return
+        try:
+            # one transaction: until finish_load commits, searches see the
+            # old rows, and a failed or cancelled rebuild leaves them alone
+            clear_tunes_table_mysql(conn, commit=False)
+            load_files(conn, files, workers, commit=False, report=report)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    configurations.notify_database_changed("rebuild")
+    if target_db == "sqlite":
+        db_generations.collect_garbage()
     print("\nDatabase rebuild complete.\n")
-    
-def fetch_all(conn, sql, params=()):
-    """Execute a SELECT and return all rows."""
+
+
+def sync_database(target: Optional[str] = None, workers: Optional[int] = None,
+                  progress=None, cancel=None):
+    """
+    Incrementally bring the database in line with the ABC files.
+    Files whose mtime and size match the manifest are skipped without
+    being read; otherwise the content hash decides whether the file
+    really changed. Only changed files are re-parsed, and all deletes,
+    inserts, manifest updates, tune_summary adjustments and melodic
+    index rows happen in a single transaction, which is rolled back if
+    the sync fails or is cancelled.
+    """
+    target_db = resolve_target(target)
+    if target_db is None:
+        return
+
+    conn = open_target_connection(target_db)
+    if conn is None:
+        return
+    try:
+        manifest = load_manifest(conn)
+        files = scan_abc_files()
+
+        changed = []   # (book, filename, path, mtime_ns, size, sha1)
+        touched = []   # same content, new mtime/size -> manifest only
+        for key, (path, mtime_ns, size) in files.items():
+            old = manifest.get(key)
+            if old is not None and old[0] == mtime_ns and old[1] == size:
+                continue
+            sha1 = file_content_hash(path)
+            entry = (key[0], key[1], mtime_ns, size, sha1)
+            if old is not None and old[2] == sha1:
+                touched.append(entry)
+            else:
+                changed.append((path, entry))
+        removed = [key for key in manifest if key not in files]
+
+        if not changed and not removed and not touched:
+            print(f"{target_db.upper()} database is up to date ({len(files)} files).")
+            return
+
+        inserted = 0
+        report = progress_reporter(progress, cancel)
+        try:
+            changed_keys = [(entry[0], entry[1]) for _path, entry in changed]
+            summary_delta = Counter()
+            summary_delta.subtract(count_summary_rows(conn, removed + changed_keys))
+            old_hashes = count_file_hashes(conn, removed + changed_keys)
+            delete_file_rows(conn, removed + changed_keys)
+            changed_files = [(entry[0], entry[1], path) for path, entry in changed]
+            if changed_files:
+                batches = iter_tune_batches(changed_files, workers=workers, progress=report, with_melody=True)
+                inserted = insert_batches(conn, batches, report, commit=False)
+            summary_delta.update(count_summary_rows(conn, changed_keys))
+            summary_delta[("distinct", "", "")] += distinct_count_delta(
+                conn, old_hashes, count_file_hashes(conn, changed_keys))
+            apply_summary_delta(conn, summary_delta)
+            write_manifest(conn, [entry for _path, entry in changed] + touched)
+            if changed or removed:
+                set_data_version(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if changed or removed:
+            configurations.notify_database_changed("rebuild")
+
+        new_count = sum(1 for _path, entry in changed if (entry[0], entry[1]) not in manifest)
+        print(
+            f"Synced {target_db.upper()} database: {new_count} new, "
+            f"{len(changed) - new_count} changed, {len(removed)} removed, "
+            f"{len(files) - len(changed)} unchanged file(s); {inserted} tunes re-inserted."
+        )
+    finally:
+        conn.close()
+        if target_db == "sqlite":
+            # generations still read during the last rebuild may be free by now
+            db_generations.collect_garbage()
+
+
+def cached_query(conn, sql, params, use_cache, fetch):
+    """
+    Run fetch(cursor) for sql, going through the query cache for SELECTs.
+    Statements that reach the database are timed by perf.record_query.
+    """
+    key = None
+    if use_cache and query_cache.is_cacheable(sql):
+        key = query_cache.cache_key("sqlite" if is_sqlite_connection(conn) else "mysql", sql, params)
+        result = query_cache.get(key)
+        if result is not query_cache.MISSING:
+            perf.count("sql.cache_hits")
+            return result
+    started = perf.start()
     cursor = conn.cursor()
     cursor.execute(prepare_sql(sql, conn), params)
-    rows = cursor.fetchall()
+    result = fetch(cursor)
     cursor.close()
-    return rows
+    if started is not None:
+        perf.record_query(started, sql, params, len(result) if isinstance(result, list) else int(result is not None))
+    if key is not None:
+        query_cache.put(key, result)
+    return result
 
 
-def fetch_one(conn, sql, params=()):
-    """Execute a SELECT and return a single row (or None)."""
+@perf.timed("sql.fetch_all")
+def fetch_all(conn, sql, params=(), use_cache=True):
+    """
+    Execute a SELECT and return all rows. Repeated SELECTs are answered
+    from query_cache; pass use_cache=False for reads that must see
+    uncommitted changes on this connection.
+    """
+    rows = cached_query(conn, sql, params, use_cache, lambda cursor: cursor.fetchall())
+    return list(rows)
+
+
+def stream_rows(conn, sql, params=(), size: Optional[int] = None):
+    """
+    Execute a SELECT and return (column names, row iterator). Rows are
+    read with cursor.fetchmany, size at a time (default
+    configurations.STREAM_FETCH_SIZE), so a large result is never held
+    in memory; they bypass the query cache. Read the iterator to the end
+    before running another statement on conn.
+    """
+    size = size or configurations.STREAM_FETCH_SIZE
+    started = perf.start()
     cursor = conn.cursor()
     cursor.execute(prepare_sql(sql, conn), params)
-    row = cursor.fetchone()
-    cursor.close()
-    return row
\ No newline at end of file
+    columns = [description[0] for description in cursor.description]
+
+    def rows():
+        count = 0
+        try:
+            while True:
+                chunk = cursor.fetchmany(size)
+                if not chunk:
+                    break
+                count += len(chunk)
+                yield from chunk
+        finally:
+            cursor.close()
+            perf.record_query(started, sql, params, count)
+
+    return columns, rows()
+
+
+@perf.timed("sql.fetch_one")
+def fetch_one(conn, sql, params=(), use_cache=True):
+    """Execute a SELECT and return a single row (or None)."""
+    return cached_query(conn, sql, params, use_cache, lambda cursor: cursor.fetchone())
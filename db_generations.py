@@ -0,0 +1,230 @@
+import glob
+import os
+import re
+import sqlite3
+import threading
+from typing import List, Optional
+from urllib.parse import quote
+
+import configurations
+
+# Versioned SQLite snapshots. A full rebuild never touches the database
+# that readers are using: it writes a new generation file next to
+# SQLITE_DB_PATH (tunes.g000001.db, tunes.g000002.db, ...) and publishes
+# it by atomically replacing a small pointer file (tunes.db.current) that
+# names the live generation. New connections open whatever the pointer
+# names; connections opened earlier keep reading their own generation
+# until they are closed, so a search never sees a half-built table.
+#
+# Old generations are removed by collect_garbage() once nobody reads
+# them. Generations run in WAL mode, and SQLite only lets a connection
+# switch a WAL database back to rollback journaling when no other
+# connection (in any process) has it open, so that switch doubles as the
+# "no readers left" test. Files are never os.replace()d over a database
+# that may be open, which would leave its readers with a stale -wal/-shm.
+#
+# Without a pointer file (a database from before generations, or none
+# yet) SQLITE_DB_PATH itself is the live database. It is never deleted:
+# it is the tunes.db that ships with the project, and it may be in
+# rollback-journal mode, where the WAL test above cannot see readers.
+
+GENERATION_NAME = re.compile(r"\.g(\d{6})\.db$")
+
+_pointer_cache = {}
+_pointer_lock = threading.Lock()
+
+
+def pointer_path(db_path: Optional[str] = None) -> str:
+    return (db_path or configurations.SQLITE_DB_PATH) + ".current"
+
+
+def generation_path(number: int, db_path: Optional[str] = None) -> str:
+    stem, _ext = os.path.splitext(db_path or configurations.SQLITE_DB_PATH)
+    return f"{stem}.g{number:06d}.db"
+
+
+def generation_files(db_path: Optional[str] = None) -> List[str]:
+    """Every generation file of db_path, oldest first."""
+    stem, _ext = os.path.splitext(db_path or configurations.SQLITE_DB_PATH)
+    paths = [path for path in glob.glob(glob.escape(stem) + ".g*.db") if GENERATION_NAME.search(path)]
+    return sorted(paths, key=lambda path: int(GENERATION_NAME.search(path).group(1)))
+
+
+def current_path(db_path: Optional[str] = None) -> str:
+    """
+    The database file readers should open: the published generation, or
+    SQLITE_DB_PATH when none has been published. The pointer is only
+    re-read when the file changes, so this costs one stat() per call.
+    """
+    db_path = db_path or configurations.SQLITE_DB_PATH
+    pointer = pointer_path(db_path)
+    try:
+        stat = os.stat(pointer)
+    except FileNotFoundError:
+        return db_path
+    stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _pointer_lock:
+        cached = _pointer_cache.get(pointer)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    try:
+        with open(pointer, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return db_path
+    path = os.path.join(os.path.dirname(db_path), name) if name else db_path
+    with _pointer_lock:
+        _pointer_cache[pointer] = (stamp, path)
+    return path
+
+
+def live_stamp(db_path: Optional[str] = None) -> tuple:
+    """
+    The live database file with the stat() of it and of its -wal file.
+    Every commit, from any process, changes the stamp (WAL commits touch
+    the -wal file, checkpoints and rollback-journal commits the database
+    file), so it tells whether the data may have changed without opening
+    a connection.
+    """
+    path = current_path(db_path)
+    stamp = [path]
+    for name in (path, path + "-wal"):
+        try:
+            stat = os.stat(name)
+        except FileNotFoundError:
+            stamp.append(None)
+            continue
+        stamp.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+    return tuple(stamp)
+
+
+def open_generation(path: str, **kwargs) -> sqlite3.Connection:
+    """Open an existing generation file; unlike sqlite3.connect it never creates one."""
+    location = os.path.abspath(path).replace(os.sep, "/")
+    if not location.startswith("/"):
+        location = "/" + location  # Windows: file:///C:/...
+    return sqlite3.connect(f"file://{quote(location, safe='/:')}?mode=rw", uri=True, **kwargs)
+
+
+def connect(db_path: Optional[str] = None, **kwargs) -> sqlite3.Connection:
+    """
+    Open the live database. The connection reads the file header straight
+    away, which registers it as a reader of its generation so that
+    collect_garbage() leaves the file alone until it is closed.
+    """
+    db_path = db_path or configurations.SQLITE_DB_PATH
+    for attempt in range(3):
+        path = current_path(db_path)
+        try:
+            conn = sqlite3.connect(path, **kwargs) if path == db_path else open_generation(path, **kwargs)
+            conn.execute("PRAGMA schema_version;").fetchone()
+            return conn
+        except sqlite3.OperationalError:
+            # the generation was collected after we read the pointer;
+            # the pointer names a newer one by now
+            if attempt == 2:
+                raise
+
+
+def new_generation(db_path: Optional[str] = None) -> str:
+    """Create an empty file for the next generation and return its path."""
+    db_path = db_path or configurations.SQLITE_DB_PATH
+    existing = generation_files(db_path)
+    number = int(GENERATION_NAME.search(existing[-1]).group(1)) + 1 if existing else 1
+    while True:
+        path = generation_path(number, db_path)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return path
+        except FileExistsError:
+            number += 1
+
+
+def publish(path: str, db_path: Optional[str] = None):
+    """Make path the live generation (an atomic replace of the pointer file)."""
+    pointer = pointer_path(db_path)
+    tmp_path = f"{pointer}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(path) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, pointer)
+
+
+def remove_database_file(path: str):
+    """Delete a database file with its -wal, -shm and -journal files, if present."""
+    for name in (path, path + "-wal", path + "-shm", path + "-journal"):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+def is_wal_file(path: str) -> bool:
+    """True if the database header says the file is in WAL mode."""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(20)
+    except OSError:
+        return False
+    return len(header) == 20 and header[18] == 2 and header[19] == 2
+
+
+def has_readers(path: str) -> bool:
+    """
+    True if another connection has the WAL database at path open, or if
+    that cannot be told (the file is not in WAL mode, or is locked).
+    """
+    if not is_wal_file(path):
+        return True
+    try:
+        conn = open_generation(path, timeout=0)
+        try:
+            mode = conn.execute("PRAGMA journal_mode = DELETE;").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return True
+    return mode.lower() != "delete"
+
+
+def restore_wal(path: str):
+    """Switch a database that has_readers() left in rollback mode back to WAL."""
+    try:
+        conn = open_generation(path, timeout=0)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL;")
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def collect_garbage(db_path: Optional[str] = None) -> List[str]:
+    """
+    Delete every generation older than the live one that no connection
+    has open. Generations still being read are kept for a later call;
+    newer ones may still be being built and are left alone, and so is
+    SQLITE_DB_PATH itself. Returns the removed paths.
+    """
+    db_path = db_path or configurations.SQLITE_DB_PATH
+    live = current_path(db_path)
+    match = GENERATION_NAME.search(live) if live != db_path else None
+    if match is None:
+        return []
+    live_number = int(match.group(1))
+    candidates = [path for path in generation_files(db_path)
+                  if int(GENERATION_NAME.search(path).group(1)) < live_number]
+    removed = []
+    for path in candidates:
+        if has_readers(path):
+            continue
+        try:
+            remove_database_file(path)
+        except OSError:
+            # still open elsewhere (Windows keeps open files): put it back
+            # in WAL mode so the next call can test it again
+            restore_wal(path)
+            continue
+        removed.append(path)
+    return removed
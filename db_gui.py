@@ -1,12 +1,27 @@
-import contextlib
-import io
+import importlib
 import tkinter as tk
 from tkinter import messagebox, simpledialog
 
 import configurations
 import db_connection
 import db_query
-import data_analysis
+import perf
+from gui_perf import PerformanceWindow
+from gui_results import ResultsWindow
+from gui_tasks import TaskRunner
+
+
+def lazy(module_name: str, function_name: str):
+    """
+    Stand-in for module_name.function_name that imports the module on the
+    first call. The pandas-based modules (db_stats, data_analysis) are
+    reached this way, so pandas loads in the background task that first
+    needs it instead of delaying the first window.
+    """
+    def call(*args, **kwargs):
+        return getattr(importlib.import_module(module_name), function_name)(*args, **kwargs)
+    call.__name__ = function_name
+    return call
 
 
 def start_gui():
@@ -14,9 +29,19 @@ def start_gui():
     root = tk.Tk()
     root.title("ABC Tunes Browser")
 
+    status_frame = tk.Frame(root)
+    status_frame.pack(fill="x", padx=8, pady=4)
+
     status_text = tk.StringVar(value=f"Active database: {configurations.ACTIVE_DATABASE.upper()}")
-    status_label = tk.Label(root, textvariable=status_text, anchor="w")
-    status_label.pack(fill="x", padx=8, pady=4)
+    status_label = tk.Label(status_frame, textvariable=status_text, anchor="w")
+    status_label.pack(side="left")
+
+    cancel_button = tk.Button(status_frame, text="Cancel", state="disabled")
+    cancel_button.pack(side="right")
+
+    task_text = tk.StringVar(value="Idle")
+    task_label = tk.Label(status_frame, textvariable=task_text, anchor="e", fg="#555555")
+    task_label.pack(side="right", padx=8)
 
     main_frame = tk.Frame(root)
     main_frame.pack(fill="both", expand=True)
@@ -41,6 +66,7 @@ def start_gui():
     output_box.pack(side="left", fill="both", expand=True)
     scroll.pack(side="right", fill="y")
 
+    @perf.timed("gui.render_output")
     def write_output(text: str):
         """Append text to the output box."""
         output_box.configure(state="normal")
@@ -50,20 +76,53 @@ def start_gui():
         output_box.configure(state="disabled")
         output_box.see(tk.END)
 
-    def run_and_log(action, *args):
+    def show_task_status(text, cancellable):
+        """Called by the task runner whenever background work starts, moves or ends."""
+        task_text.set(text)
+        cancel_button.configure(state="normal" if cancellable else "disabled")
+
+    tasks = TaskRunner(root, show_task_status)
+    cancel_button.configure(command=tasks.cancel_all)
+
+    def show_error(exc):
+        if isinstance(exc, db_connection.RebuildCancelled):
+            write_output(str(exc) + " The previous data is still in place.")
+        else:
+            messagebox.showerror("Error", str(exc), parent=root)
+
+    def run_and_log(action, *args, task_name=None, after=None,
+                    cancellable=False, with_progress=False, writes=False, **kwargs):
         """
-        Run a function that prints to stdout and capture the output
-        so it appears in the GUI instead of the terminal.
+        Run a function that prints to stdout on a background thread and
+        capture the output so it appears in the GUI instead of the
+        terminal. after(result), if given, runs on the Tk thread once the
+        output has been written.
         """
-        buffer = io.StringIO()
-        try:
-            with contextlib.redirect_stdout(buffer):
-                action(*args)
-        except Exception as exc:
-            messagebox.showerror("Error", str(exc), parent=root)
-            return
-        text = buffer.getvalue().strip() or "Done."
-        write_output(text)
+        if task_name is None:
+            target = args[0] if action is db_connection.run_with_connection and args else action
+            task_name = getattr(target, "__name__", "task").replace("_", " ")
+
+        def done(result, text):
+            write_output(text.strip() or "Done.")
+            if after is not None:
+                after(result)
+
+        timed_action = perf.timed(f"gui.{task_name}")(action)
+        tasks.submit(task_name, timed_action, *args, on_done=done, on_error=show_error,
+                     cancellable=cancellable, with_progress=with_progress, writes=writes, **kwargs)
+
+    def show_results(title, page_function, *args, **kwargs):
+        """Open a paged results window for db_query page_function(conn, *args, after=..., **kwargs)."""
+        @perf.timed("gui.results_page")
+        def load_page(after):
+            return db_connection.run_with_connection(page_function, *args, after=after, **kwargs)
+
+        ResultsWindow(
+            root, title, load_page, tasks, db_query.PAGE_SIZE,
+            on_activate=lambda tune_id: run_and_log(
+                db_connection.run_with_connection, db_query.show_tune_details, tune_id),
+            on_error=show_error,
+        )
 
     def ask_text(title, prompt):
         """Ask the user for a text value (e.g. search keyword)."""
@@ -79,7 +138,12 @@ def start_gui():
 
 # button handlers
     def do_rebuild():
-        run_and_log(db_connection.rebuild_database)
+        run_and_log(db_connection.rebuild_database, task_name="Rebuild",
+                    cancellable=True, with_progress=True, writes=True)
+
+    def do_sync():
+        run_and_log(db_connection.rebuild_database, None, True, task_name="Sync",
+                    cancellable=True, with_progress=True, writes=True)
 
     def do_list_tunes():
         run_and_log(db_connection.run_with_connection, db_query.list_tunes)
@@ -87,36 +151,81 @@ def start_gui():
     def do_search_title():
         keyword = ask_text("Search by title", "Enter part of the title:")
         if keyword:
-            run_and_log(db_connection.run_with_connection, db_query.search_by_title, keyword)
+            show_results(f"Title contains '{keyword}'", db_query.title_search_page, keyword)
+
+    def do_search_ranked():
+        text = ask_text("Full-text title search", "Enter title words (prefixes are fine):")
+        if text:
+            run_and_log(db_connection.run_with_connection, db_query.search_title_ranked, text)
+
+    def do_search_body():
+        text = ask_text("Search tune bodies", "Enter words to find in the tune text:")
+        if text:
+            run_and_log(db_connection.run_with_connection, db_query.search_body_ranked, text)
+
+    def show_facet_results(title, dialog_title, **facets):
+        try:
+            db_query.facet_conditions(**facets)
+        except ValueError as exc:
+            messagebox.showerror(dialog_title, str(exc), parent=root)
+            return
+        show_results(title, db_query.facet_search_page, **facets)
 
     def do_search_key():
-        key_sig = ask_text("Search by key", "Enter key (eg D, G, Em):")
+        key_sig = ask_text("Search by key", "Enter key (eg D, G, Em, Ador):")
         if key_sig:
-            run_and_log(db_connection.run_with_connection, db_query.search_by_key, key_sig)
+            show_facet_results(f"Key {key_sig}", "Search by key", key=key_sig)
 
     def do_search_meter():
         meter = ask_text("Search by meter", "Enter meter (eg 4/4, 6/8):")
         if meter:
-            run_and_log(db_connection.run_with_connection, db_query.search_by_meter, meter)
+            show_facet_results(f"Meter {meter}", "Search by meter", meter=meter)
+
+    def do_search_facets():
+        text = ask_text("Combined search", "Enter filters (eg key=D, meter=6/8, rhythm=jig, tonic=G, book=1):")
+        if not text:
+            return
+        try:
+            facets = db_query.parse_facet_query(text)
+        except ValueError as exc:
+            messagebox.showerror("Combined search", str(exc), parent=root)
+            return
+        show_results(text, db_query.facet_search_page, **facets)
 
     def do_show_details():
         tune_id = ask_number("Show tune details", "Enter tune ID:")
         if tune_id is not None:
             run_and_log(db_connection.run_with_connection, db_query.show_tune_details, tune_id)
 
+    def do_show_occurrences():
+        tune_id = ask_number("Find all occurrences", "Enter tune ID:")
+        if tune_id is not None:
+            show_results(f"Occurrences of tune {tune_id}", db_query.occurrences_page, tune_id)
+
+    def do_show_similar():
+        tune_id = ask_number("Find similar tunes", "Enter tune ID:")
+        if tune_id is not None:
+            run_and_log(db_connection.run_with_connection, db_query.show_similar, tune_id)
+
     def do_basic_stats():
-        run_and_log(db_connection.run_with_connection, data_analysis.show_basic_stats_with_pandas)
+        run_and_log(db_connection.run_with_connection, lazy("db_stats", "show_basic_stats_sql"))
+
+    def do_crosstabs():
+        run_and_log(db_connection.run_with_connection, lazy("db_stats", "show_crosstabs"))
 
     def do_pandas_analysis():
         """
         Simple text-based submenu for pandas analysis inside the GUI.
+        The table is loaded in the background; the menu opens when it is ready.
         """
-        conn = db_connection.open_active_connection()
-        if not conn:
-            return
-        df = data_analysis.load_tunes_dataframe(conn)
-        conn.close()
+        tasks.submit("Load tunes for pandas", db_connection.run_with_connection,
+                     lazy("data_analysis", "load_stats_dataframe"),
+                     on_done=lambda df, _text: show_pandas_menu(df), on_error=show_error)
 
+    def show_pandas_menu(df):
+        import data_analysis  # already loaded by load_stats_dataframe
+        if df is None:
+            return
         if df.empty:
             write_output("No tunes available. Rebuild the database first.")
             return
@@ -152,25 +261,45 @@ def start_gui():
         else:
             messagebox.showinfo("Pandas analysis", "Please choose 1–4 only.")
 
+    def do_music_stats():
+        by = ask_text("Musical statistics", "Group by (all/book/key/rhythm):")
+        if by:
+            run_and_log(db_connection.run_with_connection, lazy("music_stats", "show_music_stats"), by.lower())
+
     def do_switch_backend():
         new_backend = ask_text("Switch backend", "Enter backend (sqlite/mysql):")
         if new_backend:
-            run_and_log(configurations.set_active_database, new_backend)
-            status_text.set(f"Active database: {configurations.ACTIVE_DATABASE.upper()}")
+            run_and_log(
+                configurations.set_active_database, new_backend,
+                after=lambda _result: status_text.set(f"Active database: {configurations.ACTIVE_DATABASE.upper()}"),
+            )
+
+    def do_performance():
+        PerformanceWindow(root)
 
     def do_exit():
+        tasks.shutdown()
         root.destroy()
 
     buttons = [
         ("1. (Re)build database",       do_rebuild),
-        ("2. List first 20 tunes",      do_list_tunes),
-        ("3. Search by title",          do_search_title),
-        ("4. Search by key",            do_search_key),
-        ("5. Search by meter",          do_search_meter),
-        ("6. Show tune details",        do_show_details),
-        ("7. Show basic statistics",    do_basic_stats),
-        ("8. Pandas analysis submenu",  do_pandas_analysis),
-        ("9. Switch database backend",  do_switch_backend),
+        ("2. Sync changed ABC files",   do_sync),
+        ("3. List first 20 tunes",      do_list_tunes),
+        ("4. Search by title",          do_search_title),
+        ("5. Full-text title search",   do_search_ranked),
+        ("6. Search tune bodies",       do_search_body),
+        ("7. Search by key",            do_search_key),
+        ("8. Search by meter",          do_search_meter),
+        ("9. Combined search",          do_search_facets),
+        ("10. Show tune details",       do_show_details),
+        ("11. Show basic statistics",   do_basic_stats),
+        ("12. Rhythm/key cross-tabs",   do_crosstabs),
+        ("13. Pandas analysis submenu", do_pandas_analysis),
+        ("14. Switch database backend", do_switch_backend),
+        ("15. Find all occurrences",    do_show_occurrences),
+        ("16. Find similar tunes",      do_show_similar),
+        ("17. Performance",             do_performance),
+        ("18. Musical statistics",      do_music_stats),
         ("0. Exit",                     do_exit),
     ]
 
@@ -185,5 +314,6 @@ def start_gui():
             pady=4,
         ).pack(fill="x", pady=3)
 
+    root.protocol("WM_DELETE_WINDOW", do_exit)
     write_output("Welcome to ABC Tunes! Use the buttons on the left to run an action.")
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,232 @@
+import queue
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+import configurations
+import db_generations
+
+
+def mysql_connector():
+    """
+    Import and return mysql.connector. It is loaded on first use so that
+    SQLite-only sessions start without it.
+    """
+    import mysql.connector
+    import mysql.connector.pooling
+    return mysql.connector
+
+
+def database_errors() -> tuple:
+    """Error classes of the database drivers loaded so far."""
+    connector = sys.modules.get("mysql.connector")
+    if connector is None:
+        return (sqlite3.Error,)
+    return sqlite3.Error, connector.Error
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became free within configurations.POOL_TIMEOUT."""
+
+
+class SQLitePool:
+    """
+    A fixed-size set of SQLite connections to one database file.
+
+    Connections are opened with check_same_thread=False so any thread may
+    use them, but each one is handed to a single borrower at a time.
+    Borrowed connections get a cheap health check before being returned.
+    Each connection reads the generation that was live when it was opened
+    (see db_generations); once a newer one is published, idle connections
+    to older generations are closed instead of being handed out again.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self.closed = False
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._generations = {}  # id(conn) -> generation file it reads
+
+    def _connect(self):
+        # read the pointer first: if a generation is published meanwhile,
+        # the connection is merely recorded as older and replaced later
+        generation = db_generations.current_path(self.path)
+        conn = db_generations.connect(self.path, check_same_thread=False)
+        self._generations[id(conn)] = generation
+        return conn
+
+    def _discard(self, conn):
+        self._generations.pop(id(conn), None)
+        conn.close()
+
+    def acquire(self, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolTimeout(f"No free SQLite connection after {timeout}s")
+        try:
+            live = db_generations.current_path(self.path)
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._connect()
+                    break
+                if self._generations.get(id(conn)) != live:
+                    self._discard(conn)
+                    continue
+                try:
+                    conn.execute("SELECT 1;")
+                    break
+                except sqlite3.Error:
+                    self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+        return conn
+
+    def release(self, conn):
+        try:
+            if self.closed or self._generations.get(id(conn)) != db_generations.current_path(self.path):
+                self._discard(conn)
+            else:
+                try:
+                    conn.rollback()
+                    self._idle.put(conn)
+                except sqlite3.Error:
+                    self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+class MySQLPool:
+    """
+    Wrapper over mysql.connector.pooling.MySQLConnectionPool that waits
+    for a free connection instead of failing straight away. The pool
+    itself pings each connection on checkout (reconnecting dead ones)
+    and resets the session when it is handed back.
+    """
+
+    _counter = 0
+
+    def __init__(self, config: dict, size: int):
+        MySQLPool._counter += 1
+        pooling = mysql_connector().pooling
+        size = min(size, pooling.CNX_POOL_MAXSIZE)
+        self.size = size
+        self.closed = False
+        self._slots = threading.BoundedSemaphore(size)
+        self._pool = pooling.MySQLConnectionPool(
+            pool_name=f"abc_tunes_{MySQLPool._counter}",
+            pool_size=size,
+            pool_reset_session=True,
+            **config,
+        )
+
+    def acquire(self, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolTimeout(f"No free MySQL connection after {timeout}s")
+        try:
+            return self._pool.get_connection()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        try:
+            conn.close()  # hands it back to mysql.connector's pool
+            if self.closed:
+                self._pool._remove_connections()
+        finally:
+            self._slots.release()
+
+    def close(self):
+        self.closed = True
+        self._pool._remove_connections()
+
+
+_lock = threading.Lock()
+_pools = {}
+_owners = {}
+
+
+def _pool_key(backend: str):
+    if backend == "mysql":
+        return backend, tuple(sorted(configurations.MYSQL_CONFIG.items()))
+    return backend, configurations.SQLITE_DB_PATH
+
+
+def get_pool(backend=None):
+    """Return the pool for backend (default: the active one), creating it if needed."""
+    backend = backend or configurations.ACTIVE_DATABASE
+    key = _pool_key(backend)
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            if backend == "mysql":
+                pool = MySQLPool(configurations.MYSQL_CONFIG, configurations.POOL_SIZE)
+            elif backend == "sqlite":
+                pool = SQLitePool(configurations.SQLITE_DB_PATH, configurations.POOL_SIZE)
+            else:
+                raise ValueError(f"Unsupported database backend: {backend}")
+            _pools[key] = pool
+        return pool
+
+
+def acquire_connection(backend=None):
+    """Borrow a connection for backend; print and return None on failure."""
+    try:
+        pool = get_pool(backend)
+        conn = pool.acquire(timeout=configurations.POOL_TIMEOUT)
+    except (PoolTimeout, ValueError, ImportError, *database_errors()) as err:
+        print("Error getting a database connection:", err)
+        return None
+    with _lock:
+        _owners[id(conn)] = pool
+    return conn
+
+
+def release_connection(conn):
+    """Give a borrowed connection back to the pool it came from."""
+    with _lock:
+        pool = _owners.pop(id(conn), None)
+    if pool is None:
+        conn.close()
+    else:
+        pool.release(conn)
+
+
+@contextmanager
+def pooled_connection(backend=None):
+    """with pooled_connection() as conn: ... (conn is None if none could be opened)"""
+    conn = acquire_connection(backend)
+    try:
+        yield conn
+    finally:
+        if conn is not None:
+            release_connection(conn)
+
+
+def reset_pools(reason: str = ""):
+    """
+    Close every idle pooled connection and forget the pools. Connections
+    still borrowed are closed when they are released, so nothing keeps
+    pointing at a database that was switched away from or replaced.
+    """
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+configurations.add_database_listener(reset_pools)
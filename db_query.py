@@ -1,13 +1,168 @@
-from db_connection import fetch_all, fetch_one
+import re
+from collections import namedtuple
 
+from abc_parser import normalize_key, normalize_meter, normalize_rhythm
+from db_connection import (fetch_all, fetch_one, fetch_tune_body, has_melody_index, has_search_index,
+                           is_sqlite_connection)
 
-def list_tunes(conn, limit=20):
-    """Print the first 'limit' tunes."""
-    rows = fetch_all(
+
+# one row of a result page; pages are ordered by (t, id)
+TuneRow = namedtuple("TuneRow", ["id", "t", "k", "m", "book"])
+SimilarTune = namedtuple("SimilarTune", TuneRow._fields + ("similarity",))
+
+PAGE_SIZE = 100
+
+
+def fetch_page(conn, where="", params=(), after=None, page_size=PAGE_SIZE):
+    """
+    Keyset pagination over tunes ordered by (t, id).
+    where/params filter the rows; after is the (t, id) of the last row of
+    the previous page (None for the first page). Each page costs the
+    same no matter how deep into the results it is.
+    Returns a list of TuneRow.
+    """
+    clauses = [where] if where else []
+    params = list(params)
+    if after is not None:
+        last_title, last_id = after
+        clauses.append("(t > %s OR (t = %s AND id > %s))")
+        params += [last_title, last_title, last_id]
+    sql = "SELECT id, t, k, m, book FROM tunes"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY t, id LIMIT %s;"
+    params.append(page_size)
+    return [TuneRow(*row) for row in fetch_all(conn, sql, tuple(params))]
+
+
+def title_search_page(conn, keyword, after=None, page_size=PAGE_SIZE):
+    """One page of tunes whose title contains keyword."""
+    return fetch_page(conn, "t LIKE %s", (f"%{keyword}%",), after, page_size)
+
+
+def facet_search_page(conn, after=None, page_size=PAGE_SIZE, **facets):
+    """One page of tunes matching the facets (see find_by_facets)."""
+    where, params = facet_conditions(**facets)
+    return fetch_page(conn, where, params, after, page_size)
+
+
+def occurrences_page(conn, tune_id, after=None, page_size=PAGE_SIZE):
+    """One page of every copy of tune tune_id (same body_hash), in any book or file."""
+    return fetch_page(conn, "body_hash = (SELECT body_hash FROM tunes WHERE id = %s)", (tune_id,), after, page_size)
+
+
+def occurrences_query(tune_id):
+    """(sql, params) for every copy of tune_id, as (id, book, filename, x, t)."""
+    return (
+        "SELECT id, book, filename, x, t FROM tunes "
+        "WHERE body_hash = (SELECT body_hash FROM tunes WHERE id = %s) ORDER BY book, filename, id;",
+        (tune_id,)
+    )
+
+
+def find_occurrences(conn, tune_id):
+    """
+    All occurrences of a tune: every row whose canonical body and key hash
+    (body_hash) matches tune_id's, as (id, book, filename, x, t) ordered by
+    book, file and X. Empty if tune_id does not exist.
+    """
+    return fetch_all(conn, *occurrences_query(tune_id))
+
+
+def show_occurrences(conn, tune_id):
+    """Print where else the tune with tune_id appears."""
+    rows = find_occurrences(conn, tune_id)
+    if not rows:
+        print(f"\nNo tune found with id {tune_id}\n")
+        return
+    print(f"\nTune {tune_id} occurs {len(rows)} time(s):\n")
+    for occurrence_id, book, filename, x, title in rows:
+        print(f"{occurrence_id:4d} | Book: {book} | File: {filename} | X: {x} | {title}")
+
+
+def find_similar(conn, tune_id, k=10):
+    """
+    Up to k tunes whose incipit is melodically close to tune_id's, as
+    SimilarTune rows, most similar first. Only tunes sharing at least one
+    LSH bucket with it are scored (see abc_notes), so the lookup reads a
+    handful of index rows rather than the whole corpus. None if the
+    melodic index does not exist, [] if the tune has no signature.
+    """
+    import abc_notes  # numpy is only loaded once a similarity search is made
+
+    if not has_melody_index(conn):
+        return None
+    row = fetch_one(conn, "SELECT signature FROM tune_melody WHERE id = %s;", (tune_id,))
+    if row is None:
+        return []
+    signature = abc_notes.signature_from_bytes(bytes(row[0]))
+    buckets = abc_notes.lsh_buckets(signature)
+    matches = " OR ".join(["(mb.band = %s AND mb.bucket = %s)"] * len(buckets))
+    params = [value for band_bucket in enumerate(buckets) for value in band_bucket]
+    candidates = fetch_all(
         conn,
-        "SELECT id, t, k, m, book FROM tunes ORDER BY id LIMIT %s;",
-        (limit,)
+        "SELECT DISTINCT tm.id, tm.signature FROM melody_buckets mb "
+        f"JOIN tune_melody tm ON tm.id = mb.id WHERE ({matches}) AND mb.id <> %s;",
+        tuple(params) + (tune_id,)
     )
+    scored = sorted(
+        ((abc_notes.estimated_similarity(signature, abc_notes.signature_from_bytes(bytes(blob))), candidate_id)
+         for candidate_id, blob in candidates),
+        key=lambda item: (-item[0], item[1])
+    )[:k]
+    if not scored:
+        return []
+    placeholders = ", ".join(["%s"] * len(scored))
+    rows = {row[0]: row for row in fetch_all(
+        conn,
+        f"SELECT id, t, k, m, book FROM tunes WHERE id IN ({placeholders});",
+        tuple(candidate_id for _score, candidate_id in scored)
+    )}
+    return [SimilarTune(*rows[candidate_id], score) for score, candidate_id in scored if candidate_id in rows]
+
+
+def show_similar(conn, tune_id, k=10):
+    """Print the tunes that sound most like tune_id."""
+    rows = find_similar(conn, tune_id, k)
+    if rows is None:
+        print("\nNo melodic index in this database; rebuild it to enable similarity search.\n")
+        return
+    if not rows:
+        print(f"\nNo similar tunes found for id {tune_id}\n")
+        return
+    print(f"\nTunes similar to {tune_id}:\n")
+    for tune_id, title, key_sig, meter, book, similarity in rows:
+        print(f"{tune_id:4d} | {similarity:4.2f} | {title} | Key: {key_sig} | Meter: {meter} | Book: {book}")
+
+
+def list_query(limit=20):
+    """(sql, params) for the first 'limit' tunes by id."""
+    return "SELECT id, t, k, m, book FROM tunes ORDER BY id LIMIT %s;", (limit,)
+
+
+def title_query(keyword):
+    """(sql, params) for tunes whose title contains keyword."""
+    return "SELECT id, t, k, m, book FROM tunes WHERE t LIKE %s ORDER BY t;", (f"%{keyword}%",)
+
+
+def key_query(key_sig):
+    """(sql, params) for tunes whose K: field contains key_sig."""
+    return "SELECT id, t, k, m, book FROM tunes WHERE k LIKE %s ORDER BY t;", (f"%{key_sig}%",)
+
+
+def meter_query(meter):
+    """(sql, params) for tunes whose M: field contains meter."""
+    return "SELECT id, t, k, m, book FROM tunes WHERE m LIKE %s ORDER BY t;", (f"%{meter}%",)
+
+
+def details_query(tune_id):
+    """(sql, params) for the header fields of one tune (the body is read with fetch_tune_body)."""
+    return "SELECT id, book, filename, x, t, r, m, k FROM tunes WHERE id = %s;", (tune_id,)
+
+
+def list_tunes(conn, limit=20):
+    """Print the first 'limit' tunes."""
+    rows = fetch_all(conn, *list_query(limit))
     print(f"\nShowing first {len(rows)} tunes:\n")
     for tune_id, title, key_sig, meter, book in rows:
         title_short = (title or "")[:40]
@@ -16,23 +171,89 @@ def list_tunes(conn, limit=20):
 
 def search_by_title(conn, keyword):
     """Search tunes where the title contains keyword."""
-    rows = fetch_all(
-        conn,
-        "SELECT id, t, k, m, book FROM tunes WHERE t LIKE %s ORDER BY t;",
-        (f"%{keyword}%",)
-    )
+    rows = fetch_all(conn, *title_query(keyword))
     print(f"\nFound {len(rows)} tune(s) with '{keyword}' in the title:\n")
     for tune_id, title, key_sig, meter, book in rows:
         print(f"{tune_id:4d} | {title} | Key: {key_sig} | Meter: {meter} | Book: {book}")
 
 
+def fulltext_terms(text):
+    """
+    Split user input into search words (letters/digits only). Underscores
+    split words too, as in the FTS5 tokenizer, so every term is a single
+    token (a compressed database's index cannot match phrases).
+    """
+    return re.findall(r"[^\W_]+", text or "")
+
+
+def fulltext_query(conn, column, text, limit=50):
+    """
+    (sql, params) for a ranked full-text search on column ('t' or
+    'body') with prefix matching, or None if text has no search words.
+    SQLite uses the tunes_fts FTS5 index ordered by bm25, MySQL the
+    FULLTEXT index in boolean mode ordered by relevance.
+    """
+    if column not in ("t", "body"):
+        raise ValueError(f"Unsupported full-text column: {column}")
+    terms = fulltext_terms(text)
+    if not terms:
+        return None
+
+    if not has_search_index(conn):
+        # no FTS5 in this SQLite build: plain substring match
+        return (
+            f"SELECT id, t, k, m, book FROM tunes WHERE {column} LIKE %s ORDER BY t LIMIT %s;",
+            (f"%{text.strip()}%", limit)
+        )
+
+    if is_sqlite_connection(conn):
+        match = " AND ".join(f'{column} : "{term}"*' for term in terms)
+        return (
+            "SELECT tn.id, tn.t, tn.k, tn.m, tn.book FROM tunes_fts "
+            "JOIN tunes tn ON tn.id = tunes_fts.rowid "
+            "WHERE tunes_fts MATCH %s ORDER BY bm25(tunes_fts) LIMIT %s;",
+            (match, limit)
+        )
+
+    against = " ".join(f"+{term}*" for term in terms)
+    return (
+        f"SELECT id, t, k, m, book FROM tunes WHERE MATCH({column}) AGAINST (%s IN BOOLEAN MODE) "
+        f"ORDER BY MATCH({column}) AGAINST (%s IN BOOLEAN MODE) DESC LIMIT %s;",
+        (against, against, limit)
+    )
+
+
+def fulltext_search(conn, column, text, limit=50):
+    """
+    Ranked full-text search on column ('t' or 'body') with prefix
+    matching (see fulltext_query). Returns rows of (id, t, k, m, book),
+    best match first.
+    """
+    query = fulltext_query(conn, column, text, limit)
+    if query is None:
+        return []
+    return fetch_all(conn, *query)
+
+
+def search_title_ranked(conn, text, limit=50):
+    """Full-text title search: words may be prefixes, best matches first."""
+    rows = fulltext_search(conn, "t", text, limit)
+    print(f"\nTop {len(rows)} title match(es) for '{text}':\n")
+    for tune_id, title, key_sig, meter, book in rows:
+        print(f"{tune_id:4d} | {title} | Key: {key_sig} | Meter: {meter} | Book: {book}")
+
+
+def search_body_ranked(conn, text, limit=50):
+    """Full-text search inside the tune bodies (notes, lyrics, notes lines)."""
+    rows = fulltext_search(conn, "body", text, limit)
+    print(f"\nTop {len(rows)} tune(s) with '{text}' in the body:\n")
+    for tune_id, title, key_sig, meter, book in rows:
+        print(f"{tune_id:4d} | {title} | Key: {key_sig} | Meter: {meter} | Book: {book}")
+
+
 def search_by_key(conn, key_sig):
     """Search tunes by key signature."""
-    rows = fetch_all(
-        conn,
-        "SELECT id, t, k, m, book FROM tunes WHERE k LIKE %s ORDER BY t;",
-        (f"%{key_sig}%",)
-    )
+    rows = fetch_all(conn, *key_query(key_sig))
     print(f"\nFound {len(rows)} tune(s) in key '{key_sig}':\n")
     for tune_id, title, key_value, meter, book in rows:
         print(f"{tune_id:4d} | {title} | Key: {key_value} | Meter: {meter} | Book: {book}")
@@ -40,28 +261,126 @@ def search_by_key(conn, key_sig):
 
 def search_by_meter(conn, meter):
     """Search tunes by meter."""
-    rows = fetch_all(
-        conn,
-        "SELECT id, t, k, m, book FROM tunes WHERE m LIKE %s ORDER BY t;",
-        (f"%{meter}%",)
-    )
+    rows = fetch_all(conn, *meter_query(meter))
     print(f"\nFound {len(rows)} tune(s) with meter '{meter}':\n")
     for tune_id, title, key_value, meter_value, book in rows:
         print(f"{tune_id:4d} | {title} | Key: {key_value} | Meter: {meter_value} | Book: {book}")
 
 
+FACET_NAMES = ("key", "tonic", "meter", "rhythm", "book")
+
+
+def facet_conditions(key=None, tonic=None, meter=None, rhythm=None, book=None):
+    """
+    Turn facet values into (where_sql, params) on the normalized columns.
+    key is a full key such as 'D' (D major) or 'Ador'; tonic matches any
+    mode ('D' -> D major, D minor, D mixolydian, ...). A key, tonic or
+    meter that cannot be parsed raises ValueError.
+    """
+    clauses = []
+    params = []
+    if key:
+        key_tonic, key_mode = normalize_key(key)
+        if not key_tonic:
+            raise ValueError(f"'{key}' is not a key (eg D, G, Em, Ador).")
+        clauses += ["tonic = %s", "mode = %s"]
+        params += [key_tonic, key_mode]
+    if tonic:
+        key_tonic = normalize_key(tonic)[0]
+        if not key_tonic:
+            raise ValueError(f"'{tonic}' is not a tonic (eg D, F#, Bb).")
+        clauses.append("tonic = %s")
+        params.append(key_tonic)
+    if meter:
+        meter_num, meter_den = normalize_meter(meter)
+        if meter_num is None:
+            raise ValueError(f"'{meter}' is not a meter (eg 4/4, 6/8, C).")
+        clauses += ["meter_num = %s", "meter_den = %s"]
+        params += [meter_num, meter_den]
+    if rhythm:
+        clauses.append("rhythm = %s")
+        params.append(normalize_rhythm(rhythm))
+    if book:
+        clauses.append("book = %s")
+        params.append(str(book).strip())
+    return " AND ".join(clauses), params
+
+
+def facets_query(key=None, tonic=None, meter=None, rhythm=None, book=None):
+    """(sql, params) for an exact facet lookup (see facet_conditions), or None without facets."""
+    where, params = facet_conditions(key, tonic, meter, rhythm, book)
+    if not where:
+        return None
+    return f"SELECT id, t, k, m, book FROM tunes WHERE {where} ORDER BY t;", tuple(params)
+
+
+def find_by_facets(conn, key=None, tonic=None, meter=None, rhythm=None, book=None):
+    """
+    Exact-match lookup on the indexed facet columns.
+    Returns rows of (id, t, k, m, book) ordered by title.
+    """
+    query = facets_query(key, tonic, meter, rhythm, book)
+    if query is None:
+        return []
+    return fetch_all(conn, *query)
+
+
+def parse_facet_query(text):
+    """
+    Parse 'key=D, meter=6/8, rhythm=jig' into a dict of facet values.
+    Unknown names and values that cannot be parsed raise ValueError.
+    """
+    facets = {}
+    for part in (text or "").split(","):
+        if not part.strip():
+            continue
+        name, sep, value = part.partition("=")
+        name = name.strip().lower()
+        if not sep or name not in FACET_NAMES:
+            raise ValueError(f"Expected name=value with name in {', '.join(FACET_NAMES)}, got '{part.strip()}'")
+        facets[name] = value.strip()
+    facet_conditions(**facets)
+    return facets
+
+
+def print_result_rows(rows):
+    """Print (id, t, k, m, book) rows in the usual one-line format."""
+    for tune_id, title, key_value, meter_value, book in rows:
+        print(f"{tune_id:4d} | {title} | Key: {key_value} | Meter: {meter_value} | Book: {book}")
+
+
+def search_by_exact_key(conn, key_sig):
+    """Search tunes in exactly this key ('D' does not match 'Dm' or 'Dmix')."""
+    rows = find_by_facets(conn, key=key_sig)
+    print(f"\nFound {len(rows)} tune(s) in key '{key_sig}':\n")
+    print_result_rows(rows)
+
+
+def search_by_exact_meter(conn, meter):
+    """Search tunes by meter; 'C' and '4/4' are the same meter."""
+    rows = find_by_facets(conn, meter=meter)
+    print(f"\nFound {len(rows)} tune(s) with meter '{meter}':\n")
+    print_result_rows(rows)
+
+
+def search_by_facets(conn, **facets):
+    """Search tunes matching every given facet (key, tonic, meter, rhythm, book)."""
+    rows = find_by_facets(conn, **facets)
+    described = ", ".join(f"{name}={value}" for name, value in facets.items() if value)
+    print(f"\nFound {len(rows)} tune(s) with {described}:\n")
+    print_result_rows(rows)
+
+
 def show_tune_details(conn, tune_id):
-    """Print details for a single tune."""
-    row = fetch_one(
-        conn,
-        "SELECT id, book, filename, x, t, r, m, k, body FROM tunes WHERE id = %s;",
-        (tune_id,)
-    )
+    """Print details for a single tune. The body is fetched (and decompressed) separately."""
+    row = fetch_one(conn, *details_query(tune_id))
     if row is None:
         print(f"\nNo tune found with id {tune_id}\n")
         return
 
-    (id_value, book, filename, x, t, r, m, k, body) = row
+    (id_value, book, filename, x, t, r, m, k) = row
+    body = fetch_tune_body(conn, id_value)
+    copies = len(find_occurrences(conn, id_value))
     print("\n----------- TUNE DETAILS -----------")
     print(f"ID:      {id_value}")
     print(f"Book:    {book}")
@@ -71,6 +390,8 @@ def show_tune_details(conn, tune_id):
     print(f"Rhythm:  {r}")
     print(f"Meter:   {m}")
     print(f"Key:     {k}")
+    if copies > 1:
+        print(f"Copies:  {copies} (same music in other files or books)")
     print("\nBody:\n")
     print(body)
     print("------------------------------------\n")
\ No newline at end of file
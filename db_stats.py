@@ -0,0 +1,169 @@
+import pandas as pd
+
+from db_connection import fetch_all, has_summary
+
+# Statistics computed with GROUP BY inside the database. Only the small
+# aggregated result is sent back to Python; the covering indexes on
+# (book, filename), (k), (m), (rhythm, k) and (book, m) let SQLite and
+# MySQL answer most of these from the index alone.
+#
+# When the tune_summary table is present (it is refreshed on rebuild and
+# adjusted by sync) the counts are read from it instead, which is a
+# primary-key range scan no matter how many tunes there are.
+
+
+def query_frame(conn, sql, params=(), columns=None) -> pd.DataFrame:
+    """Run an aggregate query and return its (small) result as a DataFrame."""
+    rows = fetch_all(conn, sql, params)
+    return pd.DataFrame(rows, columns=columns)
+
+
+def summary_counts(conn, dim, limit=None) -> pd.DataFrame:
+    """
+    Precomputed counts for one summary dimension, largest first.
+    Two-part dimensions such as 'rhythm|k' return columns v1, v2, tunes.
+    """
+    sql = "SELECT v1, v2, tunes FROM tune_summary WHERE dim = %s ORDER BY tunes DESC, v1, v2"
+    params = (dim,)
+    if limit:
+        sql += " LIMIT %s"
+        params = (dim, limit)
+    return query_frame(conn, sql + ";", params, columns=["v1", "v2", "tunes"])
+
+
+def summary_crosstab(conn, dim) -> pd.DataFrame:
+    """Pivot a two-part summary dimension ('rhythm|k', 'book|m', ...) into a table."""
+    counts = summary_counts(conn, dim)
+    if counts.empty:
+        return pd.DataFrame()
+    table = counts.pivot(index="v1", columns="v2", values="tunes").fillna(0).astype(int)
+    table.index.name, table.columns.name = dim.split("|")
+    return table
+
+
+def single_counts(conn, column, limit=None) -> pd.DataFrame:
+    """Counts for one tunes column, from tune_summary if available, else GROUP BY."""
+    if has_summary(conn):
+        counts = summary_counts(conn, column, limit)
+        return counts[["v1", "tunes"]].rename(columns={"v1": column})
+    sql = f"SELECT {column}, COUNT(*) AS tunes FROM tunes GROUP BY {column} ORDER BY tunes DESC, {column}"
+    params = ()
+    if limit:
+        sql += " LIMIT %s"
+        params = (limit,)
+    return query_frame(conn, sql + ";", params, columns=[column, "tunes"])
+
+
+def total_tunes(conn) -> int:
+    """Number of tunes in the table."""
+    if has_summary(conn):
+        return fetch_all(conn, "SELECT tunes FROM tune_summary WHERE dim = 'total';")[0][0]
+    return fetch_all(conn, "SELECT COUNT(*) FROM tunes;")[0][0]
+
+
+def distinct_tunes(conn) -> int:
+    """Number of different tunes, counting copies with the same body_hash once."""
+    if has_summary(conn):
+        rows = fetch_all(conn, "SELECT tunes FROM tune_summary WHERE dim = 'distinct';")
+        if rows:
+            return rows[0][0]
+    return fetch_all(conn, "SELECT COUNT(DISTINCT body_hash) FROM tunes;")[0][0]
+
+
+def tunes_per_book(conn) -> pd.DataFrame:
+    """Tune count for every book, largest first."""
+    return single_counts(conn, "book")
+
+
+def top_keys(conn, limit=10) -> pd.DataFrame:
+    """The most common K: values."""
+    return single_counts(conn, "k", limit)
+
+
+def meter_counts(conn) -> pd.DataFrame:
+    """Tune count for every M: value."""
+    return single_counts(conn, "m")
+
+
+def rhythm_counts(conn, limit=None) -> pd.DataFrame:
+    """Tune count per normalized rhythm."""
+    return single_counts(conn, "rhythm", limit)
+
+
+def rhythm_key_crosstab(conn, top_rhythms=10, top_keys_count=10) -> pd.DataFrame:
+    """
+    Rhythm x key table of tune counts for the most common rhythms and keys.
+    Only the grouped counts leave the database; pandas just pivots them.
+    """
+    rhythms = rhythm_counts(conn, top_rhythms)["rhythm"].tolist()
+    keys = top_keys(conn, top_keys_count)["k"].tolist()
+    if not rhythms or not keys:
+        return pd.DataFrame()
+    if has_summary(conn):
+        table = summary_crosstab(conn, "rhythm|k")
+        return table.reindex(index=rhythms, columns=keys).fillna(0).astype(int)
+    rhythm_marks = ", ".join(["%s"] * len(rhythms))
+    key_marks = ", ".join(["%s"] * len(keys))
+    counts = query_frame(
+        conn,
+        f"SELECT rhythm, k, COUNT(*) FROM tunes WHERE rhythm IN ({rhythm_marks}) AND k IN ({key_marks}) "
+        "GROUP BY rhythm, k;",
+        tuple(rhythms + keys),
+        columns=["rhythm", "k", "tunes"],
+    )
+    table = counts.pivot(index="rhythm", columns="k", values="tunes").reindex(index=rhythms, columns=keys)
+    return table.fillna(0).astype(int)
+
+
+def book_meter_distribution(conn) -> pd.DataFrame:
+    """Share of each meter within each book (rows sum to 1)."""
+    if has_summary(conn):
+        table = summary_crosstab(conn, "book|m")
+        if table.empty:
+            return table
+        return table.div(table.sum(axis=1), axis=0).round(3)
+    counts = query_frame(
+        conn,
+        "SELECT book, m, COUNT(*) FROM tunes GROUP BY book, m;",
+        columns=["book", "m", "tunes"],
+    )
+    if counts.empty:
+        return pd.DataFrame()
+    table = counts.pivot(index="book", columns="m", values="tunes").fillna(0)
+    return table.div(table.sum(axis=1), axis=0).round(3)
+
+
+def show_basic_stats_sql(conn):
+    """Print the same summary as data_analysis.display_basic_stats, computed in SQL."""
+    total = total_tunes(conn)
+    if total == 0:
+        print("No tunes found in the database. Rebuild it first.")
+        return
+    print("\n========== DATA ANALYSIS (SQL) ==========")
+    print(f"Total number of tunes: {total}")
+    print(f"Distinct tunes (copies counted once): {distinct_tunes(conn)}\n")
+
+    print("Tunes per book:")
+    print(tunes_per_book(conn).to_string(index=False))
+    print()
+
+    print("Top 10 keys by tune count:")
+    print(top_keys(conn, 10).to_string(index=False))
+    print()
+
+    print("Meters used:")
+    print(meter_counts(conn).to_string(index=False))
+    print("=========================================\n")
+
+
+def show_crosstabs(conn):
+    """Print the rhythm x key table and the meter mix of each book."""
+    table = rhythm_key_crosstab(conn)
+    if table.empty:
+        print("No tunes found in the database. Rebuild it first.")
+        return
+    print("\nTunes by rhythm (rows) and key (columns):\n")
+    print(table.to_string())
+    print("\nMeter share per book:\n")
+    print(book_meter_distribution(conn).to_string())
+    print()
@@ -0,0 +1,67 @@
+import tkinter as tk
+from tkinter import filedialog
+
+import perf
+
+
+class PerformanceWindow:
+    """
+    A window with the perf report: call counts, timings and histograms
+    for the parser, SQL and GUI actions, plus the slow query log. It can
+    switch instrumentation on and off, reset it and export the report.
+    """
+
+    def __init__(self, root, refresh_ms: int = 2000):
+        self.refresh_ms = refresh_ms
+        self.window = tk.Toplevel(root)
+        self.window.title("Performance")
+        self.window.geometry("760x480")
+
+        controls = tk.Frame(self.window)
+        controls.pack(fill="x", padx=6, pady=(6, 0))
+        self.enabled = tk.BooleanVar(value=perf.ENABLED)
+        tk.Checkbutton(controls, text="Record timings", variable=self.enabled,
+                       command=self._toggle).pack(side="left")
+        tk.Button(controls, text="Export...", command=self._export).pack(side="right")
+        tk.Button(controls, text="Reset", command=self._reset).pack(side="right", padx=4)
+        tk.Button(controls, text="Refresh", command=self.refresh).pack(side="right")
+
+        frame = tk.Frame(self.window)
+        frame.pack(fill="both", expand=True, padx=6, pady=6)
+        self.text = tk.Text(frame, wrap="none", font=("Consolas", 10), state="disabled", bg="#fdfdfd")
+        scroll = tk.Scrollbar(frame, command=self.text.yview)
+        self.text.configure(yscrollcommand=scroll.set)
+        self.text.pack(side="left", fill="both", expand=True)
+        scroll.pack(side="right", fill="y")
+
+        self.refresh()
+        self.window.after(self.refresh_ms, self._auto_refresh)
+
+    def refresh(self):
+        position = self.text.yview()[0]
+        self.text.configure(state="normal")
+        self.text.delete("1.0", tk.END)
+        self.text.insert(tk.END, perf.format_report())
+        self.text.configure(state="disabled")
+        self.text.yview_moveto(position)
+
+    def _auto_refresh(self):
+        if self.window.winfo_exists():
+            self.refresh()
+            self.window.after(self.refresh_ms, self._auto_refresh)
+
+    def _toggle(self):
+        perf.enable(self.enabled.get())
+        self.refresh()
+
+    def _reset(self):
+        perf.reset()
+        self.refresh()
+
+    def _export(self):
+        path = filedialog.asksaveasfilename(
+            parent=self.window, title="Export performance report", defaultextension=".json",
+            filetypes=[("JSON", "*.json"), ("Text", "*.txt")],
+        )
+        if path:
+            perf.export_report(path)
@@ -0,0 +1,103 @@
+import tkinter as tk
+from tkinter import ttk
+
+import perf
+
+
+class ResultsWindow:
+    """
+    A window that shows search results in a ttk.Treeview and fetches
+    them one page at a time as the user scrolls, so only the rows the
+    user actually scrolls through are ever loaded or drawn.
+    """
+
+    COLUMNS = (
+        ("id", "ID", 60),
+        ("t", "Title", 340),
+        ("k", "Key", 80),
+        ("m", "Meter", 70),
+        ("book", "Book", 60),
+    )
+
+    def __init__(self, root, title, load_page, tasks, page_size, on_activate=None, on_error=None):
+        """
+        load_page(after) runs on a background thread and returns a list
+        of db_query.TuneRow that come after the (t, id) key `after`.
+        on_activate(tune_id) runs when a row is double-clicked.
+        """
+        self.load_page = load_page
+        self.tasks = tasks
+        self.page_size = page_size
+        self.on_activate = on_activate
+        self.on_error = on_error
+        self.last_key = None
+        self.loading = False
+        self.exhausted = False
+        self.count = 0
+
+        self.window = tk.Toplevel(root)
+        self.window.title(title)
+        self.window.geometry("680x420")
+
+        frame = tk.Frame(self.window)
+        frame.pack(fill="both", expand=True, padx=6, pady=6)
+
+        self.tree = ttk.Treeview(frame, columns=[name for name, _h, _w in self.COLUMNS],
+                                 show="headings", selectmode="browse")
+        for name, heading, width in self.COLUMNS:
+            self.tree.heading(name, text=heading)
+            self.tree.column(name, width=width, stretch=(name == "t"))
+        self.scroll = tk.Scrollbar(frame, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scroll.pack(side="right", fill="y")
+        self.tree.bind("<Double-1>", self._on_double_click)
+
+        self.footer = tk.StringVar(value="Loading...")
+        tk.Label(self.window, textvariable=self.footer, anchor="w").pack(fill="x", padx=6, pady=(0, 6))
+
+        self._load_next()
+
+    def _on_scroll(self, first, last):
+        self.scroll.set(first, last)
+        if float(last) > 0.9:
+            self._load_next()
+
+    def _load_next(self):
+        if self.loading or self.exhausted:
+            return
+        self.loading = True
+        self.tasks.submit("Load results", self.load_page, self.last_key,
+                          on_done=self._add_page, on_error=self._failed)
+
+    @perf.timed("gui.render_results")
+    def _add_page(self, rows, _text):
+        self.loading = False
+        if not self.window.winfo_exists():
+            return
+        rows = rows or []
+        for row in rows:
+            self.tree.insert("", "end", iid=str(row.id), values=tuple(row))
+        self.count += len(rows)
+        if rows:
+            self.last_key = (rows[-1].t, rows[-1].id)
+        if len(rows) < self.page_size:
+            self.exhausted = True
+            self.footer.set(f"{self.count} tune(s) found.")
+        else:
+            self.footer.set(f"Showing {self.count} tunes - scroll down for more.")
+            # keep filling until the view can scroll
+            if self.tree.yview()[1] >= 1.0:
+                self._load_next()
+
+    def _failed(self, exc):
+        self.loading = False
+        if self.window.winfo_exists():
+            self.footer.set(f"Error: {exc}")
+        if self.on_error is not None:
+            self.on_error(exc)
+
+    def _on_double_click(self, _event):
+        selected = self.tree.selection()
+        if selected and self.on_activate is not None:
+            self.on_activate(int(selected[0]))
@@ -0,0 +1,159 @@
+import io
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class ThreadRoutedStdout(io.TextIOBase):
+    """
+    Stand-in for sys.stdout that sends print() output from a worker
+    thread to that thread's own buffer. Threads without a buffer write
+    to the real stdout, so several background tasks can capture their
+    output at the same time without mixing it up.
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self._local = threading.local()
+
+    def write(self, text):
+        target = getattr(self._local, "buffer", None) or self.fallback
+        return target.write(text)
+
+    def flush(self):
+        target = getattr(self._local, "buffer", None) or self.fallback
+        target.flush()
+
+    @contextmanager
+    def capture(self, buffer):
+        self._local.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self._local.buffer = None
+
+
+def install_routed_stdout() -> ThreadRoutedStdout:
+    """Replace sys.stdout with a ThreadRoutedStdout (once) and return it."""
+    if not isinstance(sys.stdout, ThreadRoutedStdout):
+        sys.stdout = ThreadRoutedStdout(sys.stdout)
+    return sys.stdout
+
+
+class Task:
+    """One background job: its name, cancel flag and latest progress."""
+
+    def __init__(self, name, cancellable, writes=False):
+        self.name = name
+        self.cancellable = cancellable
+        self.writes = writes
+        self.cancel_event = threading.Event()
+        self.progress_text = ""
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+class TaskRunner:
+    """
+    Runs GUI actions on a thread pool and hands their results back to the
+    Tk main thread. Workers never touch Tk: they put events on a queue
+    that the main thread drains every poll_ms via root.after. Tasks that
+    write to the database run on a single extra thread, one at a time,
+    so a rebuild and a sync never load the same tables at once.
+    """
+
+    def __init__(self, root, on_status, workers: int = 4, poll_ms: int = 100):
+        self.root = root
+        self.on_status = on_status
+        self.poll_ms = poll_ms
+        self.stdout = install_routed_stdout()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gui-task")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gui-write")
+        self._events = queue.Queue()
+        self.running = []
+        self.root.after(self.poll_ms, self._poll)
+
+    def submit(self, name, action, *args, on_done=None, on_error=None,
+               cancellable=False, with_progress=False, writes=False, **kwargs):
+        """
+        Run action(*args, **kwargs) in the background.
+        on_done(result, printed_text) and on_error(exc) run on the Tk
+        thread. with_progress=True also passes progress= and cancel=
+        keyword arguments (the signature rebuild_database uses).
+        writes=True queues the task behind any other writing task.
+        """
+        task = Task(name, cancellable, writes)
+        if writes and any(other.writes for other in self.running):
+            task.progress_text = "waiting"
+        if with_progress:
+            kwargs["progress"] = lambda stage, done, total=None: self._events.put(
+                ("progress", task, (stage, done, total)))
+            kwargs["cancel"] = task.cancel_event
+        self.running.append(task)
+        self._update_status()
+        executor = self._writer if writes else self._executor
+        executor.submit(self._run, task, action, args, kwargs, on_done, on_error)
+        return task
+
+    def _run(self, task, action, args, kwargs, on_done, on_error):
+        self._events.put(("start", task, None))
+        buffer = io.StringIO()
+        try:
+            with self.stdout.capture(buffer):
+                result = action(*args, **kwargs)
+        except Exception as exc:
+            self._events.put(("error", task, (exc, buffer.getvalue(), on_error)))
+        else:
+            self._events.put(("done", task, (result, buffer.getvalue(), on_done)))
+
+    def _poll(self):
+        try:
+            while True:
+                kind, task, payload = self._events.get_nowait()
+                if kind == "start":
+                    task.progress_text = ""
+                elif kind == "progress":
+                    stage, done, total = payload
+                    task.progress_text = f"{stage} {done}/{total}" if total else f"{stage} {done}"
+                elif kind == "done":
+                    self._finish(task)
+                    result, text, on_done = payload
+                    if on_done is not None:
+                        on_done(result, text)
+                elif kind == "error":
+                    self._finish(task)
+                    exc, _text, on_error = payload
+                    if on_error is not None:
+                        on_error(exc)
+                self._update_status()
+        except queue.Empty:
+            pass
+        self.root.after(self.poll_ms, self._poll)
+
+    def _finish(self, task):
+        if task in self.running:
+            self.running.remove(task)
+
+    def _update_status(self):
+        if not self.running:
+            self.on_status("Idle", False)
+            return
+        parts = []
+        for task in self.running:
+            parts.append(f"{task.name} ({task.progress_text})" if task.progress_text else task.name)
+        cancellable = any(task.cancellable for task in self.running)
+        self.on_status("Running: " + ", ".join(parts), cancellable)
+
+    def cancel_all(self):
+        """Ask every cancellable task to stop."""
+        for task in self.running:
+            if task.cancellable:
+                task.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._writer.shutdown(wait=False, cancel_futures=True)
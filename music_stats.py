@@ -0,0 +1,184 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import configurations
+import perf
+from abc_notes import EVENT_DTYPE, TICKS_PER_WHOLE
+from data_analysis import cache_key
+from db_connection import fetch_all
+
+# Corpus-wide musical statistics over the note events in tune_notes
+# (computed by the parser workers, see abc_notes.add_melodies).
+# All events are read once into one numpy array, tune after tune, and
+# every statistic is a handful of whole-array operations: bincount for
+# the histograms, reduceat for per-tune ranges and bar counts, diff for
+# intervals. Tunes are grouped by book, key (tonic + mode) or rhythm.
+
+PITCH_CLASSES = ["C", "C#", "D", "Eb", "E", "F", "F#", "G", "Ab", "A", "Bb", "B"]
+MAX_INTERVAL = 12  # larger leaps are counted as +-12
+
+# by -> tunes columns that make up the group label
+GROUPINGS = {
+    "all": (),
+    "book": ("book",),
+    "key": ("tonic", "mode"),
+    "rhythm": ("rhythm",),
+}
+
+# every note of the corpus: tune ids, each tune's first event and note
+# count, and the events themselves (pitch, duration, bar)
+NoteCorpus = namedtuple("NoteCorpus", ["ids", "starts", "counts", "events"])
+
+# a group code per tune of the corpus and the label of each code
+Grouping = namedtuple("Grouping", ["corpus", "codes", "labels"])
+
+_corpus_cache = {}
+_corpus_lock = threading.Lock()
+
+
+@perf.timed("music.load_corpus")
+def load_note_corpus(conn) -> NoteCorpus:
+    """Every tune's note events, cached in memory per database and data version."""
+    key = cache_key(conn)
+    with _corpus_lock:
+        corpus = _corpus_cache.get(key)
+    if corpus is not None:
+        return corpus
+
+    rows = fetch_all(conn, "SELECT id, events FROM tune_notes ORDER BY id;", use_cache=False)
+    blobs = [bytes(blob) for _id, blob in rows]
+    counts = np.fromiter((len(blob) for blob in blobs), dtype=np.int64, count=len(blobs)) // EVENT_DTYPE.itemsize
+    starts = np.zeros(len(counts), dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    corpus = NoteCorpus(
+        ids=np.fromiter((tune_id for tune_id, _blob in rows), dtype=np.int64, count=len(rows)),
+        starts=starts,
+        counts=counts,
+        events=np.frombuffer(b"".join(blobs), dtype=EVENT_DTYPE),
+    )
+    with _corpus_lock:
+        for old in [old for old in _corpus_cache if old[0] == key[0]]:
+            del _corpus_cache[old]
+        _corpus_cache[key] = corpus
+    return corpus
+
+
+def clear_corpus_cache(reason: str = ""):
+    """Forget cached note events (called on rebuild and backend switch)."""
+    with _corpus_lock:
+        _corpus_cache.clear()
+
+
+configurations.add_database_listener(clear_corpus_cache)
+
+
+def group_tunes(conn, by: str = "all") -> Grouping:
+    """The note corpus with every tune assigned to its book, key or rhythm."""
+    if by not in GROUPINGS:
+        raise ValueError(f"Unknown grouping '{by}'. Choose from: {', '.join(GROUPINGS)}.")
+    corpus = load_note_corpus(conn)
+    columns = GROUPINGS[by]
+    if not columns:
+        return Grouping(corpus, np.zeros(len(corpus.ids), dtype=np.int64), ["all"])
+
+    rows = fetch_all(conn, f"SELECT id, {', '.join(columns)} FROM tunes;", use_cache=False)
+    label_of = {row[0]: " ".join(str(value) for value in row[1:] if value) or "(none)" for row in rows}
+    codes, labels = pd.factorize(pd.Series([label_of.get(tune_id, "(none)") for tune_id in corpus.ids.tolist()]),
+                                 sort=True)
+    return Grouping(corpus, codes.astype(np.int64), list(labels))
+
+
+def pitch_class_histograms(grouping: Grouping) -> pd.DataFrame:
+    """Share of notes on each pitch class, one row per group."""
+    corpus, codes, labels = grouping
+    event_codes = np.repeat(codes, corpus.counts)
+    cells = event_codes * 12 + corpus.events["pitch"] % 12
+    counts = np.bincount(cells, minlength=len(labels) * 12).reshape(len(labels), 12)
+    return pd.DataFrame(shares(counts), index=labels, columns=PITCH_CLASSES)
+
+
+def interval_distributions(grouping: Grouping) -> pd.DataFrame:
+    """Share of each melodic step (-12..+12 semitones) between consecutive notes of a tune."""
+    corpus, codes, labels = grouping
+    steps = np.diff(corpus.events["pitch"].astype(np.int16))
+    within_tune = np.ones(len(steps), dtype=bool)
+    within_tune[corpus.starts[1:] - 1] = False  # the step from one tune's last note to the next tune
+    step_codes = np.repeat(codes, corpus.counts)[1:][within_tune]
+    steps = np.clip(steps[within_tune], -MAX_INTERVAL, MAX_INTERVAL) + MAX_INTERVAL
+    width = 2 * MAX_INTERVAL + 1
+    counts = np.bincount(step_codes * width + steps, minlength=len(labels) * width).reshape(len(labels), width)
+    return pd.DataFrame(shares(counts), index=labels, columns=range(-MAX_INTERVAL, MAX_INTERVAL + 1))
+
+
+def tune_profiles(grouping: Grouping) -> pd.DataFrame:
+    """
+    Per group: tunes, notes, lowest and highest pitch, the mean range of
+    a tune in semitones, mean notes per bar and mean note length in
+    quarter notes. The corpus must not be empty.
+    """
+    corpus, codes, labels = grouping
+    events, starts = corpus.events, corpus.starts
+    low = np.minimum.reduceat(events["pitch"], starts)
+    high = np.maximum.reduceat(events["pitch"], starts)
+    bars = np.maximum.reduceat(events["bar"], starts) - np.minimum.reduceat(events["bar"], starts) + 1
+    ticks = np.add.reduceat(events["duration"].astype(np.int64), starts)
+    per_tune = pd.DataFrame({
+        "group": codes,
+        "notes": corpus.counts,
+        "lowest": low,
+        "highest": high,
+        "range": high.astype(np.int16) - low,
+        "notes_per_bar": corpus.counts / bars,
+        "quarters": ticks / (TICKS_PER_WHOLE / 4),
+    })
+    grouped = per_tune.groupby("group")
+    profiles = pd.DataFrame({
+        "tunes": grouped.size(),
+        "notes": grouped["notes"].sum(),
+        "lowest": grouped["lowest"].min(),
+        "highest": grouped["highest"].max(),
+        "mean_range": grouped["range"].mean(),
+        "notes_per_bar": grouped["notes_per_bar"].mean(),
+        "note_length": grouped["quarters"].sum() / grouped["notes"].sum(),
+    })
+    profiles.index = [labels[code] for code in profiles.index]
+    return profiles
+
+
+def shares(counts: np.ndarray) -> np.ndarray:
+    """Each row of counts divided by its total (rows without counts stay 0)."""
+    totals = counts.sum(axis=1, keepdims=True)
+    return np.divide(counts, totals, out=np.zeros(counts.shape), where=totals > 0)
+
+
+def pitch_name(pitch: int) -> str:
+    """MIDI pitch number as a note name with octave, e.g. 62 -> D4."""
+    return f"{PITCH_CLASSES[pitch % 12]}{pitch // 12 - 1}"
+
+
+@perf.timed("music.stats")
+def show_music_stats(conn, by: str = "book", top: int = 5):
+    """Print pitch, range, density and interval statistics for each book, key or rhythm."""
+    grouping = group_tunes(conn, by)
+    if not len(grouping.corpus.ids):
+        print("No note events in the database. Rebuild it first.")
+        return
+    profiles = tune_profiles(grouping)
+    pitch_classes = pitch_class_histograms(grouping)
+    intervals = interval_distributions(grouping)
+
+    print(f"\n========== MUSICAL STATISTICS (by {by}) ==========")
+    print(f"{len(grouping.corpus.ids)} tunes, {len(grouping.corpus.events)} notes\n")
+    for label, profile in profiles.sort_values("tunes", ascending=False).iterrows():
+        print(f"{label}: {profile['tunes']:.0f} tunes, {profile['notes']:.0f} notes, "
+              f"range {pitch_name(int(profile['lowest']))}-{pitch_name(int(profile['highest']))} "
+              f"(mean {profile['mean_range']:.1f} semitones per tune), "
+              f"{profile['notes_per_bar']:.1f} notes per bar, mean note {profile['note_length']:.2f} quarters")
+        common = pitch_classes.loc[label].nlargest(top)
+        print("    pitch classes: " + ", ".join(f"{name} {share:.0%}" for name, share in common.items()))
+        common = intervals.loc[label].nlargest(top)
+        print("    intervals:     " + ", ".join(f"{step:+d} {share:.0%}" for step, share in common.items()))
+    print("==================================================\n")
@@ -0,0 +1,195 @@
+import functools
+import json
+import threading
+import time
+from collections import deque
+
+import configurations
+
+# Lightweight timing for the parser, the database layer and the GUI.
+# Instrumented functions are wrapped with timed(); while instrumentation
+# is off the wrapper only checks ENABLED and calls straight through.
+# Each name gets a call count, total/min/max time and a histogram, and
+# SQL statements slower than SLOW_QUERY_SECONDS are kept in a short log.
+# Timings made inside parser worker processes stay in those processes,
+# so with several ingest workers only the batch totals are seen here.
+
+ENABLED = configurations.PERF_ENABLED
+
+# histogram bucket upper bounds in milliseconds; the last bucket is open
+HISTOGRAM_BOUNDS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class Timing:
+    """Call count, time totals and a latency histogram for one name."""
+
+    __slots__ = ("calls", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+
+    def add(self, seconds: float):
+        self.calls += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        ms = seconds * 1000
+        for index, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if ms < bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.calls * 1000 if self.calls else 0.0,
+            "min_ms": (self.min or 0.0) * 1000,
+            "max_ms": self.max * 1000,
+            "histogram": {label: count for label, count in zip(bucket_labels(), self.buckets)},
+        }
+
+
+_timings = {}
+_counters = {}
+_slow_queries = deque(maxlen=configurations.SLOW_QUERY_LOG_SIZE)
+_lock = threading.Lock()
+
+
+def bucket_labels():
+    return [f"<{bound:g}ms" for bound in HISTOGRAM_BOUNDS_MS] + [f">={HISTOGRAM_BOUNDS_MS[-1]:g}ms"]
+
+
+def enable(flag: bool = True):
+    """Switch instrumentation on or off; what was recorded so far is kept."""
+    global ENABLED
+    ENABLED = bool(flag)
+
+
+def record(name: str, seconds: float):
+    """Add one timing for name (ignored while instrumentation is off)."""
+    if not ENABLED:
+        return
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = Timing()
+        timing.add(seconds)
+
+
+def count(name: str, amount: int = 1):
+    """Add amount to the counter name (ignored while instrumentation is off)."""
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def timed(name: str):
+    """Decorator that records every call of the function under name."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def start():
+    """perf_counter() to pass to record_query later, or None while instrumentation is off."""
+    return time.perf_counter() if ENABLED else None
+
+
+def record_query(started, sql: str, params, rows: int):
+    """Record one executed statement and log it if it was slow."""
+    if started is None or not ENABLED:
+        return
+    seconds = time.perf_counter() - started
+    record("sql.execute", seconds)
+    count("sql.rows", rows)
+    if seconds >= configurations.SLOW_QUERY_SECONDS:
+        with _lock:
+            _slow_queries.append({
+                "at": time.strftime("%H:%M:%S"),
+                "ms": seconds * 1000,
+                "rows": rows,
+                "sql": " ".join(sql.split()),
+                "params": [repr(value)[:80] for value in params],
+            })
+
+
+def reset():
+    """Forget every timing, counter and slow query."""
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+        _slow_queries.clear()
+
+
+def perf_report() -> dict:
+    """Snapshot of everything recorded, as plain data (see export_report)."""
+    with _lock:
+        return {
+            "enabled": ENABLED,
+            "slow_query_ms": configurations.SLOW_QUERY_SECONDS * 1000,
+            "timings": {name: timing.as_dict() for name, timing in sorted(_timings.items())},
+            "counters": dict(sorted(_counters.items())),
+            "slow_queries": list(_slow_queries),
+        }
+
+
+def format_report(report=None) -> str:
+    """The report as text for the GUI panel and .txt exports."""
+    report = report or perf_report()
+    lines = [f"Instrumentation is {'on' if report['enabled'] else 'off'}."]
+    if not report["timings"] and not report["counters"]:
+        lines.append("Nothing recorded yet.")
+        return "\n".join(lines)
+
+    lines.append("")
+    lines.append(f"{'name':32} {'calls':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9}")
+    for name, timing in report["timings"].items():
+        lines.append(f"{name:32} {timing['calls']:7d} {timing['total_ms']:10.1f} "
+                     f"{timing['mean_ms']:9.2f} {timing['max_ms']:9.2f}")
+        histogram = "  ".join(f"{label}: {n}" for label, n in timing["histogram"].items() if n)
+        lines.append(f"    {histogram}")
+
+    if report["counters"]:
+        lines.append("")
+        for name, value in report["counters"].items():
+            lines.append(f"{name:32} {value:>10}")
+
+    lines.append("")
+    lines.append(f"Slow queries (>= {report['slow_query_ms']:g} ms): {len(report['slow_queries'])}")
+    for entry in report["slow_queries"]:
+        lines.append(f"{entry['at']} {entry['ms']:8.1f} ms {entry['rows']:6d} rows  {entry['sql']}")
+        if entry["params"]:
+            lines.append(f"    params: {', '.join(entry['params'])}")
+    return "\n".join(lines)
+
+
+def export_report(path: str):
+    """Write the report to path: JSON for .json files, text otherwise."""
+    report = perf_report()
+    with open(path, "w", encoding="utf-8") as f:
+        if path.lower().endswith(".json"):
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        else:
+            f.write(format_report(report) + "\n")
+    print(f"Performance report written to {path}")
+
+
+def show_performance():
+    print(format_report())
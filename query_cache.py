@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+
+import configurations
+import db_generations
+
+# Results of repeated SELECTs kept in memory. Entries are keyed on the
+# backend, the number of times the cache was cleared, the SQL text (only
+# trimmed: whitespace inside string literals is significant) and the
+# parameters, evicted least recently used first once QUERY_CACHE_SIZE is
+# reached, and expire after QUERY_CACHE_TTL seconds. Everything is dropped on a rebuild, sync or
+# backend switch through the configurations listener hook; a result read
+# before such a clear and stored after it is discarded, because its key
+# carries the old clear count.
+#
+# For SQLite the key also holds db_generations.live_stamp(), so a rebuild
+# or sync committed by another process (which fires no listener here)
+# changes the key and old entries are no longer found. MySQL has no file
+# to watch: changes made by another process are only seen once the
+# entries expire after QUERY_CACHE_TTL.
+
+
+# larger results (full-table reads) are not worth holding on to
+MAX_CACHED_ROWS = 5000
+
+# returned by lookups that found nothing, since None is a valid fetch_one result
+MISSING = object()
+
+
+class QueryCache:
+    """A thread-safe LRU cache of query results with a time-to-live."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.clears = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or MISSING if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl <= 0 or time.monotonic() - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return MISSING
+
+    def put(self, key, value, clears=None):
+        """Store value, unless the cache was cleared since clears was read."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if clears is not None and clears != self.clears:
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.clears += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_cache = QueryCache(configurations.QUERY_CACHE_SIZE, configurations.QUERY_CACHE_TTL)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    The SQL text a cache entry is keyed on: the statement with only its
+    leading and trailing whitespace removed, since collapsing inner
+    whitespace would also change string literals ('%a  b%' vs '%a b%').
+    """
+    return sql.strip()
+
+
+def is_cacheable(sql: str) -> bool:
+    """Only plain SELECT statements are cached."""
+    return sql.lstrip()[:6].upper() == "SELECT"
+
+
+def cache_key(backend: str, sql: str, params=()):
+    """Build the key before running the query, so that put() can tell a clear in between."""
+    if backend == "sqlite":
+        target = db_generations.live_stamp()
+    else:
+        target = (configurations.MYSQL_CONFIG.get("host"), configurations.MYSQL_CONFIG.get("database"))
+    return backend, target, _cache.clears, normalize_sql(sql), tuple(params)
+
+
+def get(key):
+    return _cache.get(key)
+
+
+def put(key, rows):
+    if isinstance(rows, list) and len(rows) > MAX_CACHED_ROWS:
+        return
+    _cache.put(key, rows, clears=key[2])
+
+
+def cache_stats() -> dict:
+    """Current entry count and hit/miss counters."""
+    return _cache.stats()
+
+
+def clear_query_cache(reason: str = ""):
+    """Forget every cached result; the counters are kept."""
+    _cache.clear()
+
+
+def show_cache_stats():
+    stats = cache_stats()
+    lookups = stats["hits"] + stats["misses"]
+    rate = stats["hits"] / lookups * 100 if lookups else 0.0
+    print(f"Query cache: {stats['entries']}/{stats['max_entries']} entries, "
+          f"{stats['hits']} hits, {stats['misses']} misses ({rate:.1f}% hit rate)")
+
+
+configurations.add_database_listener(clear_query_cache)
@@ -0,0 +1,217 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from operator import itemgetter
+
+import configurations
+import db_connection
+import db_pool
+import db_query
+
+# Headless batch queries for scripts and other tools. Every input line is
+# "<command> <argument>" (blank lines and lines starting with # are
+# skipped); all of them run over one connection and every result row is
+# written as soon as it is read, as JSON Lines or CSV, tagged with the
+# number of the query it belongs to:
+#
+#   printf 'title reel\nfacets key=D, meter=6/8\nsimilar 42\n' | python query_cli.py --format csv
+#
+# SQL results are streamed with cursor.fetchmany (db_connection.stream_rows).
+# The book/type/search commands go through data_analysis and its cached
+# pandas frame, which is only loaded if one of them is used.
+
+CSV_COLUMNS = ["query", "command", "argument", "id", "t", "k", "m", "book",
+               "filename", "x", "r", "similarity", "body", "error"]
+TAG_COLUMNS = ("query", "command", "argument")
+
+FRAME_CHUNK = 1000
+
+
+def sql_rows(conn, query):
+    """(columns, streamed rows) of a (sql, params) query; None gives no rows."""
+    if query is None:
+        return [], ()
+    return db_connection.stream_rows(conn, *query)
+
+
+def tune_id(argument) -> int:
+    try:
+        return int(argument)
+    except ValueError:
+        raise ValueError(f"Expected a tune id, got '{argument}'") from None
+
+
+def details_rows(conn, argument, _limit):
+    columns, rows = sql_rows(conn, db_query.details_query(tune_id(argument)))
+    rows = list(rows)
+    return columns + ["body"], [row + (db_connection.fetch_tune_body(conn, row[0]),) for row in rows]
+
+
+def similar_rows(conn, argument, limit):
+    rows = db_query.find_similar(conn, tune_id(argument), limit)
+    if rows is None:
+        raise ValueError("No melodic index in this database; rebuild it first.")
+    return list(db_query.SimilarTune._fields), rows
+
+
+def frame_rows(conn, function_name, argument):
+    """(columns, rows) of a data_analysis filter over the stats frame."""
+    import data_analysis  # pandas is only loaded for these commands
+
+    df = getattr(data_analysis, function_name)(data_analysis.load_stats_dataframe(conn), argument)
+
+    def rows():
+        for start in range(0, len(df), FRAME_CHUNK):
+            # to_dict turns numpy scalars into plain Python values
+            yield from df.iloc[start:start + FRAME_CHUNK].to_dict("split", index=False)["data"]
+
+    return list(df.columns), rows()
+
+
+# command -> rows(conn, argument, limit) returning (columns, rows)
+COMMANDS = {
+    "list": lambda conn, arg, limit: sql_rows(conn, db_query.list_query(int(arg or 20))),
+    "title": lambda conn, arg, limit: sql_rows(conn, db_query.title_query(arg)),
+    "key": lambda conn, arg, limit: sql_rows(conn, db_query.key_query(arg)),
+    "meter": lambda conn, arg, limit: sql_rows(conn, db_query.meter_query(arg)),
+    "facets": lambda conn, arg, limit: sql_rows(conn, db_query.facets_query(**db_query.parse_facet_query(arg))),
+    "fulltext": lambda conn, arg, limit: sql_rows(conn, db_query.fulltext_query(conn, "t", arg, limit)),
+    "body": lambda conn, arg, limit: sql_rows(conn, db_query.fulltext_query(conn, "body", arg, limit)),
+    "details": details_rows,
+    "occurrences": lambda conn, arg, limit: sql_rows(conn, db_query.occurrences_query(tune_id(arg))),
+    "similar": similar_rows,
+    "book": lambda conn, arg, limit: frame_rows(conn, "get_tunes_by_book", arg),
+    "type": lambda conn, arg, limit: frame_rows(conn, "get_tunes_by_type", arg),
+    "search": lambda conn, arg, limit: frame_rows(conn, "search_tunes", arg),
+}
+
+
+def read_queries(paths):
+    """Yield (command, argument) from the given files ('-' is stdin)."""
+    for path in paths:
+        stream = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+        try:
+            for line in stream:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                command, _sep, argument = line.partition(" ")
+                yield command.lower(), argument.strip()
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+class JsonLinesWriter:
+    """One JSON object per row: the query tag followed by the row's columns."""
+
+    def __init__(self, out):
+        self.out = out
+        self.encode = json.JSONEncoder(ensure_ascii=False, default=str).encode
+
+    def write_rows(self, tag, columns, rows) -> int:
+        # the tag is encoded once per query and spliced in front of each row object
+        prefix = self.encode(dict(zip(TAG_COLUMNS, tag)))[:-1] + ", "
+        count = 0
+        for row in rows:
+            self.out.write(prefix + self.encode(dict(zip(columns, row)))[1:] + "\n")
+            count += 1
+        return count
+
+    def write_error(self, tag, message):
+        self.out.write(self.encode({**dict(zip(TAG_COLUMNS, tag)), "error": message}) + "\n")
+
+
+class CsvWriter:
+    """CSV with the fixed CSV_COLUMNS; columns a query does not have stay empty."""
+
+    def __init__(self, out):
+        self.writer = csv.writer(out, lineterminator="\n")
+        self.writer.writerow(CSV_COLUMNS)
+
+    def write_rows(self, tag, columns, rows) -> int:
+        # each output cell is picked from tag + row + ("",) by one itemgetter
+        width = len(tag) + len(columns)
+        positions = {name: len(tag) + index for index, name in enumerate(columns)}
+        positions.update({name: index for index, name in enumerate(TAG_COLUMNS)})
+        pick = itemgetter(*[positions.get(name, width) for name in CSV_COLUMNS])
+        count = 0
+        for row in rows:
+            self.writer.writerow(pick(tag + tuple(row) + ("",)))
+            count += 1
+        return count
+
+    def write_error(self, tag, message):
+        self.writer.writerow(list(tag) + [""] * (len(CSV_COLUMNS) - len(tag) - 1) + [message])
+
+
+WRITERS = {"jsonl": JsonLinesWriter, "csv": CsvWriter}
+
+
+def run_queries(conn, queries, writer, limit=50):
+    """Run every (command, argument) on conn and write its rows. Returns (queries, rows)."""
+    query_count = row_count = 0
+    for number, (command, argument) in enumerate(queries, 1):
+        query_count += 1
+        tag = (number, command, argument)
+        handler = COMMANDS.get(command)
+        rows = None
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown command '{command}'. Choose from: {', '.join(COMMANDS)}.")
+            columns, rows = handler(conn, argument, limit)
+            row_count += writer.write_rows(tag, columns, rows)
+        except (ValueError, *db_pool.database_errors()) as err:
+            writer.write_error(tag, str(err))
+        finally:
+            # close a half-read stream (e.g. on a broken pipe) while conn is still open
+            close = getattr(rows, "close", None)
+            if close is not None:
+                close()
+    return query_count, row_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run tune queries in batch and stream the results.")
+    parser.add_argument("inputs", nargs="*", default=["-"], help="query files, one query per line (default: stdin)")
+    parser.add_argument("--backend", choices=sorted(configurations.SUPPORTED_DATABASES),
+                        default=configurations.ACTIVE_DATABASE, help="database to query (default: active backend)")
+    parser.add_argument("--format", choices=("jsonl", "csv"), default="jsonl", help="output format (default jsonl)")
+    parser.add_argument("--output", help="write results here instead of stdout")
+    parser.add_argument("--limit", type=int, default=50, help="rows for fulltext/body/similar queries (default 50)")
+    parser.add_argument("--fetch-size", type=int, default=configurations.STREAM_FETCH_SIZE,
+                        help="rows per fetchmany() call")
+    args = parser.parse_args()
+
+    configurations.STREAM_FETCH_SIZE = max(1, args.fetch_size)
+    if args.backend == "mysql":
+        conn = db_connection.get_mysql_connection()
+    else:
+        conn = db_connection.get_sqlite_connection()
+    if conn is None:
+        sys.exit(1)
+
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    started = time.perf_counter()
+    try:
+        queries, rows = run_queries(conn, read_queries(args.inputs), WRITERS[args.format](out), args.limit)
+    except BrokenPipeError:
+        # the reader (e.g. head) stopped early; that is not an error
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(0)
+    finally:
+        conn.close()
+        if out is not sys.stdout:
+            out.close()
+        else:
+            out.flush()
+    seconds = time.perf_counter() - started
+    print(f"{queries} queries, {rows} rows in {seconds:.2f}s ({queries / seconds if seconds else 0:.0f} queries/s)",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()